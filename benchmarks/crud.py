@@ -0,0 +1,350 @@
+"""
+Микро-бенчмарки CRUD на синтетической базе
+
+Запуск:
+    python -m benchmarks.crud --scale small --output bench.json
+    python -m benchmarks.crud --scale large --compare bench.json
+
+Каждый метод BrandsSQL / ProductsSQL / SalesSQL и parse_batch_products
+прогоняется несколько раз, результат - JSON, который можно сравнивать
+между коммитами (--compare печатает разницу медиан).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from db.crud import BrandsSQL, ProductsSQL, SalesSQL
+from db.manager import AsyncDatabaseManager
+from benchmarks.seed import CATEGORIES, bulk_connection
+from src.bot.models.base import BrandModel, ProductCategory, ProductModel, ProductRow
+from src.bot.utils.parse_product import parse_batch_products, parse_batch_rows
+
+
+@dataclass
+class Scale:
+    brands_per_category: int
+    products: int
+    sales: int
+
+
+SCALES = {
+    "tiny": Scale(brands_per_category=10, products=500, sales=2_000),
+    "small": Scale(brands_per_category=50, products=5_000, sales=50_000),
+    "medium": Scale(brands_per_category=200, products=30_000, sales=500_000),
+    "large": Scale(brands_per_category=500, products=100_000, sales=2_000_000),
+}
+
+def seed_database(path: str, scale: Scale, seed: int = 42) -> None:
+    """Быстрое наполнение базы напрямую через sqlite3"""
+    rnd = random.Random(seed)
+    with bulk_connection(path) as conn:
+        brands = [
+            (f"Brand {category} {i}", category)
+            for category in CATEGORIES
+            for i in range(scale.brands_per_category)
+        ]
+        conn.executemany("INSERT INTO brands (name, category) VALUES (?, ?)", brands)
+
+        brand_count = len(brands)
+        conn.executemany(
+            "INSERT INTO products (brand_id, flavor, quantity, price) VALUES (?, ?, ?, ?)",
+            (
+                (i % brand_count + 1, f"Flavor {i}", rnd.randint(0, 200), rnd.randint(100, 3000))
+                for i in range(scale.products)
+            )
+        )
+
+        start = datetime(2025, 1, 1)
+        conn.executemany(
+            "INSERT INTO sales (product_id, admin_id, quantity, price, sale_date) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                (
+                    rnd.randint(1, scale.products),
+                    rnd.randint(1, 5),
+                    rnd.randint(1, 5),
+                    rnd.randint(100, 5000),
+                    str(start + timedelta(seconds=rnd.randint(0, 365 * 24 * 3600))),
+                )
+                for _ in range(scale.sales)
+            )
+        )
+
+
+def make_batch_text(lines: int, rnd: random.Random) -> str:
+    """Текст для /add_products: валидные строки вперемешку с мусором"""
+    rows = []
+    for i in range(lines):
+        if i % 20 == 19:
+            rows.append(f"мусор {i}")
+            continue
+        category = rnd.choice(CATEGORIES)
+        rows.append(
+            f"{category} | Brand {category} {rnd.randint(0, 50)} | "
+            f"Flavor {rnd.randint(0, 500)} | {rnd.randint(1, 100)} | {rnd.randint(100, 3000)}"
+        )
+    return "\n".join(rows)
+
+
+@dataclass
+class Result:
+    name: str
+    iterations: int
+    min_ms: float
+    median_ms: float
+    mean_ms: float
+    p95_ms: float
+    max_ms: float
+
+
+async def measure(
+    name: str,
+    func: Callable[[], Awaitable[object]] | Callable[[], object],
+    iterations: int
+) -> Result:
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = func()
+        if asyncio.iscoroutine(result):
+            await result
+        timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    return Result(
+        name=name,
+        iterations=iterations,
+        min_ms=timings[0],
+        median_ms=statistics.median(timings),
+        mean_ms=statistics.fmean(timings),
+        p95_ms=timings[min(int(len(timings) * 0.95), len(timings) - 1)],
+        max_ms=timings[-1],
+    )
+
+
+async def run_benchmarks(path: str, scale: Scale, iterations: int, heavy_iterations: int) -> list[Result]:
+    rnd = random.Random(7)
+    manager = AsyncDatabaseManager(path)
+    await manager.connect()
+    brands_db = BrandsSQL(manager)
+    products_db = ProductsSQL(manager)
+    sales_db = SalesSQL(manager)
+
+    brand_count = scale.brands_per_category * len(CATEGORIES)
+
+    def random_brand() -> tuple[int, str, str]:
+        brand_id = rnd.randint(1, brand_count)
+        category = CATEGORIES[(brand_id - 1) // scale.brands_per_category]
+        index = (brand_id - 1) % scale.brands_per_category
+        return brand_id, f"Brand {category} {index}", category
+
+    def random_product() -> tuple[int, int, str]:
+        product_id = rnd.randint(1, scale.products)
+        return product_id, (product_id - 1) % brand_count + 1, f"Flavor {product_id - 1}"
+
+    def existing_brand() -> BrandModel:
+        _, name, category = random_brand()
+        return BrandModel(name=name, category=category)
+
+    def existing_product() -> ProductModel:
+        _, brand_id, flavor = random_product()
+        return ProductModel(brand_id=brand_id, flavor=flavor, quantity=1, price=100)
+
+    new_ids = iter(range(10 ** 9))
+    batch_text = make_batch_text(1_000, rnd)
+
+    benchmarks: list[tuple[str, Callable[[], object], int]] = [
+        # ===== BRANDS =====
+        ("BrandsSQL.create_tables", brands_db.create_tables, iterations),
+        ("BrandsSQL.add_brand[existing]",
+         lambda: brands_db.add_brand(existing_brand()),
+         iterations),
+        ("BrandsSQL.add_brand[new]",
+         lambda: brands_db.add_brand(BrandModel(name=f"New {next(new_ids)}", category="снюс")),
+         iterations),
+        ("BrandsSQL.get_brand_by_name_and_category",
+         lambda: brands_db.get_brand_by_name_and_category(*random_brand()[1:]),
+         iterations),
+        ("BrandsSQL.get_brands_by_category",
+         lambda: brands_db.get_brands_by_category(rnd.choice(CATEGORIES)),
+         iterations),
+        ("BrandsSQL.get_all_brands", brands_db.get_all_brands, heavy_iterations),
+        ("BrandsSQL.get_brand_by_id",
+         lambda: brands_db.get_brand_by_id(random_brand()[0]),
+         iterations),
+
+        # ===== PRODUCTS =====
+        ("ProductsSQL.create_tables", products_db.create_tables, iterations),
+        ("ProductsSQL.add_product[existing]",
+         lambda: products_db.add_product(existing_product()),
+         iterations),
+        ("ProductsSQL.add_product[new]",
+         lambda: products_db.add_product(ProductModel(
+             brand_id=random_brand()[0], flavor=f"New {next(new_ids)}", quantity=1, price=100
+         )),
+         iterations),
+        ("ProductsSQL.import_products[100]",
+         lambda: products_db.import_products([
+             ProductRow(ProductCategory.snus, f"Import {next(new_ids) % 50}",
+                        f"Batch {next(new_ids)}", 1, 100.0)
+             for _ in range(100)
+         ]),
+         heavy_iterations),
+        ("ProductsSQL.add_products_batch[100]",
+         lambda: products_db.add_products_batch([
+             ProductModel(brand_id=random_brand()[0], flavor=f"Batch {next(new_ids)}", quantity=1, price=100)
+             for _ in range(100)
+         ]),
+         heavy_iterations),
+        ("ProductsSQL.get_product_by_brand_and_flavor",
+         lambda: products_db.get_product_by_brand_and_flavor(*random_product()[1:]),
+         iterations),
+        ("ProductsSQL.get_products_by_brand",
+         lambda: products_db.get_products_by_brand(random_brand()[0]),
+         iterations),
+        ("ProductsSQL.get_all", products_db.get_all, heavy_iterations),
+        ("ProductsSQL.get_by_category",
+         lambda: products_db.get_by_category(rnd.choice(CATEGORIES)),
+         heavy_iterations),
+        ("ProductsSQL.update_quantity",
+         lambda: products_db.update_quantity(random_product()[0], rnd.randint(0, 100)),
+         iterations),
+        ("ProductsSQL.delete_product",
+         lambda: products_db.delete_product(scale.products + 10 ** 6),
+         iterations),
+
+        # ===== SALES =====
+        ("SalesSQL.create_tables", sales_db.create_tables, iterations),
+        ("SalesSQL.add_sale",
+         lambda: sales_db.add_sale(random_product()[0], 1, 1, 100.0),
+         iterations),
+        ("SalesSQL.get_all_sales", sales_db.get_all_sales, heavy_iterations),
+        ("SalesSQL.get_sales_by_date_range[1 day]",
+         lambda: sales_db.get_sales_by_date_range(
+             datetime(2025, 6, 1), datetime(2025, 6, 2)
+         ),
+         iterations),
+        ("SalesSQL.get_sales_by_date_range[30 days]",
+         lambda: sales_db.get_sales_by_date_range(
+             datetime(2025, 6, 1), datetime(2025, 7, 1)
+         ),
+         heavy_iterations),
+
+        # ===== PARSER =====
+        ("parse_batch_products[1000 lines]",
+         lambda: parse_batch_products(batch_text),
+         iterations),
+        ("parse_batch_rows[1000 lines]",
+         lambda: parse_batch_rows(batch_text),
+         iterations),
+    ]
+
+    results = []
+    try:
+        for name, func, count in benchmarks:
+            result = await measure(name, func, count)
+            print(
+                f"{name:<48} median {result.median_ms:9.3f} ms  "
+                f"p95 {result.p95_ms:9.3f} ms  (n={count})"
+            )
+            results.append(result)
+    finally:
+        await manager.close()
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline_path: str) -> None:
+    """Печатает изменение медиан относительно сохранённого прогона"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+
+    print(f"\nCompared to {baseline_path}:")
+    for result in current["results"]:
+        old = baseline.get(result["name"])
+        if not old or not old["median_ms"]:
+            continue
+        change = (result["median_ms"] - old["median_ms"]) / old["median_ms"] * 100
+        marker = "🔴" if change > 10 else "🟢" if change < -10 else "  "
+        print(
+            f"{marker} {result['name']:<48} {old['median_ms']:9.3f} -> "
+            f"{result['median_ms']:9.3f} ms ({change:+.1f}%)"
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="CRUD micro-benchmarks")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--brands-per-category", type=int)
+    parser.add_argument("--products", type=int)
+    parser.add_argument("--sales", type=int)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--heavy-iterations", type=int, default=5)
+    parser.add_argument("--db", help="путь к базе (по умолчанию - временный файл)")
+    parser.add_argument("--output", help="куда сохранить JSON с результатами")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    scale = SCALES[args.scale]
+    scale = Scale(
+        brands_per_category=args.brands_per_category or scale.brands_per_category,
+        products=args.products or scale.products,
+        sales=args.sales if args.sales is not None else scale.sales,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "bench.db")
+
+        started = time.perf_counter()
+        seed_database(path, scale)
+        print(f"Seeded {scale} in {time.perf_counter() - started:.1f} s\n")
+
+        results = asyncio.run(
+            run_benchmarks(path, scale, args.iterations, args.heavy_iterations)
+        )
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "scale": asdict(scale),
+        },
+        "results": [asdict(r) for r in results],
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nSaved to {args.output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
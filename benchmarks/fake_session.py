@@ -0,0 +1,72 @@
+"""Локальная сессия Bot API: записывает вызовы вместо походов в сеть"""
+import asyncio
+import itertools
+from collections import Counter
+from datetime import datetime
+from typing import Any, AsyncGenerator
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetMe, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Chat, Message, User
+
+
+BOT_USER = User(id=42, is_bot=True, first_name="Load Bot", username="load_bot")
+
+
+class FakeSession(BaseSession):
+    """
+    Сессия, которая отвечает на все методы локально
+
+    Сообщения получают возрастающие message_id, остальные методы
+    возвращают True. `latency` имитирует время ответа Bot API.
+    """
+
+    def __init__(self, latency: float = 0.0, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self._message_ids = itertools.count(1_000_000)
+
+    async def close(self) -> None:
+        pass
+
+    async def make_request(
+        self,
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+        timeout: int | None = None,
+    ) -> TelegramType:
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if isinstance(method, GetMe):
+            return BOT_USER
+
+        returning = getattr(method, "__returning__", None)
+        if returning is Message:
+            message = Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(),
+                chat=Chat(id=getattr(method, "chat_id", 0), type="private"),
+                from_user=BOT_USER,
+                text=getattr(method, "text", None) or getattr(method, "caption", None),
+            )
+            return message.as_(bot)
+        return True
+
+    async def stream_content(
+        self,
+        url: str,
+        headers: dict[str, Any] | None = None,
+        timeout: int = 30,
+        chunk_size: int = 65536,
+        raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
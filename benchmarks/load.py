@@ -0,0 +1,382 @@
+"""
+Нагрузочный прогон через настоящий Dispatcher
+
+Запуск:
+    python -m benchmarks.load --users 200 --admins 10 --sessions 5
+    python -m benchmarks.load --mix browse=8,sell=3,add=1 --output load.json
+
+Собирает Dispatcher и роутеры из src/bot/main.py, подменяет сеть
+локальной FakeSession и скармливает dp.feed_update потоки Message /
+CallbackQuery от многих пользователей сразу: просмотр каталога,
+продажи и пакетное добавление товаров. В отчёте - пропускная
+способность, перцентили задержки и число вызовов API на апдейт.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterator
+
+from aiogram import Bot
+from aiogram.types import Update
+
+from benchmarks.crud import SCALES, make_batch_text, seed_database
+from benchmarks.fake_session import FakeSession
+from src.bot.utils.logger import configure_logging, shutdown_logging
+
+
+ADMIN_BASE_ID = 10_000
+CUSTOMER_BASE_ID = 1_000_000
+
+
+class UpdateFactory:
+    """Синтетические апдейты от имени пользователей"""
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+    def _chat(self, user_id: int) -> dict:
+        return {"id": user_id, "type": "private"}
+
+    def message(self, user_id: int, text: str) -> Update:
+        data = {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": self._chat(user_id),
+                "from": self._user(user_id),
+                "text": text,
+            },
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            data["message"]["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(command)}
+            ]
+        return Update.model_validate(data, context={"bot": self.bot})
+
+    def callback(self, user_id: int, data: str, message_id: int) -> Update:
+        return Update.model_validate({
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": self._chat(user_id),
+                    "from": {"id": 42, "is_bot": True, "first_name": "Load Bot"},
+                    "text": "...",
+                },
+            },
+        }, context={"bot": self.bot})
+
+
+class Catalog:
+    """Что есть в базе - чтобы генерировать осмысленные нажатия"""
+
+    def __init__(self, brands: list[dict], products: list[dict]):
+        self.categories = sorted({b["category"] for b in brands})
+        self.brands_by_category: dict[str, list[int]] = defaultdict(list)
+        for brand in brands:
+            self.brands_by_category[brand["category"]].append(brand["id"])
+        self.products = products
+
+    @classmethod
+    async def load(cls, manager) -> "Catalog":
+        brands = await manager.fetchall("SELECT id, category FROM brands")
+        products = await manager.fetchall(
+            "SELECT p.id, p.brand_id, b.category FROM products p "
+            "JOIN brands b ON p.brand_id = b.id WHERE p.quantity > 0"
+        )
+        return cls(brands, products)
+
+
+Step = tuple[str, Update]
+
+
+def browse_session(f: UpdateFactory, user_id: int, catalog: Catalog, rnd: random.Random) -> Iterator[Step]:
+    message_id = rnd.randint(1, 10 ** 6)
+    category = rnd.choice(catalog.categories)
+    brand_id = rnd.choice(catalog.brands_by_category[category])
+
+    yield "message:/catalog", f.message(user_id, "/catalog")
+    yield "callback:catalog_all", f.callback(user_id, "catalog_all", message_id)
+    for page in range(2, rnd.randint(3, 6)):
+        yield "callback:catalog_page", f.callback(user_id, f"catalog_page:{page}", message_id)
+    yield "callback:catalog_layout", f.callback(user_id, "catalog_layout:compact:2", message_id)
+    yield "callback:catalog_in_stock", f.callback(user_id, "catalog_in_stock", message_id)
+    yield "callback:catalog_categories", f.callback(user_id, "catalog_categories", message_id)
+    yield "callback:catalog_cat", f.callback(user_id, f"catalog_cat:{category}", message_id)
+    yield "callback:catalog_brand", f.callback(user_id, f"catalog_brand:{brand_id}", message_id)
+    yield "callback:catalog_back_to_brands", f.callback(user_id, "catalog_back_to_brands", message_id)
+    yield "callback:catalog_back", f.callback(user_id, "catalog_back", message_id)
+
+
+def sell_session(f: UpdateFactory, user_id: int, catalog: Catalog, rnd: random.Random) -> Iterator[Step]:
+    message_id = rnd.randint(1, 10 ** 6)
+    product = rnd.choice(catalog.products)
+
+    yield "message:/sell", f.message(user_id, "/sell")
+    yield "callback:sell_cat", f.callback(user_id, f"sell_cat:{product['category']}", message_id)
+    yield "callback:sell_brand", f.callback(user_id, f"sell_brand:{product['brand_id']}", message_id)
+    yield "callback:sell_prod", f.callback(user_id, f"sell_prod:{product['id']}", message_id)
+    yield "message:quantity", f.message(user_id, "1")
+    yield "message:price", f.message(user_id, str(rnd.randint(100, 3000)))
+
+
+def cart_session(f: UpdateFactory, user_id: int, catalog: Catalog, rnd: random.Random) -> Iterator[Step]:
+    """Продажа нескольких вкусов одного бренда через корзину"""
+    message_id = rnd.randint(1, 10 ** 6)
+    product = rnd.choice(catalog.products)
+    same_brand = [p for p in catalog.products if p["brand_id"] == product["brand_id"]]
+
+    yield "message:/sell", f.message(user_id, "/sell")
+    yield "callback:sell_cat", f.callback(user_id, f"sell_cat:{product['category']}", message_id)
+    yield "callback:sell_brand", f.callback(user_id, f"sell_brand:{product['brand_id']}", message_id)
+    for item in rnd.choices(same_brand, k=3):
+        yield "callback:sell_prod", f.callback(user_id, f"sell_prod:{item['id']}", message_id)
+        yield "message:quantity", f.message(user_id, "1")
+        yield "callback:sell_cart_add", f.callback(user_id, "sell_cart_add", message_id)
+    yield "callback:sell_cart", f.callback(user_id, "sell_cart", message_id)
+    yield "callback:sell_cart_commit", f.callback(user_id, "sell_cart_commit", message_id)
+
+
+def add_session(f: UpdateFactory, user_id: int, catalog: Catalog, rnd: random.Random) -> Iterator[Step]:
+    yield "message:/add_products", f.message(user_id, "/add_products")
+    yield "message:batch", f.message(user_id, make_batch_text(50, rnd))
+
+
+SCENARIOS = {
+    "browse": browse_session,
+    "sell": sell_session,
+    "cart": cart_session,
+    "add": add_session,
+}
+ADMIN_SCENARIOS = {"sell", "cart", "add"}
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * q), len(sorted_values) - 1)]
+
+
+def summarize(latencies: list[float]) -> dict[str, float]:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 0.50),
+        "p95_ms": percentile(values, 0.95),
+        "p99_ms": percentile(values, 0.99),
+        "max_ms": values[-1] if values else 0.0,
+        "mean_ms": statistics.fmean(values) if values else 0.0,
+    }
+
+
+async def run_load(args: argparse.Namespace, db_path: str) -> dict:
+    admin_ids = [ADMIN_BASE_ID + i for i in range(args.admins)]
+    customer_ids = [CUSTOMER_BASE_ID + i for i in range(max(args.users - args.admins, 0))]
+
+    # Конфигурация читается лениво - задаём окружение до первого обращения
+    os.environ["BOT_TOKEN"] = "42:LOAD-TEST"
+    os.environ["ADMIN_IDS"] = ",".join(map(str, admin_ids))
+    os.environ["DATABASE_PATH"] = db_path
+    if args.query_budget:
+        os.environ["QUERY_BUDGET_MODE"] = "warn"
+
+    from src.bot.config import load_config
+    from src.bot.main import attach_database, create_dispatcher, init_database
+
+    config = load_config()
+    session = FakeSession(latency=args.api_latency / 1000)
+    bot = Bot(token=config.BOT_TOKEN, session=session)
+    dp = create_dispatcher(config)
+
+    databases = await init_database()
+    manager = databases[0]
+    attach_database(dp, *databases)
+
+    catalog = await Catalog.load(manager)
+    factory = UpdateFactory(bot)
+    latencies: dict[str, list[float]] = defaultdict(list)
+    sessions_done: dict[str, int] = defaultdict(int)
+    errors = 0
+
+    async def user_worker(user_id: int, is_admin: bool, seed: int) -> None:
+        nonlocal errors
+        rnd = random.Random(seed)
+        mix = {
+            name: weight for name, weight in args.mix.items()
+            if is_admin or name not in ADMIN_SCENARIOS
+        }
+        if not mix:
+            return
+        names, weights = list(mix), list(mix.values())
+
+        for _ in range(args.sessions):
+            scenario = rnd.choices(names, weights)[0]
+            for kind, update in SCENARIOS[scenario](factory, user_id, catalog, rnd):
+                started = time.perf_counter()
+                try:
+                    await dp.feed_update(bot, update)
+                except Exception:
+                    errors += 1
+                latencies[kind].append((time.perf_counter() - started) * 1000)
+                if args.think_time:
+                    await asyncio.sleep(rnd.uniform(0, 2 * args.think_time))
+            sessions_done[scenario] += 1
+
+    workers = [
+        user_worker(user_id, True, user_id) for user_id in admin_ids
+    ] + [
+        user_worker(user_id, False, user_id) for user_id in customer_ids
+    ]
+
+    started = time.perf_counter()
+    await asyncio.gather(*workers)
+    wall = time.perf_counter() - started
+    await manager.close()
+    query_budget = dp.get("query_budget")
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    updates = len(all_latencies)
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "users": args.users,
+            "admins": args.admins,
+            "sessions_per_user": args.sessions,
+            "mix": args.mix,
+            "think_time_s": args.think_time,
+            "api_latency_ms": args.api_latency,
+            "scale": args.scale,
+        },
+        "wall_s": wall,
+        "updates": updates,
+        "errors": errors,
+        "updates_per_s": updates / wall if wall else 0.0,
+        "sessions_per_s": {
+            name: count / wall for name, count in sessions_done.items()
+        },
+        "api_calls": dict(session.calls),
+        "api_calls_per_update": session.total_calls / updates if updates else 0.0,
+        "latency": summarize(all_latencies),
+        "latency_by_kind": {
+            kind: summarize(values) for kind, values in sorted(latencies.items())
+        },
+        "queries_by_handler": query_budget.stats() if query_budget else {},
+        "query_budget_violations": query_budget.violations[:50] if query_budget else [],
+    }
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"\n{report['updates']} updates in {report['wall_s']:.2f} s - "
+        f"{report['updates_per_s']:.1f} updates/s, errors: {report['errors']}"
+    )
+    for name, rate in report["sessions_per_s"].items():
+        print(f"  {name:<8} {rate:8.2f} sessions/s")
+
+    print(f"\nAPI calls per update: {report['api_calls_per_update']:.2f}")
+    for method, count in sorted(report["api_calls"].items(), key=lambda x: -x[1]):
+        print(f"  {method:<24} {count}")
+
+    if report.get("queries_by_handler"):
+        print(f"\n{'handler':<36} {'calls':>7} {'avg q':>7} {'max q':>7}")
+        for name, stats in report["queries_by_handler"].items():
+            print(f"{name:<36} {stats['calls']:>7} {stats['avg']:>7.2f} {stats['max']:>7}")
+        for violation in report["query_budget_violations"]:
+            print(f"🔴 {violation}")
+
+    print(f"\n{'kind':<36} {'n':>7} {'p50':>9} {'p95':>9} {'p99':>9}")
+    rows = [("all", report["latency"])] + list(report["latency_by_kind"].items())
+    for kind, stats in rows:
+        print(
+            f"{kind:<36} {stats['count']:>7} {stats['p50_ms']:>8.2f}ms "
+            f"{stats['p95_ms']:>8.2f}ms {stats['p99_ms']:>8.2f}ms"
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="End-to-end load test through the Dispatcher")
+    parser.add_argument("--users", type=int, default=100, help="одновременных пользователей")
+    parser.add_argument("--admins", type=int, default=5, help="из них администраторов")
+    parser.add_argument("--sessions", type=int, default=3, help="сценариев на пользователя")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("browse=8,sell=3,add=1"))
+    parser.add_argument("--think-time", type=float, default=0.5,
+                        help="средняя пауза между действиями пользователя, с")
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="имитация времени ответа Bot API, мс")
+    parser.add_argument("--scale", choices=SCALES, default="tiny")
+    parser.add_argument("--db", help="база для прогона (копируется); по умолчанию - синтетическая")
+    parser.add_argument("--output", help="куда сохранить JSON с отчётом")
+    parser.add_argument("--verbose", action="store_true", help="не глушить логи бота")
+    parser.add_argument("--query-budget", action="store_true",
+                        help="считать запросы на хендлер; код выхода 1 при нарушении бюджетов")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    args.admins = min(args.admins, args.users)
+
+    # Логгеры бота своих обработчиков не вешают - вывод через очередь, как в боте
+    listener = configure_logging("INFO")
+    if not args.verbose:
+        # Хендлеры логируют каждое действие - на нагрузке это шум
+        logging.disable(logging.INFO)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            # Прогон пишет в базу (продажи, приёмка) - работаем с копией
+            db_path = os.path.join(tmp, "load.db")
+            if args.db:
+                shutil.copyfile(args.db, db_path)
+            else:
+                seed_database(db_path, SCALES[args.scale])
+
+            report = asyncio.run(run_load(args, db_path))
+    finally:
+        # Дописать логи до отчёта, чтобы они не перемешались
+        shutdown_logging(listener)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nSaved to {args.output}")
+
+    if report["query_budget_violations"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Воспроизведение записанного трафика через настоящий Dispatcher
+
+Запись включается в боте переменной RECORD_UPDATES_DIR (см. .env.example),
+файлы - updates-*.jsonl.gz с псевдонимизированными id.
+
+Запуск:
+    python -m benchmarks.replay captures/ --db prod-copy.db
+    python -m benchmarks.replay captures/updates-*.jsonl.gz --speed 0 --output replay.json
+
+Апдейты подаются с исходными интервалами (--speed 2 - вдвое быстрее,
+0 - без пауз) в полосы OrderedDispatcher, поэтому порядок внутри чата
+сохраняется так же, как в проде. База копируется во временный файл -
+оригинал не меняется. Сеть подменяется FakeSession.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+from aiogram import Bot
+from aiogram.types import Update
+
+from benchmarks.crud import SCALES, seed_database
+from benchmarks.fake_session import FakeSession
+from benchmarks.load import print_report, summarize
+from src.bot.utils.logger import configure_logging, shutdown_logging
+
+
+def capture_files(paths: list[str]) -> list[Path]:
+    """Файлы записи в хронологическом порядке (имена содержат время)"""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(path.glob("updates-*.jsonl.gz"))
+        else:
+            files.append(path)
+    return sorted(files, key=lambda p: p.name)
+
+
+def read_capture(files: list[Path]) -> Iterator[dict]:
+    for path in files:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def update_kind(update: Update) -> str:
+    """Тип апдейта для отчёта: команда или префикс callback_data"""
+    if update.message is not None:
+        text = update.message.text or ""
+        return f"message:{text.split()[0]}" if text.startswith("/") else "message:text"
+    if update.callback_query is not None:
+        return f"callback:{(update.callback_query.data or '').split(':', 1)[0]}"
+    return update.event_type
+
+
+async def run_replay(args: argparse.Namespace, db_path: str) -> dict:
+    records = list(read_capture(capture_files(args.captures)))
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        raise SystemExit("No updates found in capture")
+
+    # id в записи уже псевдонимизированы - админы помечены флагом
+    admin_ids = sorted({
+        record["update"][key]["from"]["id"]
+        for record in records if record.get("admin")
+        for key in record["update"]
+        if isinstance(record["update"][key], dict) and "from" in record["update"][key]
+    })
+
+    # Конфигурация читается лениво - задаём окружение до первого обращения
+    os.environ["BOT_TOKEN"] = "42:REPLAY"
+    os.environ["ADMIN_IDS"] = ",".join(map(str, admin_ids))
+    os.environ["DATABASE_PATH"] = db_path
+    os.environ.pop("RECORD_UPDATES_DIR", None)
+
+    from src.bot.config import load_config
+    from src.bot.dispatcher import update_chat_key
+    from src.bot.main import attach_database, create_dispatcher, init_database
+
+    config = load_config()
+    session = FakeSession(latency=args.api_latency / 1000)
+    bot = Bot(token=config.BOT_TOKEN, session=session)
+    dp = create_dispatcher(config)
+
+    databases = await init_database()
+    manager = databases[0]
+    attach_database(dp, *databases)
+
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors = 0
+    lag = 0.0
+
+    async def process(update: Update, kind: str, queued_at: float) -> None:
+        nonlocal errors
+        try:
+            await dp.feed_update(bot, update)
+        except Exception:
+            errors += 1
+        latencies[kind].append((time.perf_counter() - queued_at) * 1000)
+
+    t0 = records[0]["t"]
+    started = time.perf_counter()
+    for record in records:
+        if args.speed:
+            delay = (record["t"] - t0) / args.speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                # Отставание от расписания - бот не успевает за исходным темпом
+                lag = max(lag, -delay)
+
+        update = Update.model_validate(record["update"], context={"bot": bot})
+        queued_at = time.perf_counter()
+        await dp.lanes.submit(
+            update_chat_key(update),
+            lambda u=update, k=update_kind(update), q=queued_at: process(u, k, q)
+        )
+
+    await dp.lanes.join()
+    wall = time.perf_counter() - started
+    await manager.close()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    updates = len(all_latencies)
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "captures": [str(p) for p in capture_files(args.captures)],
+            "captured_span_s": records[-1]["t"] - t0,
+            "speed": args.speed,
+            "api_latency_ms": args.api_latency,
+            "admins": len(admin_ids),
+        },
+        "wall_s": wall,
+        "updates": updates,
+        "errors": errors,
+        "max_schedule_lag_s": lag,
+        "updates_per_s": updates / wall if wall else 0.0,
+        "sessions_per_s": {},
+        "api_calls": dict(session.calls),
+        "api_calls_per_update": session.total_calls / updates if updates else 0.0,
+        "latency": summarize(all_latencies),
+        "latency_by_kind": {
+            kind: summarize(values) for kind, values in sorted(latencies.items())
+        },
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay recorded updates through the Dispatcher")
+    parser.add_argument("captures", nargs="+", help="файлы updates-*.jsonl.gz или папки с ними")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="множитель скорости; 0 - подавать без пауз")
+    parser.add_argument("--limit", type=int, help="воспроизвести только первые N апдейтов")
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="имитация времени ответа Bot API, мс")
+    parser.add_argument("--db", help="база для прогона (копируется); по умолчанию - синтетическая")
+    parser.add_argument("--scale", choices=SCALES, default="tiny")
+    parser.add_argument("--output", help="куда сохранить JSON с отчётом")
+    parser.add_argument("--verbose", action="store_true", help="не глушить логи бота")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+
+    listener = configure_logging("INFO")
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "replay.db")
+            if args.db:
+                shutil.copyfile(args.db, db_path)
+            else:
+                seed_database(db_path, SCALES[args.scale])
+
+            report = asyncio.run(run_replay(args, db_path))
+    finally:
+        shutdown_logging(listener)
+
+    print_report(report)
+    print(f"Max schedule lag: {report['max_schedule_lag_s']:.3f} s")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nSaved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
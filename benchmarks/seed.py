@@ -0,0 +1,308 @@
+"""
+Генератор реалистичной базы: бренды, вкусы и история продаж
+
+Запуск:
+    python -m benchmarks.seed products.db --brands 300 --sales 2000000
+    python -m benchmarks.seed big.db --brand-skew 1.3 --seasonality 0.5 --days 730 --force
+
+Популярность брендов и вкусов - по закону Ципфа (--brand-skew,
+--flavor-skew), продажи распределены по дням с годовой сезонностью,
+недельным циклом и трендом, внутри дня - по профилю часов. Загрузка
+идёт напрямую через sqlite3 с выключенным журналом (база на время
+заливки не защищена от сбоев), в конце - ANALYZE и возврат в WAL,
+так что файл сразу можно отдать боту через DATABASE_PATH.
+"""
+import argparse
+import itertools
+import math
+import os
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import date, timedelta
+from typing import Iterator
+
+from db.schemas import create_schema_sql
+from src.bot.models.base import ProductCategory
+
+
+CATEGORIES = [category.value for category in ProductCategory]
+
+# Диапазон цен и доля брендов по категориям
+CATEGORY_PROFILE: dict[str, tuple[int, int, float]] = {
+    ProductCategory.snus: (300, 700, 0.30),
+    ProductCategory.pods: (1500, 4000, 0.15),
+    ProductCategory.liquids: (300, 900, 0.30),
+    ProductCategory.plastics: (50, 250, 0.10),
+    ProductCategory.consumables: (100, 600, 0.15),
+}
+
+SYLLABLES = [
+    "ar", "bo", "ka", "li", "mo", "nex", "or", "pi", "qu", "ra",
+    "sa", "to", "ux", "va", "ze", "fi", "go", "hy", "jet", "lu",
+]
+FLAVOR_WORDS = [
+    "Mango", "Ice", "Mint", "Cherry", "Cola", "Grape", "Lemon", "Berry",
+    "Peach", "Melon", "Apple", "Kiwi", "Banana", "Coconut", "Lime",
+    "Strawberry", "Blueberry", "Pineapple", "Watermelon", "Energy",
+    "Vanilla", "Tobacco", "Menthol", "Raspberry", "Orange", "Currant",
+]
+
+# Доля продаж по часам суток (пик - вечер)
+HOURLY_PROFILE = [
+    1, 1, 1, 1, 1, 1, 2, 3, 4, 5, 6, 7,
+    8, 8, 8, 9, 10, 12, 14, 15, 14, 11, 7, 3,
+]
+# Множитель по дням недели, пн..вс
+WEEKLY_PROFILE = [0.9, 0.9, 0.95, 1.0, 1.2, 1.35, 1.1]
+
+# Размер покупки: штук и их доля
+QUANTITIES = [1, 2, 3, 4, 5, 10]
+QUANTITY_WEIGHTS = [70, 12, 6, 4, 5, 3]
+
+CHUNK_SIZE = 100_000
+
+
+@dataclass
+class SeedConfig:
+    brands: int = 300
+    flavors_per_brand: float = 12.0
+    sales: int = 1_000_000
+    days: int = 365
+    start: date = date(2025, 1, 1)
+    admins: int = 5
+    brand_skew: float = 1.1
+    flavor_skew: float = 0.8
+    seasonality: float = 0.3
+    weekly: float = 1.0
+    trend: float = 0.2
+    seed: int = 42
+
+
+@contextmanager
+def bulk_connection(path: str) -> Iterator[sqlite3.Connection]:
+    """
+    Соединение для массовой заливки
+
+    Без журнала и fsync, с эксклюзивной блокировкой и большим кешем.
+    Схема создаётся заранее, данные пишутся одной транзакцией;
+    после - ANALYZE и обычный режим WAL.
+    """
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.executescript(create_schema_sql())
+        conn.execute("PRAGMA journal_mode=OFF;")
+        conn.execute("PRAGMA synchronous=OFF;")
+        conn.execute("PRAGMA locking_mode=EXCLUSIVE;")
+        conn.execute("PRAGMA temp_store=MEMORY;")
+        conn.execute("PRAGMA cache_size=-262144;")
+        conn.execute("BEGIN;")
+        yield conn
+        conn.execute("COMMIT;")
+        conn.execute("ANALYZE;")
+        conn.execute("PRAGMA locking_mode=NORMAL;")
+        conn.execute("PRAGMA journal_mode=WAL;")
+    finally:
+        conn.close()
+
+
+def zipf_weights(count: int, skew: float) -> list[float]:
+    """Веса 1/rank^skew: skew=0 - равномерно, больше - сильнее перекос"""
+    return [1.0 / (rank ** skew) for rank in range(1, count + 1)]
+
+
+def brand_names(count: int, rnd: random.Random) -> Iterator[str]:
+    """Уникальные «брендовые» названия из слогов"""
+    seen = set()
+    while len(seen) < count:
+        name = "".join(rnd.choices(SYLLABLES, k=rnd.randint(2, 3))).capitalize()
+        if name in seen:
+            name = f"{name} {len(seen)}"
+        seen.add(name)
+        yield name
+
+
+def flavor_names(count: int, rnd: random.Random) -> list[str]:
+    """Уникальные в пределах бренда вкусы: одно-три слова"""
+    flavors: list[str] = []
+    seen = set()
+    while len(flavors) < count:
+        flavor = " ".join(rnd.sample(FLAVOR_WORDS, k=rnd.choice((1, 2, 2, 3))))
+        if flavor in seen:
+            flavor = f"{flavor} {len(flavors)}"
+        seen.add(flavor)
+        flavors.append(flavor)
+    return flavors
+
+
+def day_weights(config: SeedConfig) -> list[float]:
+    """Вес каждого дня: тренд x годовая сезонность x день недели"""
+    weights = []
+    for offset in range(config.days):
+        day = config.start + timedelta(days=offset)
+        trend = 1.0 + config.trend * offset / 365
+        # Пик продаж - летом (день года ~200)
+        season = 1.0 + config.seasonality * math.cos(
+            2 * math.pi * (day.timetuple().tm_yday - 200) / 365
+        )
+        weekday = 1.0 + config.weekly * (WEEKLY_PROFILE[day.weekday()] - 1.0)
+        weights.append(max(trend * season * weekday, 0.0))
+    return weights
+
+
+def seed(path: str, config: SeedConfig) -> dict[str, float]:
+    """Заполнить базу по конфигурации. Возвращает время этапов в секундах"""
+    rnd = random.Random(config.seed)
+    timings: dict[str, float] = {}
+
+    with bulk_connection(path) as conn:
+        # ===== BRANDS =====
+        started = time.perf_counter()
+        shares = [CATEGORY_PROFILE[c][2] for c in CATEGORIES]
+        brand_categories = rnd.choices(CATEGORIES, shares, k=config.brands)
+        brands = list(zip(brand_names(config.brands, rnd), brand_categories))
+        conn.executemany("INSERT INTO brands (name, category) VALUES (?, ?)", brands)
+        timings["brands"] = time.perf_counter() - started
+
+        # ===== PRODUCTS =====
+        # Популярность товара = популярность бренда x популярность вкуса в бренде
+        started = time.perf_counter()
+        brand_popularity = zipf_weights(config.brands, config.brand_skew)
+        rnd.shuffle(brand_popularity)
+
+        products: list[tuple[int, str, int, float]] = []
+        popularity: list[float] = []
+        prices: list[float] = []
+        for brand_id, (_, category) in enumerate(brands, start=1):
+            low, high, _ = CATEGORY_PROFILE[category]
+            base_price = rnd.randint(low, high)
+            count = max(1, int(rnd.expovariate(1 / config.flavors_per_brand)))
+            flavor_popularity = zipf_weights(count, config.flavor_skew)
+            for flavor, weight in zip(flavor_names(count, rnd), flavor_popularity):
+                share = brand_popularity[brand_id - 1] * weight
+                price = round(base_price * rnd.uniform(0.9, 1.1), -1)
+                # Ходовые позиции держат в большем количестве
+                quantity = int(rnd.expovariate(1.0) * 50 * (1 + 20 * share))
+                products.append((brand_id, flavor, quantity, price))
+                popularity.append(share)
+                prices.append(price)
+
+        conn.executemany(
+            "INSERT INTO products (brand_id, flavor, quantity, price) VALUES (?, ?, ?, ?)",
+            products
+        )
+        timings["products"] = time.perf_counter() - started
+
+        # ===== SALES =====
+        # Продажи по возрастанию даты - как их писал бы бот
+        started = time.perf_counter()
+        product_ids = range(1, len(products) + 1)
+        product_cum = list(itertools.accumulate(popularity))
+        days = sorted(rnd.choices(
+            range(config.days), cum_weights=list(itertools.accumulate(day_weights(config))),
+            k=config.sales
+        ))
+        day_prefix = [
+            f"{config.start + timedelta(days=offset)} "
+            for offset in range(config.days)
+        ]
+        # Время суток - секунда дня с весом её часа, строки готовим заранее
+        clock = [
+            f"{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}"
+            for second in range(86400)
+        ]
+        clock_cum = list(itertools.accumulate(
+            HOURLY_PROFILE[second // 3600] for second in range(86400)
+        ))
+        admin_ids = range(1, config.admins + 1)
+
+        def sales_rows() -> Iterator[tuple[int, int, int, float, str]]:
+            # Случайные величины - пачками через choices(), без вызовов на строку
+            for chunk_start in range(0, config.sales, CHUNK_SIZE):
+                chunk_days = days[chunk_start:chunk_start + CHUNK_SIZE]
+                size = len(chunk_days)
+                chosen = rnd.choices(product_ids, cum_weights=product_cum, k=size)
+                seconds = rnd.choices(clock, cum_weights=clock_cum, k=size)
+                # Чаще продают по 1 шт., иногда - блоком
+                quantities = rnd.choices(QUANTITIES, QUANTITY_WEIGHTS, k=size)
+                admins = rnd.choices(admin_ids, k=size)
+                for day, product_id, time_of_day, quantity, admin_id in zip(
+                    chunk_days, chosen, seconds, quantities, admins
+                ):
+                    yield (
+                        product_id,
+                        admin_id,
+                        quantity,
+                        prices[product_id - 1] * quantity,
+                        day_prefix[day] + time_of_day,
+                    )
+
+        conn.executemany(
+            "INSERT INTO sales (product_id, admin_id, quantity, price, sale_date) "
+            "VALUES (?, ?, ?, ?, ?)",
+            sales_rows()
+        )
+        timings["sales"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+    timings["finalize"] = time.perf_counter() - started
+    timings["products_count"] = len(products)
+    return timings
+
+
+def parse_args() -> argparse.Namespace:
+    defaults = SeedConfig()
+    parser = argparse.ArgumentParser(description="Seed a synthetic catalog and sales history")
+    parser.add_argument("db", help="путь к создаваемой базе")
+    parser.add_argument("--force", action="store_true", help="перезаписать существующий файл")
+    parser.add_argument("--brands", type=int, default=defaults.brands, help="брендов всего")
+    parser.add_argument("--flavors-per-brand", type=float, default=defaults.flavors_per_brand,
+                        help="среднее число вкусов у бренда")
+    parser.add_argument("--sales", type=int, default=defaults.sales)
+    parser.add_argument("--days", type=int, default=defaults.days, help="длина истории продаж")
+    parser.add_argument("--start", type=date.fromisoformat, default=defaults.start,
+                        help="первый день истории, YYYY-MM-DD")
+    parser.add_argument("--admins", type=int, default=defaults.admins)
+    parser.add_argument("--brand-skew", type=float, default=defaults.brand_skew,
+                        help="показатель Ципфа для популярности брендов (0 - равномерно)")
+    parser.add_argument("--flavor-skew", type=float, default=defaults.flavor_skew,
+                        help="то же для вкусов внутри бренда")
+    parser.add_argument("--seasonality", type=float, default=defaults.seasonality,
+                        help="амплитуда годовой сезонности, 0..1")
+    parser.add_argument("--weekly", type=float, default=defaults.weekly,
+                        help="сила недельного цикла, 0 - выключен")
+    parser.add_argument("--trend", type=float, default=defaults.trend,
+                        help="рост продаж за год, 0.2 = +20%%")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if os.path.exists(args.db):
+        if not args.force:
+            raise SystemExit(f"{args.db} already exists, use --force to overwrite")
+        os.remove(args.db)
+
+    config = SeedConfig(**{
+        name: getattr(args, name) for name in asdict(SeedConfig())
+    })
+
+    started = time.perf_counter()
+    timings = seed(args.db, config)
+    total = time.perf_counter() - started
+
+    print(f"Seeded {args.db} in {total:.1f} s")
+    print(f"  brands   {config.brands:>10}  {timings['brands']:6.2f} s")
+    print(f"  products {timings['products_count']:>10}  {timings['products']:6.2f} s")
+    print(
+        f"  sales    {config.sales:>10}  {timings['sales']:6.2f} s  "
+        f"({config.sales / max(timings['sales'], 1e-9):,.0f} rows/s)"
+    )
+    print(f"  analyze + WAL         {timings['finalize']:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
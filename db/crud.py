@@ -7,23 +7,57 @@ from db.schemas import (
     create_brands_table_sql,
     create_products_table_sql,
     create_sales_table_sql,
-    insert_brand_sql,
+    decrement_product_quantity_sql,
+    delete_expired_reservations_sql,
+    delete_reservation_sql,
+    insert_brand_or_ignore_sql,
+    insert_grouped_sale_sql,
+    insert_reservation_sql,
     insert_product_sql,
     insert_sale_sql,
+    insert_sale_group_sql,
     select_brand_by_name_and_category_sql,
     select_brands_by_category_sql,
     select_all_brands_sql,
     select_product_by_brand_and_flavor_sql,
+    select_product_by_id_sql,
+    select_product_names_sql,
     select_products_by_brand_sql,
     select_all_products_sql,
+    select_in_stock_products_sql,
     select_products_by_category_sql,
     select_all_sales_sql,
     select_sales_by_date_range_sql,
+    sell_product_quantity_sql,
     update_product_quantity_sql,
+    upsert_product_by_brand_name_sql,
     delete_product_sql,
-    select_brand_by_id_sql
+    select_brand_by_id_sql,
+    select_photos_sql,
+    update_brand_photo_sql,
+    update_product_photo_sql,
+    apply_stock_adjustments_sql,
+    count_stocktake_rows_sql,
+    create_stocktake_counts_index_sql,
+    create_stocktake_counts_sql,
+    delete_stocktake_counts_sql,
+    insert_missing_adjustments_sql,
+    insert_stock_adjustments_sql,
+    insert_stocktake_count_sql,
+    insert_stocktake_sql,
+    resolve_stocktake_products_sql,
+    select_stocktake_diff_sql,
+    select_stocktake_missing_sql,
 )
-from src.bot.models.base import BrandModel, ProductModel, SaleModel
+from src.bot.models.base import BrandModel, ProductModel, ProductRow, SaleModel, StockCountRow
+
+
+class InsufficientStock(Exception):
+    """Свободного остатка не хватило - транзакция откатывается"""
+
+
+class StaleStocktake(Exception):
+    """Пересчёт во временной таблице не тот, что показан админу"""
 
 
 class BrandsSQL:
@@ -48,20 +82,22 @@ class BrandsSQL:
             )
             
             if existing:
-                self.logger.info(f"Brand already exists: {brand.name}")
+                self.logger.info("Brand already exists: %s", brand.name)
                 return existing
             
-            # Добавляем новый
+            # Добавляем новый; OR IGNORE - если его успел создать
+            # параллельный запрос между проверкой и вставкой
             await self.db.execute(
-                insert_brand_sql(),
+                insert_brand_or_ignore_sql(),
                 {"name": brand.name, "category": brand.category}
             )
+            self.db.bump_catalog_version()
             
             # Получаем добавленный бренд
             added = await self.get_brand_by_name_and_category(
                 brand.name, brand.category
             )
-            self.logger.info(f"Added new brand: {brand.name}")
+            self.logger.info("Added new brand: %s", brand.name)
             return added
             
         except Exception as e:
@@ -119,6 +155,20 @@ class BrandsSQL:
             self.logger.error(f"Error fetching brand by id: {e}", exc_info=True)
             return None
 
+    async def set_photo(self, brand_id: int, file_id: str) -> bool:
+        """Сохранить file_id фото бренда"""
+        try:
+            await self.db.execute(
+                update_brand_photo_sql(),
+                {"id": brand_id, "photo_file_id": file_id}
+            )
+            self.db.bump_catalog_version(stock_only=True)
+            self.logger.info("Updated brand photo: %s", brand_id)
+            return True
+        except Exception as e:
+            self.logger.error(f"Error updating brand photo: {e}", exc_info=True)
+            return False
+
 
 class ProductsSQL:
     def __init__(self, db: AsyncDatabaseManager):
@@ -157,6 +207,7 @@ class ProductsSQL:
                     }
                 )
 
+            self.db.bump_catalog_version()
             return True
 
         except Exception:
@@ -187,6 +238,44 @@ class ProductsSQL:
         self.logger.info(f"Batch: {added_count}/{len(products)} products")
         return added_count
 
+    async def import_products(self, rows: List[ProductRow]) -> int:
+        """
+        Строки приёмки одной транзакцией: недостающие бренды создаются,
+        количество существующих товаров суммируется
+
+        Returns:
+            Сколько строк записано (0 - если транзакция откатилась)
+        """
+        if not rows:
+            return 0
+
+        brands = {(row.brand, row.category.value) for row in rows}
+        try:
+            async with self.db.transaction() as db:
+                await db.executemany(
+                    insert_brand_or_ignore_sql(),
+                    [{"name": name, "category": category} for name, category in brands]
+                )
+                await db.executemany(
+                    upsert_product_by_brand_name_sql(),
+                    [
+                        {
+                            "brand_name": row.brand,
+                            "category": row.category.value,
+                            "flavor": row.flavor,
+                            "quantity": row.quantity,
+                            "price": row.price,
+                        }
+                        for row in rows
+                    ]
+                )
+            self.db.bump_catalog_version()
+            self.logger.info(f"Imported {len(rows)} products ({len(brands)} brands)")
+            return len(rows)
+        except Exception as e:
+            self.logger.error(f"Error importing products: {e}", exc_info=True)
+            return 0
+
     async def get_product_by_brand_and_flavor(
         self, brand_id: int, flavor: str
     ) -> ProductModel | None:
@@ -203,6 +292,25 @@ class ProductsSQL:
             self.logger.error(f"Error fetching product: {e}")
             return None
 
+    async def get_product(self, product_id: int) -> ProductModel | None:
+        """Получить товар по id (со свободным остатком)"""
+        try:
+            row = await self.db.fetchone(select_product_by_id_sql(), {"id": product_id})
+            if row:
+                return ProductModel(**row)
+            return None
+        except Exception as e:
+            self.logger.error(f"Error fetching product: {e}")
+            return None
+
+    async def get_product_names(self) -> List[dict]:
+        """Названия всех товаров для поиска: id, brand_name, category, flavor, price"""
+        try:
+            return await self.db.fetchall(select_product_names_sql())
+        except Exception as e:
+            self.logger.error(f"Error fetching product names: {e}")
+            return []
+
     async def get_products_by_brand(self, brand_id: int) -> List[ProductModel]:
         """Получить товары бренда"""
         try:
@@ -224,6 +332,15 @@ class ProductsSQL:
             self.logger.error(f"Error fetching products: {e}")
             return []
 
+    async def get_in_stock(self) -> List[ProductModel]:
+        """Получить товары в наличии"""
+        try:
+            rows = await self.db.fetchall(select_in_stock_products_sql())
+            return [ProductModel(**row) for row in rows]
+        except Exception as e:
+            self.logger.error(f"Error fetching products in stock: {e}")
+            return []
+
     async def get_by_category(self, category: str) -> List[ProductModel]:
         """Получить товары категории"""
         try:
@@ -242,19 +359,43 @@ class ProductsSQL:
                 update_product_quantity_sql(),
                 {"id": product_id, "quantity": quantity}
             )
-            self.logger.info(f"Updated quantity: {product_id} -> {quantity}")
+            self.db.bump_catalog_version(stock_only=True)
+            self.logger.info("Updated quantity: %s -> %s", product_id, quantity)
             return True
         except Exception as e:
             self.logger.error(f"Error updating quantity: {e}", exc_info=True)
             return False
 
+    async def set_photo(self, product_id: int, file_id: str) -> bool:
+        """Сохранить file_id фото товара"""
+        try:
+            await self.db.execute(
+                update_product_photo_sql(),
+                {"id": product_id, "photo_file_id": file_id}
+            )
+            self.db.bump_catalog_version(stock_only=True)
+            self.logger.info("Updated product photo: %s", product_id)
+            return True
+        except Exception as e:
+            self.logger.error(f"Error updating product photo: {e}", exc_info=True)
+            return False
+
+    async def get_photos(self) -> List[dict]:
+        """file_id всех фото товаров и брендов"""
+        try:
+            return await self.db.fetchall(select_photos_sql())
+        except Exception as e:
+            self.logger.error(f"Error fetching photos: {e}")
+            return []
+
     async def delete_product(self, product_id: int) -> bool:
         try:
             await self.db.execute(
                 delete_product_sql(),
                 {"id": product_id}
             )
-            self.logger.info(f"Deleted product {product_id}")
+            self.db.bump_catalog_version()
+            self.logger.info("Deleted product %s", product_id)
             return True
         except Exception as e:
             self.logger.error(f"Error deleting product: {e}")
@@ -293,7 +434,7 @@ class SalesSQL:
                     "sale_date": datetime.now()
                 }
             )
-            self.logger.info(f"Sale added: product_id={product_id}, qty={quantity}")
+            self.logger.info("Sale added: product_id=%s, qty=%s", product_id, quantity)
             return True
         except Exception as e:
             self.logger.error(f"Error adding sale: {e}", exc_info=True)
@@ -322,4 +463,317 @@ class SalesSQL:
             return [SaleModel(**row) for row in rows]
         except Exception as e:
             self.logger.error(f"Error fetching sales by date: {e}")
-            return []
\ No newline at end of file
+            return []
+
+
+class ReservationsSQL:
+    """
+    Резервы товара на время продажи
+
+    Количество, введённое продавцом, сразу вычитается из свободного
+    остатка: два админа не могут продать одни и те же штуки. Резерв
+    снимается продажей (confirm), отменой (release) или по истечении
+    срока (sweep_expired).
+    """
+
+    def __init__(self, db: AsyncDatabaseManager):
+        self.db = db
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def reserve(
+        self,
+        product_id: int,
+        admin_id: int,
+        quantity: int,
+        ttl: int,
+        replace_id: int | None = None
+    ) -> tuple[int | None, int]:
+        """
+        Зарезервировать `quantity` штук на `ttl` секунд
+
+        `replace_id` - прежний резерв этой же продажи, снимается в той же
+        транзакции.
+
+        Returns:
+            (id резерва или None если не хватило, свободный остаток после)
+        """
+        try:
+            async with self.db.transaction() as db:
+                if replace_id is not None:
+                    await db.execute(delete_reservation_sql(), {"id": replace_id})
+                inserted = await db.fetchall(
+                    insert_reservation_sql(),
+                    {
+                        "product_id": product_id,
+                        "admin_id": admin_id,
+                        "quantity": quantity,
+                        "ttl": f"+{ttl} seconds",
+                    }
+                )
+                product = await db.fetchall(select_product_by_id_sql(), {"id": product_id})
+            self.db.bump_catalog_version(stock_only=True)
+
+            available = product[0]["quantity"] - product[0]["reserved"] if product else 0
+            if not inserted:
+                return None, available
+            self.logger.info(
+                "Reserved: product_id=%s, qty=%s, admin_id=%s", product_id, quantity, admin_id
+            )
+            return inserted[0]["id"], available
+        except Exception as e:
+            self.logger.error(f"Error reserving product: {e}", exc_info=True)
+            return None, 0
+
+    async def confirm(
+        self,
+        reservation_id: int,
+        product_id: int,
+        admin_id: int,
+        quantity: int,
+        price: float
+    ) -> int | None:
+        """
+        Продажа по резерву одной транзакцией: снять резерв, списать
+        остаток, записать продажу
+
+        Истёкший резерв не мешает продаже, если свободного остатка
+        по-прежнему хватает.
+
+        Returns:
+            Остаток на складе после продажи (None - не хватило или ошибка)
+        """
+        try:
+            async with self.db.transaction() as db:
+                await db.execute(delete_reservation_sql(), {"id": reservation_id})
+                updated = await db.fetchall(
+                    sell_product_quantity_sql(),
+                    {"product_id": product_id, "quantity": quantity}
+                )
+                if updated:
+                    await db.execute(
+                        insert_sale_sql(),
+                        {
+                            "product_id": product_id,
+                            "admin_id": admin_id,
+                            "quantity": quantity,
+                            "price": price,
+                            "sale_date": datetime.now()
+                        }
+                    )
+            self.db.bump_catalog_version(stock_only=True)
+
+            if not updated:
+                self.logger.warning(
+                    "Not enough stock to confirm reservation %s (product_id=%s, qty=%s)",
+                    reservation_id, product_id, quantity
+                )
+                return None
+            self.logger.info("Sale added: product_id=%s, qty=%s", product_id, quantity)
+            return updated[0]["quantity"]
+        except Exception as e:
+            self.logger.error(f"Error confirming reservation: {e}", exc_info=True)
+            return None
+
+    async def confirm_cart(self, items: List[dict], admin_id: int) -> int | None:
+        """
+        Продажа корзины одной транзакцией: чек, снятие резервов, списание
+        остатков и строки продаж. Не хватило хотя бы одного товара -
+        откатывается всё.
+
+        Args:
+            items: позиции {reservation_id, product_id, quantity, price};
+                reservation_id может быть None
+
+        Returns:
+            Номер чека (None - не хватило остатка или ошибка)
+        """
+        if not items:
+            return None
+
+        now = datetime.now()
+        try:
+            async with self.db.transaction() as db:
+                group = await db.fetchall(
+                    insert_sale_group_sql(),
+                    {
+                        "admin_id": admin_id,
+                        "total": sum(item["price"] for item in items),
+                        "created_at": now
+                    }
+                )
+                group_id = group[0]["id"]
+                # Быстрая продажа (/s) идёт без резервов
+                holds = [
+                    {"id": item["reservation_id"]}
+                    for item in items if item.get("reservation_id") is not None
+                ]
+                if holds:
+                    await db.executemany(delete_reservation_sql(), holds)
+                updated = await db.executemany(
+                    decrement_product_quantity_sql(),
+                    [
+                        {"product_id": item["product_id"], "quantity": item["quantity"]}
+                        for item in items
+                    ]
+                )
+                if updated != len(items):
+                    raise InsufficientStock(f"{len(items) - updated} of {len(items)} items")
+                await db.executemany(
+                    insert_grouped_sale_sql(),
+                    [
+                        {
+                            "product_id": item["product_id"],
+                            "admin_id": admin_id,
+                            "quantity": item["quantity"],
+                            "price": item["price"],
+                            "sale_date": now,
+                            "group_id": group_id
+                        }
+                        for item in items
+                    ]
+                )
+            self.db.bump_catalog_version(stock_only=True)
+            self.logger.info("Cart sold: group_id=%s, items=%s", group_id, len(items))
+            return group_id
+        except InsufficientStock as e:
+            self.logger.warning(f"Not enough stock to sell cart: {e}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Error selling cart: {e}", exc_info=True)
+            return None
+
+    async def release(self, reservation_ids: List[int]) -> bool:
+        """Снять резервы (отмена продажи или корзины)"""
+        if not reservation_ids:
+            return True
+        try:
+            await self.db.executemany(
+                delete_reservation_sql(), [{"id": id} for id in reservation_ids]
+            )
+            self.db.bump_catalog_version(stock_only=True)
+            self.logger.info("Released reservations %s", reservation_ids)
+            return True
+        except Exception as e:
+            self.logger.error(f"Error releasing reservations: {e}")
+            return False
+
+    async def sweep_expired(self) -> int:
+        """Удалить истёкшие резервы. Returns: сколько удалено"""
+        try:
+            deleted = await self.db.execute(delete_expired_reservations_sql())
+            if deleted:
+                self.db.bump_catalog_version(stock_only=True)
+                self.logger.info(f"Swept {deleted} expired reservations")
+            return deleted
+        except Exception as e:
+            self.logger.error(f"Error sweeping reservations: {e}")
+            return 0
+
+
+class StocktakeSQL:
+    """
+    Инвентаризация: пересчёт грузится во временную таблицу, расхождения
+    считаются одним JOIN, применяются одной транзакцией с корректировками
+    """
+
+    def __init__(self, db: AsyncDatabaseManager):
+        self.db = db
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def load(self, admin_id: int, rows: List[StockCountRow]) -> bool:
+        """Заменить пересчёт админа и найти товары (по бренду, категории и вкусу)"""
+        try:
+            async with self.db.transaction() as db:
+                await db.execute(create_stocktake_counts_sql())
+                await db.execute(create_stocktake_counts_index_sql())
+                await db.execute(delete_stocktake_counts_sql(), {"session_id": admin_id})
+                await db.executemany(
+                    insert_stocktake_count_sql(),
+                    [
+                        {
+                            "session_id": admin_id,
+                            "category": row.category.value,
+                            "brand": row.brand,
+                            "flavor": row.flavor,
+                            "quantity": row.quantity,
+                        }
+                        for row in rows
+                    ]
+                )
+                await db.execute(resolve_stocktake_products_sql(), {"session_id": admin_id})
+            self.logger.info("Stocktake loaded: admin_id=%s, lines=%s", admin_id, len(rows))
+            return True
+        except Exception as e:
+            self.logger.error(f"Error loading stocktake: {e}", exc_info=True)
+            return False
+
+    async def diff(self, admin_id: int) -> tuple[List[dict], dict] | None:
+        """
+        Returns:
+            (расхождения и ненайденные строки, {missing, quantity} - товары
+            с остатком, которых нет в пересчёте); None - ошибка
+        """
+        try:
+            params = {"session_id": admin_id}
+            # Временная таблица видна только пишущему соединению, а не
+            # соединению для чтения - читаем внутри транзакции
+            async with self.db.transaction() as db:
+                rows = await db.fetchall(select_stocktake_diff_sql(), params)
+                missing = await db.fetchall(select_stocktake_missing_sql(), params)
+            return rows, missing[0]
+        except Exception as e:
+            self.logger.error(f"Error computing stocktake diff: {e}", exc_info=True)
+            return None
+
+    async def apply(
+        self,
+        admin_id: int,
+        lines: int,
+        zero_missing: bool = False
+    ) -> tuple[int, int] | None:
+        """
+        Применить пересчёт одной транзакцией
+
+        Args:
+            lines: сколько строк было в показанном пересчёте (защита от
+                применения чужой или пустой временной таблицы)
+            zero_missing: обнулить товары, которых нет в пересчёте
+
+        Returns:
+            (номер инвентаризации, сколько товаров скорректировано);
+            None - пересчёт устарел или ошибка
+        """
+        params = {"session_id": admin_id}
+        try:
+            async with self.db.transaction() as db:
+                loaded = await db.fetchall(count_stocktake_rows_sql(), params)
+                if loaded[0]["lines"] != lines:
+                    raise StaleStocktake(f"loaded {loaded[0]['lines']} lines, expected {lines}")
+
+                stocktake = await db.fetchall(insert_stocktake_sql(), {"admin_id": admin_id})
+                params["stocktake_id"] = stocktake[0]["id"]
+                adjusted = await db.execute(insert_stock_adjustments_sql(), params)
+                if zero_missing:
+                    adjusted += await db.execute(insert_missing_adjustments_sql(), params)
+                await db.execute(apply_stock_adjustments_sql(), params)
+                await db.execute(delete_stocktake_counts_sql(), params)
+            self.db.bump_catalog_version(stock_only=True)
+            self.logger.info(
+                "Stocktake applied: id=%s, adjusted=%s, admin_id=%s",
+                params["stocktake_id"], adjusted, admin_id
+            )
+            return params["stocktake_id"], adjusted
+        except StaleStocktake as e:
+            self.logger.warning(f"Stale stocktake for admin {admin_id}: {e}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Error applying stocktake: {e}", exc_info=True)
+            return None
+
+    async def discard(self, admin_id: int) -> bool:
+        try:
+            await self.db.execute(delete_stocktake_counts_sql(), {"session_id": admin_id})
+            return True
+        except Exception as e:
+            self.logger.error(f"Error discarding stocktake: {e}")
+            return False
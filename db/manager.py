@@ -1,49 +1,387 @@
+import asyncio
+import logging
+import time
 import aiosqlite
-from typing import Any, Iterable, Optional
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Iterable, Optional
+
+from db.profiling import QueryEvent, QueryStats, plan_has_full_scan, statement_name
+
+logger = logging.getLogger(__name__)
+
+QueryHook = Callable[[QueryEvent], None]
 
 
 class AsyncDatabaseManager:
-    def __init__(self, db_path: str):
+    def __init__(
+        self,
+        db_path: str,
+        slow_query_ms: float = 100.0,
+        busy_timeout_ms: int = 5000
+    ):
         self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        # Растёт при любом изменении брендов или остатков
+        self.catalog_version = 0
+        # Растёт, только когда меняется состав каталога (не остатки)
+        self.names_version = 0
+        # Общее соединение (после connect); без него - соединение на запрос
+        self._conn: aiosqlite.Connection | None = None
+        # Соединение только для чтения: видит лишь закоммиченные данные
+        # (снимок WAL), а не незавершённую транзакцию на общем соединении
+        self._reader: aiosqlite.Connection | None = None
+        self._write_lock = asyncio.Lock()
+        # PRAGMA data_version на момент последней проверки (см. sync_external_writes)
+        self._data_version: int | None = None
+
+        # Замеры запросов: статистика по имени statement и хуки
+        self.slow_query_ms = slow_query_ms
+        self.query_stats: dict[str, QueryStats] = {}
+        self._query_hooks: list[QueryHook] = []
+        self._plans: dict[str, list[str]] = {}
+        # Лог медленного statement не чаще раза в интервал, остальные считаем
+        self.slow_log_interval = 60.0
+        self._slow_logged: dict[str, tuple[float, int]] = {}
+
+    def bump_catalog_version(self, stock_only: bool = False) -> int:
+        """
+        Отметить изменение каталога (сбрасывает кеши отрисовки)
+
+        stock_only - изменились только остатки и резервы: индекс названий
+        (names_version) остаётся в силе.
+        """
+        self.catalog_version += 1
+        if not stock_only:
+            self.names_version += 1
+        return self.catalog_version
+
+    async def sync_external_writes(self) -> bool:
+        """
+        Заметить коммиты других процессов и сбросить кеши каталога
+
+        PRAGMA data_version меняется, только если в файл писало другое
+        соединение, - свои записи версию каталога уже подняли. Запрос
+        не попадает в статистику и бюджеты: это служебная проверка.
+
+        Returns:
+            True если с прошлой проверки базу меняли извне
+        """
+        if self._conn is None:
+            return False
+        try:
+            async with self._conn.execute("PRAGMA data_version;") as cursor:
+                (version,) = await cursor.fetchone()
+        except Exception as e:
+            logger.error(f"Error reading data_version: {e}")
+            return False
+
+        changed = self._data_version is not None and version != self._data_version
+        self._data_version = version
+        if changed:
+            self.bump_catalog_version()
+        return changed
+
+    async def connect(self) -> None:
+        """Открыть общее соединение в режиме WAL и соединение для чтения"""
+        if self._conn is not None:
+            return
+        conn = await aiosqlite.connect(self.db_path)
+        conn.row_factory = aiosqlite.Row
+        await conn.execute("PRAGMA journal_mode=WAL;")
+        await conn.execute("PRAGMA synchronous=NORMAL;")
+        # Несколько процессов на одном файле: ждём блокировку, а не падаем с SQLITE_BUSY
+        await conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms};")
+
+        reader = await aiosqlite.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        reader.row_factory = aiosqlite.Row
+        await reader.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms};")
+        self._conn, self._reader = conn, reader
+
+    async def close(self, timeout: float | None = None) -> None:
+        """
+        Дождаться записей в очереди, сбросить WAL в основной файл и закрыть
+        соединение
+        """
+        if self._conn is None:
+            return
+
+        try:
+            await asyncio.wait_for(self._write_lock.acquire(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Pending writes did not finish before close")
+        else:
+            self._write_lock.release()
+
+        conn, self._conn = self._conn, None
+        reader, self._reader = self._reader, None
+        await reader.close()
+        try:
+            await conn.execute("PRAGMA optimize;")
+            await conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+        except Exception as e:
+            logger.error(f"Error checkpointing WAL: {e}")
+        finally:
+            await conn.close()
+
+    @asynccontextmanager
+    async def _connection(self) -> AsyncIterator[aiosqlite.Connection]:
+        if self._conn is not None:
+            yield self._conn
+            return
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            yield db
+
+    @asynccontextmanager
+    async def _read_connection(self) -> AsyncIterator[aiosqlite.Connection]:
+        if self._reader is not None:
+            yield self._reader
+            return
+        async with self._connection() as db:
+            yield db
+
+    # ===== INSTRUMENTATION =====
+
+    def add_query_hook(self, hook: QueryHook) -> None:
+        """Вызывать `hook(event)` после каждого запроса"""
+        self._query_hooks.append(hook)
+
+    def remove_query_hook(self, hook: QueryHook) -> None:
+        if hook in self._query_hooks:
+            self._query_hooks.remove(hook)
+
+    def top_queries(self, limit: int = 10) -> dict[str, dict]:
+        """Самые затратные statement'ы по суммарному времени"""
+        ranked = sorted(
+            self.query_stats.items(), key=lambda item: -item[1].total_ms
+        )
+        return {name: stats.as_dict() for name, stats in ranked[:limit]}
+
+    async def _observe(
+        self,
+        db: aiosqlite.Connection,
+        kind: str,
+        query: str,
+        params: Optional[dict],
+        started: float,
+        waited: float,
+        rows: int
+    ) -> None:
+        event = QueryEvent(
+            name=statement_name(query),
+            kind=kind,
+            duration_ms=(time.perf_counter() - started) * 1000,
+            wait_ms=waited * 1000,
+            rows=rows,
+        )
+        slow = event.duration_ms >= self.slow_query_ms
+        stats = self.query_stats.get(event.name)
+        if stats is None:
+            stats = self.query_stats[event.name] = QueryStats()
+        stats.add(event, slow)
+
+        for hook in self._query_hooks:
+            try:
+                hook(event)
+            except Exception as e:
+                logger.error(f"Query hook error: {e}", exc_info=True)
+
+        if slow and kind != "script":
+            await self._log_slow_query(db, event, query, params)
+
+    async def _log_slow_query(
+        self,
+        db: aiosqlite.Connection,
+        event: QueryEvent,
+        query: str,
+        params: Optional[dict]
+    ) -> None:
+        now = time.monotonic()
+        logged_at, suppressed = self._slow_logged.get(event.name, (0.0, 0))
+        if logged_at and now - logged_at < self.slow_log_interval:
+            self._slow_logged[event.name] = (logged_at, suppressed + 1)
+            return
+        self._slow_logged[event.name] = (now, 0)
+
+        # План снимаем один раз на statement - дальше берём из кеша
+        plan = self._plans.get(event.name)
+        if plan is None:
+            try:
+                async with db.execute(f"EXPLAIN QUERY PLAN {query}", params or {}) as cursor:
+                    plan = [row[3] for row in await cursor.fetchall()]
+            except Exception as e:
+                plan = [f"<plan unavailable: {e}>"]
+            self._plans[event.name] = plan
+
+        marker = " ⚠️ FULL SCAN" if plan_has_full_scan(plan) else ""
+        logger.warning(
+            f"🐢 Slow query {event.name}: {event.duration_ms:.1f} ms "
+            f"(+{event.wait_ms:.1f} ms lock wait), {event.rows} rows{marker}"
+            + (f", {suppressed} more since last report" if suppressed else "")
+            + "\n"
+            + "\n".join(f"    {line}" for line in plan)
+        )
+
+    async def _execute(
+        self,
+        db: aiosqlite.Connection,
+        query: str,
+        params: Optional[dict],
+        waited: float
+    ) -> int:
+        started = time.perf_counter()
+        async with db.execute(query, params or {}) as cursor:
+            rows = cursor.rowcount
+        await self._observe(db, "execute", query, params, started, waited, max(rows, 0))
+        return rows
+
+    async def _executemany(
+        self,
+        db: aiosqlite.Connection,
+        query: str,
+        params: Iterable[dict],
+        waited: float
+    ) -> int:
+        params = list(params)
+        started = time.perf_counter()
+        async with db.executemany(query, params) as cursor:
+            rows = cursor.rowcount
+        await self._observe(
+            db, "executemany", query, params[0] if params else None,
+            started, waited, max(rows, 0)
+        )
+        return rows
+
+    # ===== QUERIES =====
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator["Transaction"]:
+        """Несколько записей одной транзакцией (commit в конце, rollback при ошибке)"""
+        waiting = time.perf_counter()
+        async with self._write_lock, self._connection() as db:
+            waited = time.perf_counter() - waiting
+            try:
+                yield Transaction(self, db, waited)
+                await db.commit()
+            except BaseException:
+                # Не оставляем открытую транзакцию на общем соединении
+                await db.rollback()
+                raise
 
     async def execute(
         self,
         query: str,
         params: Optional[dict] = None
-    ) -> None:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            await db.execute(query, params or {})
-            await db.commit()
+    ) -> int:
+        """Запрос на запись. Возвращает число изменённых строк"""
+        waiting = time.perf_counter()
+        async with self._write_lock, self._connection() as db:
+            try:
+                rows = await self._execute(db, query, params, time.perf_counter() - waiting)
+                await db.commit()
+                return rows
+            except Exception:
+                # Не оставляем открытую транзакцию на общем соединении
+                await db.rollback()
+                raise
 
     async def executemany(
         self,
         query: str,
         params: Iterable[dict]
-    ) -> None:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            await db.executemany(query, params)
-            await db.commit()
+    ) -> int:
+        waiting = time.perf_counter()
+        async with self._write_lock, self._connection() as db:
+            try:
+                rows = await self._executemany(db, query, params, time.perf_counter() - waiting)
+                await db.commit()
+                return rows
+            except Exception:
+                # Не оставляем открытую транзакцию на общем соединении
+                await db.rollback()
+                raise
+
+    async def executescript(self, script: str) -> None:
+        """Несколько statement'ов за один вызов (схема, миграции)"""
+        waiting = time.perf_counter()
+        async with self._write_lock, self._connection() as db:
+            waited = time.perf_counter() - waiting
+            started = time.perf_counter()
+            try:
+                await db.executescript(script)
+                await db.commit()
+            except Exception:
+                # Не оставляем открытую транзакцию на общем соединении
+                await db.rollback()
+                raise
+            await self._observe(db, "script", script, None, started, waited, 0)
+
+    async def add_missing_columns(self, columns: Iterable[tuple[str, str, str]]) -> int:
+        """
+        Миграция старых баз: ALTER TABLE ADD COLUMN для отсутствующих колонок
+
+        Returns:
+            Сколько колонок добавлено
+        """
+        added = 0
+        for table, column, definition in columns:
+            existing = await self.fetchall(f"PRAGMA table_info({table});")
+            if any(row["name"] == column for row in existing):
+                continue
+            await self.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+            logger.info(f"Added column {table}.{column}")
+            added += 1
+        return added
 
     async def fetchone(
         self,
         query: str,
         params: Optional[dict] = None
     ) -> Optional[dict]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read_connection() as db:
+            started = time.perf_counter()
             async with db.execute(query, params or {}) as cursor:
                 row = await cursor.fetchone()
-                return dict(row) if row else None
+            await self._observe(db, "fetchone", query, params, started, 0.0, int(row is not None))
+            return dict(row) if row else None
 
     async def fetchall(
         self,
         query: str,
         params: Optional[dict] = None
     ) -> list[dict]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read_connection() as db:
+            started = time.perf_counter()
             async with db.execute(query, params or {}) as cursor:
                 rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+            await self._observe(db, "fetchall", query, params, started, 0.0, len(rows))
+            return [dict(row) for row in rows]
+
+
+class Transaction:
+    """Соединение внутри transaction(): те же замеры, что и у менеджера"""
+
+    def __init__(self, manager: AsyncDatabaseManager, db: aiosqlite.Connection, waited: float):
+        self._manager = manager
+        self._db = db
+        # Ожидание блокировки относим к первому запросу транзакции
+        self._waited = waited
+
+    def _take_wait(self) -> float:
+        waited, self._waited = self._waited, 0.0
+        return waited
+
+    async def execute(self, query: str, params: Optional[dict] = None) -> int:
+        return await self._manager._execute(self._db, query, params, self._take_wait())
+
+    async def executemany(self, query: str, params: Iterable[dict]) -> int:
+        return await self._manager._executemany(self._db, query, params, self._take_wait())
+
+    async def fetchall(self, query: str, params: Optional[dict] = None) -> list[dict]:
+        started = time.perf_counter()
+        async with self._db.execute(query, params or {}) as cursor:
+            rows = await cursor.fetchall()
+        await self._manager._observe(
+            self._db, "fetchall", query, params, started, self._take_wait(), len(rows)
+        )
+        return [dict(row) for row in rows]
@@ -0,0 +1,157 @@
+import inspect
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Iterator
+
+from db import schemas
+
+
+@dataclass
+class QueryEvent:
+    """Один выполненный запрос"""
+    name: str
+    kind: str  # execute / executemany / fetchone / fetchall / script
+    duration_ms: float  # от вызова до результата, включая очередь потока aiosqlite
+    wait_ms: float  # ожидание блокировки записи
+    rows: int
+
+
+@dataclass
+class QueryStats:
+    """Накопленная статистика по одному statement"""
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows: int = 0
+    slow: int = 0
+
+    def add(self, event: QueryEvent, slow: bool) -> None:
+        self.count += 1
+        self.total_ms += event.duration_ms
+        self.max_ms = max(self.max_ms, event.duration_ms)
+        self.rows += event.rows
+        self.slow += slow
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "rows": self.rows,
+            "slow": self.slow,
+        }
+
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_sql(query: str) -> str:
+    return _SPACES.sub(" ", query).strip()
+
+
+@lru_cache(maxsize=1)
+def _builder_names() -> dict[str, str]:
+    """SQL -> имя функции-построителя из db/schemas.py (все они без аргументов)"""
+    names = {}
+    for name, func in inspect.getmembers(schemas, inspect.isfunction):
+        if not name.endswith("_sql") or inspect.signature(func).parameters:
+            continue
+        names[normalize_sql(func())] = name
+    return names
+
+
+@lru_cache(maxsize=1024)
+def statement_name(query: str) -> str:
+    """
+    Имя запроса для статистики и логов
+
+    Для SQL из db/schemas.py - имя функции (select_all_sales_sql),
+    для остальных - первые слова запроса.
+    """
+    normalized = normalize_sql(query)
+    name = _builder_names().get(normalized)
+    if name is not None:
+        return name
+    return "adhoc: " + " ".join(normalized.split(" ", 4)[:4])
+
+
+def plan_has_full_scan(plan: list[str]) -> bool:
+    """В плане есть полный проход по таблице или индексу (SCAN)"""
+    return any(line.startswith("SCAN") for line in plan)
+
+
+# ===== QUERY BUDGETS =====
+
+class QueryBudgetExceeded(AssertionError):
+    """Хендлер сделал больше запросов, чем ему положено"""
+
+
+@dataclass
+class QueryCounter:
+    """Запросы, выполненные внутри count_queries()"""
+    events: list[QueryEvent] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.events)
+
+    def by_statement(self) -> Counter[str]:
+        return Counter(event.name for event in self.events)
+
+    def repeated(self, threshold: int = 3) -> dict[str, int]:
+        """Statement'ы, выполненные `threshold` и более раз - признак N+1"""
+        return {
+            name: count
+            for name, count in self.by_statement().items()
+            if count >= threshold
+        }
+
+    def describe(self) -> str:
+        return ", ".join(
+            f"{name} x{count}" for name, count in self.by_statement().most_common()
+        )
+
+    def assert_max(self, limit: int, label: str = "block") -> None:
+        if self.count > limit:
+            raise QueryBudgetExceeded(
+                f"{label}: {self.count} queries, budget {limit} ({self.describe()})"
+            )
+
+    def assert_no_repeats(self, threshold: int = 3, label: str = "block") -> None:
+        repeated = self.repeated(threshold)
+        if repeated:
+            raise QueryBudgetExceeded(f"{label}: repeated statements {repeated}")
+
+
+_active_counters: ContextVar[tuple[QueryCounter, ...]] = ContextVar(
+    "active_query_counters", default=()
+)
+
+
+def record_query(event: QueryEvent) -> None:
+    """Хук для AsyncDatabaseManager.add_query_hook: передаёт запрос активным счётчикам"""
+    for counter in _active_counters.get():
+        counter.events.append(event)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    """
+    Считать запросы внутри блока (в том числе в задачах, созданных в нём)
+
+    Пример:
+        with count_queries() as queries:
+            await dp.feed_update(bot, update)
+        queries.assert_max(2)
+    """
+    counter = QueryCounter()
+    token = _active_counters.set(_active_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _active_counters.reset(token)
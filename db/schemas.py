@@ -5,6 +5,7 @@ def create_brands_table_sql() -> str:
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         name TEXT NOT NULL,
         category TEXT NOT NULL,
+        photo_file_id TEXT,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         UNIQUE(name, category)
     );
@@ -20,6 +21,7 @@ def create_products_table_sql() -> str:
         flavor TEXT NOT NULL,
         quantity INTEGER NOT NULL DEFAULT 0,
         price REAL NOT NULL,
+        photo_file_id TEXT,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY (brand_id) REFERENCES brands(id) ON DELETE CASCADE,
         UNIQUE(brand_id, flavor)
@@ -27,6 +29,18 @@ def create_products_table_sql() -> str:
     """
 
 
+def create_sale_groups_table_sql() -> str:
+    """Чеки: несколько продаж из корзины под одним номером"""
+    return """
+    CREATE TABLE IF NOT EXISTS sale_groups (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        admin_id INTEGER NOT NULL,
+        total REAL NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+
+
 def create_sales_table_sql() -> str:
     return """
     CREATE TABLE IF NOT EXISTS sales (
@@ -36,11 +50,183 @@ def create_sales_table_sql() -> str:
         quantity INTEGER NOT NULL,
         price REAL NOT NULL,
         sale_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        group_id INTEGER REFERENCES sale_groups(id),
         FOREIGN KEY (product_id) REFERENCES products(id)
     );
     """
 
 
+# Колонки, добавленные после первого релиза: (таблица, колонка, определение)
+SCHEMA_COLUMNS = (
+    ("sales", "group_id", "INTEGER REFERENCES sale_groups(id)"),
+    ("brands", "photo_file_id", "TEXT"),
+    ("products", "photo_file_id", "TEXT"),
+)
+
+
+def create_reservations_table_sql() -> str:
+    """Резервы товара на время продажи (снимаются продажей, отменой или по сроку)"""
+    return """
+    CREATE TABLE IF NOT EXISTS reservations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        admin_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        expires_at TIMESTAMP NOT NULL,
+        FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_reservations_product
+        ON reservations(product_id, expires_at);
+    CREATE INDEX IF NOT EXISTS idx_reservations_expires
+        ON reservations(expires_at);
+    """
+
+
+def create_stocktakes_table_sql() -> str:
+    """Инвентаризации и их корректировки остатков (старое и новое количество)"""
+    return """
+    CREATE TABLE IF NOT EXISTS stocktakes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        admin_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS stock_adjustments (
+        stocktake_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        old_quantity INTEGER NOT NULL,
+        new_quantity INTEGER NOT NULL,
+        PRIMARY KEY (stocktake_id, product_id),
+        FOREIGN KEY (stocktake_id) REFERENCES stocktakes(id),
+        FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_stock_adjustments_product
+        ON stock_adjustments(product_id);
+    """
+
+
+def create_catalog_view_sql() -> str:
+    """
+    Денормализованная витрина каталога: products + brands одной таблицей
+
+    Её ведут триггеры на brands и products, читают её все запросы каталога.
+    Индексы повторяют ORDER BY запросов - чтение идёт по индексу без JOIN
+    и без сортировки. Последний INSERT заполняет витрину в старой базе
+    (только если она ещё пустая).
+    """
+    return """
+    CREATE TABLE IF NOT EXISTS catalog_view (
+        product_id INTEGER PRIMARY KEY,
+        brand_id INTEGER NOT NULL,
+        brand_name TEXT NOT NULL,
+        category TEXT NOT NULL,
+        flavor TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        price REAL NOT NULL,
+        in_stock INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_catalog_view_order
+        ON catalog_view(category, brand_name, flavor);
+    CREATE INDEX IF NOT EXISTS idx_catalog_view_in_stock
+        ON catalog_view(in_stock, category, brand_name, flavor);
+    CREATE INDEX IF NOT EXISTS idx_catalog_view_brand
+        ON catalog_view(brand_id, flavor);
+    CREATE INDEX IF NOT EXISTS idx_brands_category
+        ON brands(category, name);
+
+    CREATE TRIGGER IF NOT EXISTS trg_products_insert_catalog
+    AFTER INSERT ON products
+    BEGIN
+        INSERT OR REPLACE INTO catalog_view
+        SELECT NEW.id, NEW.brand_id, b.name, b.category, NEW.flavor,
+               NEW.quantity, NEW.price, NEW.quantity > 0
+        FROM brands b
+        WHERE b.id = NEW.brand_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_products_update_catalog
+    AFTER UPDATE OF flavor, quantity, price ON products
+    BEGIN
+        UPDATE catalog_view
+        SET flavor = NEW.flavor,
+            quantity = NEW.quantity,
+            price = NEW.price,
+            in_stock = NEW.quantity > 0
+        WHERE product_id = NEW.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_products_move_catalog
+    AFTER UPDATE OF id, brand_id ON products
+    BEGIN
+        DELETE FROM catalog_view WHERE product_id = OLD.id;
+        INSERT OR REPLACE INTO catalog_view
+        SELECT NEW.id, NEW.brand_id, b.name, b.category, NEW.flavor,
+               NEW.quantity, NEW.price, NEW.quantity > 0
+        FROM brands b
+        WHERE b.id = NEW.brand_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_products_delete_catalog
+    AFTER DELETE ON products
+    BEGIN
+        DELETE FROM catalog_view WHERE product_id = OLD.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_brands_update_catalog
+    AFTER UPDATE OF name, category ON brands
+    BEGIN
+        UPDATE catalog_view
+        SET brand_name = NEW.name, category = NEW.category
+        WHERE brand_id = NEW.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_brands_delete_catalog
+    AFTER DELETE ON brands
+    BEGIN
+        DELETE FROM catalog_view WHERE brand_id = OLD.id;
+    END;
+
+    INSERT INTO catalog_view
+    SELECT p.id, p.brand_id, b.name, b.category, p.flavor,
+           p.quantity, p.price, p.quantity > 0
+    FROM products p
+    JOIN brands b ON p.brand_id = b.id
+    WHERE NOT EXISTS (SELECT 1 FROM catalog_view);
+    """
+
+
+def create_schema_sql() -> str:
+    """Вся схема одним скриптом (порядок важен из-за FK!)"""
+    return "\n".join((
+        create_brands_table_sql(),
+        create_products_table_sql(),
+        create_sale_groups_table_sql(),
+        create_sales_table_sql(),
+        create_reservations_table_sql(),
+        create_stocktakes_table_sql(),
+        create_catalog_view_sql(),
+    ))
+
+
+def _reserved_subquery(product_id: str) -> str:
+    """Сколько штук товара `product_id` держат действующие резервы"""
+    return f"""(
+        SELECT COALESCE(SUM(r.quantity), 0)
+        FROM reservations r
+        WHERE r.product_id = {product_id} AND r.expires_at > CURRENT_TIMESTAMP
+    )"""
+
+
+# Колонки товара для ProductModel из витрины каталога
+CATALOG_COLUMNS = """
+        c.product_id as id,
+        c.brand_id,
+        c.brand_name,
+        c.category,
+        c.flavor,
+        c.quantity,
+        c.price"""
+
+
 # ===== BRANDS =====
 
 def insert_brand_sql() -> str:
@@ -50,6 +236,14 @@ def insert_brand_sql() -> str:
     """
 
 
+def insert_brand_or_ignore_sql() -> str:
+    """Бренд, если его ещё нет (без гонки «проверил - вставил»)"""
+    return """
+    INSERT OR IGNORE INTO brands (name, category)
+    VALUES (:name, :category);
+    """
+
+
 def select_brand_by_name_and_category_sql() -> str:
     return """
     SELECT id, name, category
@@ -85,70 +279,99 @@ def insert_product_sql() -> str:
     """
 
 
-def select_product_by_brand_and_flavor_sql() -> str:
+def upsert_product_by_brand_name_sql() -> str:
+    """Товар по имени бренда: новый - вставляется, существующий - суммирует количество"""
     return """
-    SELECT 
-        p.id,
-        p.brand_id,
-        b.name as brand_name,
-        b.category,
-        p.flavor,
-        p.quantity,
-        p.price
-    FROM products p
-    JOIN brands b ON p.brand_id = b.id
-    WHERE p.brand_id = :brand_id AND p.flavor = :flavor
+    INSERT INTO products (brand_id, flavor, quantity, price)
+    VALUES (
+        (SELECT id FROM brands WHERE name = :brand_name AND category = :category),
+        :flavor, :quantity, :price
+    )
+    ON CONFLICT(brand_id, flavor) DO UPDATE SET
+        quantity = quantity + excluded.quantity;
+    """
+
+
+def select_product_by_brand_and_flavor_sql() -> str:
+    return f"""
+    SELECT {CATALOG_COLUMNS}
+    FROM catalog_view c
+    WHERE c.brand_id = :brand_id AND c.flavor = :flavor
     LIMIT 1;
     """
 
 
+def select_product_by_id_sql() -> str:
+    return f"""
+    SELECT {CATALOG_COLUMNS},
+        {_reserved_subquery("c.product_id")} AS reserved
+    FROM catalog_view c
+    WHERE c.product_id = :id;
+    """
+
+
 def select_products_by_brand_sql() -> str:
-    return """
-    SELECT 
-        p.id,
-        p.brand_id,
-        b.name as brand_name,
-        b.category,
-        p.flavor,
-        p.quantity,
-        p.price
-    FROM products p
-    JOIN brands b ON p.brand_id = b.id
-    WHERE p.brand_id = :brand_id
-    ORDER BY p.flavor;
+    return f"""
+    SELECT {CATALOG_COLUMNS},
+        {_reserved_subquery("c.product_id")} AS reserved
+    FROM catalog_view c
+    WHERE c.brand_id = :brand_id
+    ORDER BY c.flavor;
     """
 
 
 def select_all_products_sql() -> str:
+    return f"""
+    SELECT {CATALOG_COLUMNS}
+    FROM catalog_view c
+    ORDER BY c.category, c.brand_name, c.flavor;
+    """
+
+
+def select_in_stock_products_sql() -> str:
+    return f"""
+    SELECT {CATALOG_COLUMNS}
+    FROM catalog_view c
+    WHERE c.in_stock = 1
+    ORDER BY c.category, c.brand_name, c.flavor;
+    """
+
+
+def select_product_names_sql() -> str:
+    """Для индекса быстрой продажи: без остатков, только названия"""
     return """
-    SELECT 
-        p.id,
-        p.brand_id,
-        b.name as brand_name,
-        b.category,
-        p.flavor,
-        p.quantity,
-        p.price
-    FROM products p
-    JOIN brands b ON p.brand_id = b.id
-    ORDER BY b.category, b.name, p.flavor;
+    SELECT product_id as id, brand_name, category, flavor, price
+    FROM catalog_view;
     """
 
 
 def select_products_by_category_sql() -> str:
+    return f"""
+    SELECT {CATALOG_COLUMNS}
+    FROM catalog_view c
+    WHERE c.category = :category
+    ORDER BY c.brand_name, c.flavor;
+    """
+
+
+def update_product_photo_sql() -> str:
     return """
-    SELECT 
-        p.id,
-        p.brand_id,
-        b.name as brand_name,
-        b.category,
-        p.flavor,
-        p.quantity,
-        p.price
-    FROM products p
-    JOIN brands b ON p.brand_id = b.id
-    WHERE b.category = :category
-    ORDER BY b.name, p.flavor;
+    UPDATE products
+    SET photo_file_id = :photo_file_id
+    WHERE id = :id;
+    """
+
+
+def select_photos_sql() -> str:
+    """file_id всех загруженных фото: kind = 'product' / 'brand'"""
+    return """
+    SELECT 'product' AS kind, id, photo_file_id
+    FROM products
+    WHERE photo_file_id IS NOT NULL
+    UNION ALL
+    SELECT 'brand' AS kind, id, photo_file_id
+    FROM brands
+    WHERE photo_file_id IS NOT NULL;
     """
 
 
@@ -160,12 +383,41 @@ def update_product_quantity_sql() -> str:
     """
 
 
+def decrement_product_quantity_sql() -> str:
+    """sell_product_quantity_sql() для executemany (без RETURNING)"""
+    return f"""
+    UPDATE products AS p
+    SET quantity = quantity - :quantity
+    WHERE p.id = :product_id
+        AND p.quantity - {_reserved_subquery("p.id")} >= :quantity;
+    """
+
+
+def sell_product_quantity_sql() -> str:
+    """Списать проданное, только если хватает свободного (без чужих резервов) остатка"""
+    return f"""
+    UPDATE products AS p
+    SET quantity = quantity - :quantity
+    WHERE p.id = :product_id
+        AND p.quantity - {_reserved_subquery("p.id")} >= :quantity
+    RETURNING quantity;
+    """
+
+
 def delete_product_sql() -> str:
     return """
     DELETE FROM products
     WHERE id = :id;
     """
 
+def update_brand_photo_sql() -> str:
+    return """
+    UPDATE brands
+    SET photo_file_id = :photo_file_id
+    WHERE id = :id;
+    """
+
+
 def select_brand_by_id_sql() -> str:
     return """
     SELECT id, name, category
@@ -182,6 +434,21 @@ def insert_sale_sql() -> str:
     """
 
 
+def insert_sale_group_sql() -> str:
+    return """
+    INSERT INTO sale_groups (admin_id, total, created_at)
+    VALUES (:admin_id, :total, :created_at)
+    RETURNING id;
+    """
+
+
+def insert_grouped_sale_sql() -> str:
+    return """
+    INSERT INTO sales (product_id, admin_id, quantity, price, sale_date, group_id)
+    VALUES (:product_id, :admin_id, :quantity, :price, :sale_date, :group_id);
+    """
+
+
 def select_all_sales_sql() -> str:
     return """
     SELECT 
@@ -193,7 +460,8 @@ def select_all_sales_sql() -> str:
         s.admin_id,
         s.quantity,
         s.price,
-        s.sale_date
+        s.sale_date,
+        s.group_id
     FROM sales s
     JOIN products p ON s.product_id = p.id
     JOIN brands b ON p.brand_id = b.id
@@ -212,10 +480,175 @@ def select_sales_by_date_range_sql() -> str:
         s.admin_id,
         s.quantity,
         s.price,
-        s.sale_date
+        s.sale_date,
+        s.group_id
     FROM sales s
     JOIN products p ON s.product_id = p.id
     JOIN brands b ON p.brand_id = b.id
     WHERE s.sale_date BETWEEN :start_date AND :end_date
     ORDER BY s.sale_date DESC;
-    """
\ No newline at end of file
+    """
+
+
+# ===== RESERVATIONS =====
+
+def insert_reservation_sql() -> str:
+    """Резерв, только если свободного остатка хватает (проверка и вставка - один запрос)"""
+    return f"""
+    INSERT INTO reservations (product_id, admin_id, quantity, expires_at)
+    SELECT p.id, :admin_id, :quantity, datetime('now', :ttl)
+    FROM products p
+    WHERE p.id = :product_id
+        AND p.quantity - {_reserved_subquery("p.id")} >= :quantity
+    RETURNING id;
+    """
+
+
+def delete_reservation_sql() -> str:
+    return """
+    DELETE FROM reservations
+    WHERE id = :id;
+    """
+
+
+def delete_expired_reservations_sql() -> str:
+    return """
+    DELETE FROM reservations
+    WHERE expires_at <= CURRENT_TIMESTAMP;
+    """
+
+
+# ===== STOCKTAKE =====
+
+def create_stocktake_counts_sql() -> str:
+    """
+    Временная таблица пересчёта (своя у соединения, на диск не пишется)
+
+    session_id - админ, который ведёт инвентаризацию; product_id
+    заполняется при загрузке по уникальным индексам brands и products.
+    """
+    return """
+    CREATE TEMP TABLE IF NOT EXISTS stocktake_counts (
+        session_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        brand TEXT NOT NULL,
+        flavor TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        product_id INTEGER
+    );
+    """
+
+
+def create_stocktake_counts_index_sql() -> str:
+    return """
+    CREATE INDEX IF NOT EXISTS temp.idx_stocktake_counts_session
+        ON stocktake_counts(session_id, product_id);
+    """
+
+
+def insert_stocktake_count_sql() -> str:
+    return """
+    INSERT INTO stocktake_counts (session_id, category, brand, flavor, quantity)
+    VALUES (:session_id, :category, :brand, :flavor, :quantity);
+    """
+
+
+def count_stocktake_rows_sql() -> str:
+    return """
+    SELECT COUNT(*) AS lines
+    FROM stocktake_counts
+    WHERE session_id = :session_id;
+    """
+
+
+def resolve_stocktake_products_sql() -> str:
+    return """
+    UPDATE stocktake_counts
+    SET product_id = (
+        SELECT p.id
+        FROM brands b
+        JOIN products p ON p.brand_id = b.id AND p.flavor = stocktake_counts.flavor
+        WHERE b.name = stocktake_counts.brand AND b.category = stocktake_counts.category
+    )
+    WHERE session_id = :session_id;
+    """
+
+
+def select_stocktake_diff_sql() -> str:
+    """Строки пересчёта, где остаток расходится с базой или товар не найден"""
+    return """
+    SELECT
+        c.category,
+        c.brand,
+        c.flavor,
+        c.quantity AS counted,
+        p.id AS product_id,
+        p.quantity AS current
+    FROM stocktake_counts c
+    LEFT JOIN products p ON p.id = c.product_id
+    WHERE c.session_id = :session_id
+      AND (p.id IS NULL OR p.quantity != c.quantity)
+    ORDER BY c.category, c.brand, c.flavor;
+    """
+
+
+def select_stocktake_missing_sql() -> str:
+    """Товары с остатком, которых нет в пересчёте"""
+    return """
+    SELECT COUNT(*) AS missing, COALESCE(SUM(p.quantity), 0) AS quantity
+    FROM products p
+    WHERE p.quantity != 0
+      AND NOT EXISTS (
+        SELECT 1 FROM stocktake_counts c
+        WHERE c.session_id = :session_id AND c.product_id = p.id
+      );
+    """
+
+
+def insert_stocktake_sql() -> str:
+    return """
+    INSERT INTO stocktakes (admin_id)
+    VALUES (:admin_id)
+    RETURNING id;
+    """
+
+
+def insert_stock_adjustments_sql() -> str:
+    """Корректировки по пересчитанным товарам (дубли строк уже сложены)"""
+    return """
+    INSERT INTO stock_adjustments (stocktake_id, product_id, old_quantity, new_quantity)
+    SELECT :stocktake_id, p.id, p.quantity, c.quantity
+    FROM stocktake_counts c
+    JOIN products p ON p.id = c.product_id
+    WHERE c.session_id = :session_id AND p.quantity != c.quantity;
+    """
+
+
+def insert_missing_adjustments_sql() -> str:
+    """Обнуление товаров, которых нет в пересчёте"""
+    return """
+    INSERT INTO stock_adjustments (stocktake_id, product_id, old_quantity, new_quantity)
+    SELECT :stocktake_id, p.id, p.quantity, 0
+    FROM products p
+    WHERE p.quantity != 0
+      AND NOT EXISTS (
+        SELECT 1 FROM stocktake_counts c
+        WHERE c.session_id = :session_id AND c.product_id = p.id
+      );
+    """
+
+
+def apply_stock_adjustments_sql() -> str:
+    return """
+    UPDATE products
+    SET quantity = a.new_quantity
+    FROM stock_adjustments a
+    WHERE a.stocktake_id = :stocktake_id AND a.product_id = products.id;
+    """
+
+
+def delete_stocktake_counts_sql() -> str:
+    return """
+    DELETE FROM stocktake_counts
+    WHERE session_id = :session_id;
+    """
@@ -1,45 +1,167 @@
+import logging
 import os
 from dataclasses import dataclass
+from pathlib import Path
 from typing import List
 
-from dotenv import load_dotenv, find_dotenv
+from dotenv import load_dotenv
+
+
+# .env лежит в корне проекта - без обхода директорий через find_dotenv()
+ENV_FILE = Path(__file__).resolve().parents[2] / ".env"
+
 
-load_dotenv(find_dotenv())
 @dataclass
 class BotConfig:
     """Конфигурация бота"""
     BOT_TOKEN: str
     admin_ids: List[int]
-    
+    updates_concurrency: int = 32
+    shutdown_timeout: float = 25.0
+    record_updates_dir: str | None = None
+    record_redact_text: bool = False
+    query_budget_mode: str = "off"
+    slow_query_ms: float = 100.0
+    log_level: str = "INFO"
+    log_json: bool = False
+    log_sample_rate: float = 1.0
+    webhook_url: str | None = None
+    webhook_path: str = "/webhook"
+    webhook_secret: str | None = None
+    web_host: str = "0.0.0.0"
+    web_port: int = 8080
+    workers: int = 1
+    reservation_ttl: int = 600
+    debug_commands: bool = False
+    page_char_budget: int = 3500
+
     @classmethod
     def from_env(cls):
         """Загрузка конфигурации из переменных окружения"""
         token = os.getenv("BOT_TOKEN")
         if not token:
             raise ValueError("BOT_TOKEN not found in environment variables")
-        
+
         # Получаем список ID админов из переменной окружения
         admin_ids_str = os.getenv("ADMIN_IDS", "")
         admin_ids = [
-            int(id.strip()) 
-            for id in admin_ids_str.split(",") 
+            int(id.strip())
+            for id in admin_ids_str.split(",")
             if id.strip().isdigit()
         ]
-        
+
         if not admin_ids:
             print("⚠️ Warning: No admin IDs configured")
-        
+
+        # Сколько апдейтов разных чатов обрабатывать одновременно
+        concurrency_str = os.getenv("UPDATES_CONCURRENCY", "")
+        updates_concurrency = int(concurrency_str) if concurrency_str.isdigit() else 32
+
+        # Сколько секунд ждать незавершённые апдейты при остановке
+        timeout_str = os.getenv("SHUTDOWN_TIMEOUT", "").strip()
+        try:
+            shutdown_timeout = float(timeout_str) if timeout_str else 25.0
+            if not 0 <= shutdown_timeout < float("inf"):
+                raise ValueError(timeout_str)
+        except ValueError:
+            print(f"⚠️ Warning: invalid SHUTDOWN_TIMEOUT '{timeout_str}', using 25")
+            shutdown_timeout = 25.0
+
+        # Запись апдейтов для последующего воспроизведения (выключена, если пусто)
+        record_updates_dir = os.getenv("RECORD_UPDATES_DIR") or None
+        record_redact_text = os.getenv("RECORD_REDACT_TEXT", "").lower() in ("1", "true", "yes")
+
+        # Проверка числа запросов на апдейт: off / warn / strict (для CI)
+        query_budget_mode = os.getenv("QUERY_BUDGET_MODE", "off").lower()
+        if query_budget_mode not in ("off", "warn", "strict"):
+            print(f"⚠️ Warning: unknown QUERY_BUDGET_MODE '{query_budget_mode}', using 'off'")
+            query_budget_mode = "off"
+
+        # Запросы медленнее порога (мс) логируются вместе с планом
+        slow_query_str = os.getenv("SLOW_QUERY_MS", "").strip()
+        try:
+            slow_query_ms = float(slow_query_str) if slow_query_str else 100.0
+            if not 0 <= slow_query_ms < float("inf"):
+                raise ValueError(slow_query_str)
+        except ValueError:
+            print(f"⚠️ Warning: invalid SLOW_QUERY_MS '{slow_query_str}', using 100")
+            slow_query_ms = 100.0
+
+        # Логи: уровень, JSON-вывод и доля частых INFO-сообщений (1 - все)
+        log_level = os.getenv("LOG_LEVEL", "INFO").strip().upper()
+        if log_level not in logging.getLevelNamesMapping():
+            print(f"⚠️ Warning: unknown LOG_LEVEL '{log_level}', using 'INFO'")
+            log_level = "INFO"
+        log_json = os.getenv("LOG_JSON", "").lower() in ("1", "true", "yes")
+        try:
+            log_sample_rate = min(max(float(os.getenv("LOG_SAMPLE_RATE", "1")), 0.0), 1.0)
+        except ValueError:
+            log_sample_rate = 1.0
+
+        # Webhook вместо polling (если задан публичный адрес) и число процессов
+        webhook_url = (os.getenv("WEBHOOK_URL") or "").rstrip("/") or None
+        webhook_path = "/" + os.getenv("WEBHOOK_PATH", "/webhook").strip("/")
+        webhook_secret = os.getenv("WEBHOOK_SECRET") or None
+        web_host = os.getenv("WEB_HOST", "0.0.0.0")
+        # Render и похожие платформы передают порт в PORT
+        port_str = os.getenv("WEB_PORT") or os.getenv("PORT", "")
+        web_port = int(port_str) if port_str.isdigit() else 8080
+        workers_str = os.getenv("WORKERS", "")
+        workers = int(workers_str) if workers_str.isdigit() else 1
+
+        # Сколько секунд держится резерв товара в незавершённой продаже
+        ttl_str = os.getenv("RESERVATION_TTL", "")
+        reservation_ttl = int(ttl_str) if ttl_str.isdigit() else 600
+
+        # /debug_mem и /debug_prof для админов (выключены - роутер не подключается)
+        debug_commands = os.getenv("DEBUG_COMMANDS", "").lower() in ("1", "true", "yes")
+
+        # Сколько символов текста на страницу каталога (лимит Telegram - 4096)
+        budget_str = os.getenv("PAGE_CHAR_BUDGET", "")
+        page_char_budget = int(budget_str) if budget_str.isdigit() else 3500
+
         return cls(
             BOT_TOKEN=token,
-            admin_ids=admin_ids
+            admin_ids=admin_ids,
+            updates_concurrency=max(updates_concurrency, 1),
+            shutdown_timeout=shutdown_timeout,
+            record_updates_dir=record_updates_dir,
+            record_redact_text=record_redact_text,
+            query_budget_mode=query_budget_mode,
+            slow_query_ms=slow_query_ms,
+            log_level=log_level,
+            log_json=log_json,
+            log_sample_rate=log_sample_rate,
+            webhook_url=webhook_url,
+            webhook_path=webhook_path,
+            webhook_secret=webhook_secret,
+            web_host=web_host,
+            web_port=web_port,
+            workers=max(workers, 1),
+            reservation_ttl=max(reservation_ttl, 30),
+            debug_commands=debug_commands,
+            page_char_budget=min(max(page_char_budget, 500), 4000)
         )
 
 
-try:
-    bot_config = BotConfig.from_env()
-except ValueError as e:
-    print(f"❌ Configuration error: {e}")
-    print("💡 Please set BOT_TOKEN environment variable")
-    print("💡 Example: export BOT_TOKEN='your_token_here'")
-    print("💡 Example: export ADMIN_IDS='123456789,987654321'")
-    exit(1)
\ No newline at end of file
+_config: BotConfig | None = None
+
+
+def load_config() -> BotConfig:
+    """Загрузить конфигурацию при первом обращении (ValueError - если её нет)"""
+    global _config
+    if _config is None:
+        if ENV_FILE.is_file():
+            load_dotenv(ENV_FILE)
+        _config = BotConfig.from_env()
+    return _config
+
+
+class _LazyConfig:
+    """Прокси к конфигурации: импорт модуля ничего не читает и не завершает процесс"""
+
+    def __getattr__(self, name: str):
+        return getattr(load_config(), name)
+
+
+bot_config = _LazyConfig()
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_key(update: Update) -> Hashable:
+    """Ключ полосы: id чата, иначе id пользователя, иначе сам апдейт"""
+    event = update.event
+    chat = getattr(event, "chat", None)
+    if chat is None:
+        # CallbackQuery: чат берём из сообщения с кнопками
+        chat = getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    return ("update", update.update_id)
+
+
+def raw_update_chat_key(payload: dict) -> int:
+    """
+    update_chat_key() для сырого JSON апдейта (без разбора в модели)
+
+    Нужен супервизору webhook: по ключу апдейты одного чата всегда
+    уходят в один и тот же воркер.
+    """
+    for event in payload.values():
+        if not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat is not None:
+            return chat["id"]
+        user = event.get("from")
+        if user is not None:
+            return user["id"]
+    return payload.get("update_id", 0)
+
+
+class ChatLanes:
+    """
+    Последовательные полосы по ключу чата поверх общего семафора
+
+    Задачи одного чата выполняются строго по порядку поступления,
+    задачи разных чатов - параллельно, но не более `concurrency` сразу.
+    """
+
+    def __init__(self, concurrency: int = 32, max_pending: int = 1000):
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending = asyncio.Semaphore(max_pending)
+        self._lanes: dict[Hashable, deque[Callable[[], Awaitable[Any]]]] = {}
+        self._workers: set[asyncio.Task] = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.closed = False
+
+        self.queued = 0
+        self.in_flight = 0
+        self.processed = 0
+
+    async def submit(
+        self,
+        key: Hashable,
+        job: Callable[[], Awaitable[Any]]
+    ) -> bool:
+        """
+        Поставить задачу в полосу (ждёт, если очередь переполнена)
+
+        Returns:
+            False если полосы закрыты и задача отброшена
+        """
+        if self.closed:
+            logger.warning(f"Lanes are closed, dropping job for {key}")
+            return False
+
+        await self._pending.acquire()
+        self.queued += 1
+        self._idle.clear()
+
+        lane = self._lanes.get(key)
+        if lane is not None:
+            lane.append(job)
+            return True
+
+        self._lanes[key] = deque([job])
+        worker = asyncio.create_task(self._run_lane(key))
+        self._workers.add(worker)
+        worker.add_done_callback(self._workers.discard)
+        return True
+
+    def close(self) -> None:
+        """Перестать принимать новые задачи (уже принятые доработают)"""
+        self.closed = True
+
+    async def _run_lane(self, key: Hashable) -> None:
+        lane = self._lanes[key]
+        try:
+            while lane:
+                job = lane[0]
+                async with self._semaphore:
+                    self.queued -= 1
+                    self.in_flight += 1
+                    try:
+                        await job()
+                    except Exception as e:
+                        logger.error(f"Error in lane {key}: {e}", exc_info=True)
+                    finally:
+                        self.in_flight -= 1
+                        self.processed += 1
+                        self._pending.release()
+                lane.popleft()
+        finally:
+            del self._lanes[key]
+            if not self._lanes:
+                self._idle.set()
+
+    async def join(self, timeout: float | None = None) -> bool:
+        """Дождаться опустошения всех полос. False - если вышел таймаут"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "lanes": len(self._lanes),
+            "processed": self.processed,
+            "concurrency": self.concurrency,
+        }
+
+
+class OrderedDispatcher(Dispatcher):
+    """
+    Dispatcher с параллельной обработкой апдейтов и порядком внутри чата
+
+    Запускать с `handle_as_tasks=False`: цикл polling только раскладывает
+    апдейты по полосам, а обработка идёт в воркерах `ChatLanes`.
+    """
+
+    def __init__(
+        self,
+        *,
+        concurrency: int = 32,
+        max_pending: int = 1000,
+        **kwargs: Any
+    ):
+        super().__init__(**kwargs)
+        self.lanes = ChatLanes(concurrency=concurrency, max_pending=max_pending)
+
+    async def _process_update(
+        self,
+        bot: Bot,
+        update: Update,
+        call_answer: bool = True,
+        **kwargs: Any
+    ) -> bool:
+        process = super()._process_update
+
+        async def job() -> bool:
+            return await process(
+                bot=bot, update=update, call_answer=call_answer, **kwargs
+            )
+
+        return await self.lanes.submit(update_chat_key(update), job)
+
+    async def submit_update(self, bot: Bot, update: Update) -> asyncio.Future | None:
+        """
+        Поставить апдейт в полосу (webhook)
+
+        Returns:
+            Future, которое завершится после обработки апдейта (в том числе
+            с ошибкой в хендлере); None если полосы закрыты (идёт остановка)
+            и апдейт не принят
+        """
+        done = asyncio.get_running_loop().create_future()
+        process = super()._process_update
+
+        async def job() -> bool:
+            try:
+                return await process(bot=bot, update=update)
+            finally:
+                if not done.done():
+                    done.set_result(None)
+
+        if not await self.lanes.submit(update_chat_key(update), job):
+            return None
+        return done
@@ -1,21 +1,41 @@
-from aiogram import Router, F
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from aiogram import Bot, Router, F
 from aiogram.filters import Command
-from aiogram.types import Message
+from aiogram.types import BufferedInputFile, Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from src.bot.config import bot_config
-from src.bot.utils.parse_product import parse_batch_products, format_product_list
+from src.bot.utils.parse_product import ERRORS_TEXT_LIMIT, BatchParser, parse_batch_rows
+from src.bot.middleware import query_budget
 from src.bot.utils.logger import setup_logger
 from src.bot.utils.message import ADD_PRODUCTS_HELP
+from src.bot.utils.render import renderer
+from src.bot.utils.spreadsheet import (
+    IMPORT_CHUNK_SIZE,
+    MAX_FILE_SIZE,
+    SUPPORTED_EXTENSIONS,
+    is_header_row,
+    iter_rows,
+    read_chunk,
+)
 
-from db.crud import ProductsSQL, BrandsSQL
-from src.bot.models.base import ProductModel
+from db.crud import ProductsSQL
 
 
 router = Router()
 logger = setup_logger("add_products")
 
+# Сколько ошибок попадёт в файл-отчёт
+MAX_REPORT_ERRORS = 10_000
+# Не чаще одного редактирования прогресса за столько секунд
+PROGRESS_INTERVAL = 2.0
+
 
 class AddProductsStates(StatesGroup):
     waiting_for_products = State()
@@ -32,41 +52,28 @@ async def add_products_help(message: Message, state: FSMContext):
 
 
 @router.message(AddProductsStates.waiting_for_products, F.text)
+@query_budget(2)
 async def add_products_batch_handler(
     message: Message,
     state: FSMContext,
     products_db: ProductsSQL,
-    brands_db: BrandsSQL,
 ):
     try:
         processing_msg = await message.answer("⏳ Обрабатываю товары...")
 
-        items, errors = parse_batch_products(message.text)
+        # Дубли (категория, бренд, вкус) уже сложены парсером
+        rows, errors = parse_batch_rows(message.text, max_chars=ERRORS_TEXT_LIMIT)
 
         # Если ничего не распознали
-        if not items and errors:
+        if not rows and errors:
             await processing_msg.delete()
             return await message.answer(
                 "❌ Ошибки:\n\n" + "\n".join(errors),
                 parse_mode="HTML"
             )
 
-        products: list[ProductModel] = []
-
-        for brand, product in items:
-            # 1️⃣ Добавляем или получаем бренд
-            saved_brand = await brands_db.add_brand(brand)
-            if not saved_brand:
-                logger.error(f"Failed to save brand: {brand.name}")
-                continue
-
-            # 2️⃣ Проставляем brand_id
-            product.brand_id = saved_brand.id
-
-            products.append(product)
-
-        # 3️⃣ Добавляем товары
-        added_count = await products_db.add_products_batch(products)
+        # Бренды и товары - одной транзакцией
+        added_count = await products_db.import_products(rows)
 
         await processing_msg.delete()
 
@@ -88,4 +95,123 @@ async def add_products_batch_handler(
         await message.answer(
             "❌ Непредвиденная ошибка. Обратитесь к разработчику."
         )
-        await state.clear()
\ No newline at end of file
+        await state.clear()
+
+
+@router.message(AddProductsStates.waiting_for_products, F.document)
+async def add_products_file_handler(
+    message: Message,
+    state: FSMContext,
+    bot: Bot,
+    products_db: ProductsSQL,
+):
+    """Приём товаров из CSV/XLSX: потоковый разбор и запись пачками"""
+    document = message.document
+    filename = document.file_name or "products"
+
+    if Path(filename).suffix.lower() not in SUPPORTED_EXTENSIONS:
+        return await message.answer(
+            "❌ Поддерживаются файлы .csv и .xlsx\n"
+            "Колонки: категория, бренд, вкус, количество, цена"
+        )
+    if document.file_size and document.file_size > MAX_FILE_SIZE:
+        return await message.answer("❌ Файл больше 20 МБ - разбейте его на части")
+
+    progress_msg = await message.answer("⏳ Загружаю файл...")
+    fd, tmp_path = tempfile.mkstemp(suffix=Path(filename).suffix.lower())
+    os.close(fd)
+
+    added = 0
+    failed = 0
+    processed = 0
+    parser = BatchParser(max_errors=MAX_REPORT_ERRORS)
+    started = time.monotonic()
+    last_progress = started
+
+    try:
+        await bot.download(document, destination=tmp_path)
+
+        rows = enumerate(iter_rows(tmp_path, filename), start=1)
+        first_chunk = True
+
+        while True:
+            # Чтение и разбор файла - в потоке, цикл событий не блокируем
+            chunk = await asyncio.to_thread(read_chunk, rows, IMPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+
+            if first_chunk:
+                first_chunk = False
+                if is_header_row(chunk[0][1]):
+                    chunk = chunk[1:]
+
+            for row_num, row in chunk:
+                parser.feed(row, row_num)
+
+            # Каждая пачка - отдельная транзакция, дубли внутри неё сложены
+            items = parser.take_rows()
+            written = await products_db.import_products(items)
+            added += written
+            failed += len(items) - written
+            processed += len(chunk)
+
+            now = time.monotonic()
+            if now - last_progress >= PROGRESS_INTERVAL:
+                last_progress = now
+                await renderer.edit_text(
+                    progress_msg,
+                    f"⏳ Обработано строк: {processed}\n"
+                    f"✅ Добавлено: {added}\n"
+                    f"⚠️ Ошибок: {parser.error_count + failed}"
+                )
+
+    except ValueError as e:
+        # В том числе UnicodeDecodeError посреди файла: прошлые пачки уже в базе
+        logger.warning(f"Unsupported import file {filename} after {processed} rows, {added} added: {e}")
+        text = f"❌ Не удалось прочитать файл: {e}"
+        if processed:
+            text += (
+                f"\n\nДо ошибки обработано строк: {processed}\n"
+                f"✅ Уже добавлено позиций: {added} - при повторной отправке файла "
+                f"их количество сложится ещё раз"
+            )
+        await renderer.edit_text(progress_msg, text)
+        return
+    except Exception:
+        logger.error(f"Error importing file {filename}", exc_info=True)
+        await renderer.edit_text(
+            progress_msg,
+            f"❌ Импорт прерван. Уже добавлено: {added}\n"
+            f"Обратитесь к разработчику."
+        )
+        await state.clear()
+        return
+    finally:
+        os.remove(tmp_path)
+
+    logger.info(
+        f"Imported {filename}: {processed} rows, {added} added, "
+        f"{parser.error_count} invalid, {failed} failed in {time.monotonic() - started:.1f}s"
+    )
+
+    summary = (
+        f"{'✅' if added else '❌'} <b>Импорт {filename}</b>\n\n"
+        f"Строк обработано: {processed}\n"
+        f"Добавлено позиций: {added}\n"
+        f"⚠️ Ошибок в строках: {parser.error_count}"
+    )
+    if failed:
+        summary += f"\n❌ Не записано в базу: {failed}"
+    await renderer.edit_text(progress_msg, summary, parse_mode="HTML")
+
+    if parser.error_count:
+        report = "\n".join(parser.error_messages())
+        await message.answer_document(
+            BufferedInputFile(
+                report.encode("utf-8"),
+                filename=f"{Path(filename).stem}_errors.txt"
+            ),
+            caption=f"⚠️ Строки с ошибками: {parser.error_count}"
+        )
+
+    await state.clear()
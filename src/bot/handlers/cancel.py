@@ -3,26 +3,31 @@ from aiogram.filters import Command
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 
+from src.bot.handlers.sell_products import release_reservation
 from src.bot.utils.logger import setup_logger
 
+from db.crud import ReservationsSQL
+
 
 router = Router()
 logger = setup_logger("cancel")
 
 
 @router.message(Command("cancel"))
-async def cancel_handler(message: Message, state: FSMContext):
+async def cancel_handler(message: Message, state: FSMContext, reservations_db: ReservationsSQL):
     """Отмена текущего действия"""
     current_state = await state.get_state()
     
     if current_state is None:
-        logger.info(f"User {message.from_user.id} tried to cancel but no active state")
+        logger.info("User %s tried to cancel but no active state", message.from_user.id)
         return await message.answer(
             "ℹ️ Нет активных операций для отмены"
         )
     
+    # Незавершённая продажа держит товар в резерве - возвращаем
+    await release_reservation(state, reservations_db)
     await state.clear()
-    logger.info(f"User {message.from_user.id} cancelled state: {current_state}")
+    logger.info("User %s cancelled state: %s", message.from_user.id, current_state)
     
     await message.answer(
         "❌ Операция отменена\n\n"
@@ -1,10 +1,23 @@
+from bisect import bisect_right
+from functools import lru_cache
+
 from aiogram import Router, F
 from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import (
+    Message,
+    CallbackQuery,
+    InlineKeyboardMarkup,
+    InlineKeyboardButton,
+    InputMediaPhoto,
+)
 from aiogram.fsm.context import FSMContext
 
+from src.bot.config import bot_config
+from src.bot.middleware import ThrottlingMiddleware, query_budget
 from src.bot.models.base import ProductCategory
 from src.bot.utils.logger import setup_logger
+from src.bot.utils.photos import MEDIA_GROUP_SIZE, photo_cache
+from src.bot.utils.render import render_cache, renderer
 
 from db.crud import ProductsSQL
 
@@ -12,6 +25,20 @@ from db.crud import ProductsSQL
 router = Router()
 logger = setup_logger("catalog")
 
+# Листание и полные выборки каталога - самые тяжёлые нажатия
+router.callback_query.middleware(ThrottlingMiddleware(
+    limits={
+        "catalog_page": (3.0, 4.0),
+        "catalog_layout": (1.0, 2.0),
+        "catalog_all": (0.5, 1.0),
+        "catalog_in_stock": (0.5, 1.0),
+        "catalog_photos": (0.5, 1.0),
+    }
+))
+
+# Bot API: подпись к фото - до 1024 символов
+CAPTION_LIMIT = 1024
+
 def create_brands_keyboard(brands) -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton(
@@ -27,7 +54,7 @@ def create_brands_keyboard(brands) -> InlineKeyboardMarkup:
 
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def create_flavors_keyboard(products) -> InlineKeyboardMarkup:
+def create_flavors_keyboard(products, with_photos: bool = False) -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton(
             text=f"{p.flavor} ({p.quantity} шт)",
@@ -36,14 +63,23 @@ def create_flavors_keyboard(products) -> InlineKeyboardMarkup:
         for p in products if p.quantity > 0
     ]
 
+    if with_photos and products:
+        buttons.append([
+            InlineKeyboardButton(
+                text="🖼 Фото вкусов",
+                callback_data=f"catalog_photos:{products[0].brand_id}"
+            )
+        ])
+
     buttons.append([
         InlineKeyboardButton(text="◀️ Назад", callback_data="catalog_back_to_brands")
     ])
 
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+@lru_cache(maxsize=None)
 def create_main_catalog_keyboard() -> InlineKeyboardMarkup:
-    """Главная клавиатура каталога"""
+    """Главная клавиатура каталога (статическая, строится один раз)"""
     buttons = [
         [InlineKeyboardButton(
             text="📦 Все товары",
@@ -61,8 +97,9 @@ def create_main_catalog_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+@lru_cache(maxsize=None)
 def create_categories_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура с категориями"""
+    """Клавиатура с категориями (статическая, строится один раз)"""
     buttons = []
     
     category_emojis = {
@@ -88,6 +125,23 @@ def create_categories_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+def create_product_card_keyboard(product, is_admin: bool, with_photo: bool) -> InlineKeyboardMarkup:
+    """Клавиатура карточки: у фото - «Закрыть», у текста - назад к вкусам"""
+    buttons = []
+    if is_admin:
+        buttons.append([
+            InlineKeyboardButton(text="📷 Фото товара", callback_data=f"photo_set:product:{product.id}"),
+            InlineKeyboardButton(text="📷 Фото бренда", callback_data=f"photo_set:brand:{product.brand_id}"),
+        ])
+    if with_photo:
+        buttons.append([InlineKeyboardButton(text="❌ Закрыть", callback_data="catalog_close")])
+    else:
+        buttons.append([
+            InlineKeyboardButton(text="◀️ Назад", callback_data=f"catalog_brand:{product.brand_id}")
+        ])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
 def format_product_info(product, show_full: bool = True) -> str:
     """Форматирование информации о товаре"""
     stock_emoji = "✅" if product.quantity > 0 else "❌"
@@ -104,12 +158,25 @@ def format_product_info(product, show_full: bool = True) -> str:
         return f"{stock_emoji} <b>{product.brand_name} - {product.flavor}</b> — {product.price}₽ ({stock_text})"
 
 
+def format_compact_line(product) -> str:
+    """Строка вкуса под заголовком бренда (компактный вид)"""
+    stock_emoji = "✅" if product.quantity > 0 else "❌"
+    stock_text = f"{product.quantity} шт" if product.quantity > 0 else "нет"
+    return f"  {stock_emoji} {product.flavor} — {product.price}₽ ({stock_text})"
+
+
+def format_brand_header(product) -> str:
+    category = product.category.value if product.category else "N/A"
+    return f"<b>{product.brand_name}</b> · {category}"
+
+
 def create_pagination_keyboard(
     current_page: int,
     total_pages: int,
-    prefix: str = "catalog"
+    prefix: str = "catalog",
+    layout: str | None = None
 ) -> InlineKeyboardMarkup:
-    """Клавиатура с пагинацией"""
+    """Клавиатура с пагинацией (layout - показать переключатель вида)"""
     buttons = []
     
     # Кнопки навигации
@@ -133,6 +200,12 @@ def create_pagination_keyboard(
     
     if nav_buttons:
         buttons.append(nav_buttons)
+
+    if layout is not None:
+        other, text = ("full", "📄 Подробно") if layout == "compact" else ("compact", "🗂 Компактно")
+        buttons.append([
+            InlineKeyboardButton(text=text, callback_data=f"catalog_layout:{other}:{current_page}")
+        ])
     
     # Кнопка назад
     buttons.append([
@@ -145,7 +218,7 @@ def create_pagination_keyboard(
 @router.message(Command("catalog"))
 async def catalog_start(message: Message):
     """Начало просмотра каталога"""
-    logger.info(f"User {message.from_user.id} opened catalog")
+    logger.info("User %s opened catalog", message.from_user.id)
     
     await message.answer(
         "🛍 <b>Каталог товаров</b>\n\n"
@@ -158,7 +231,8 @@ async def catalog_start(message: Message):
 @router.callback_query(F.data == "catalog_back")
 async def catalog_back(callback: CallbackQuery):
     """Возврат в главное меню каталога"""
-    await callback.message.edit_text(
+    await renderer.edit_text(
+        callback.message,
         "🛍 <b>Каталог товаров</b>\n\n"
         "Выберите способ просмотра:",
         reply_markup=create_main_catalog_keyboard(),
@@ -170,7 +244,8 @@ async def catalog_back(callback: CallbackQuery):
 @router.callback_query(F.data == "catalog_categories")
 async def show_categories(callback: CallbackQuery):
     """Показать категории"""
-    await callback.message.edit_text(
+    await renderer.edit_text(
+        callback.message,
         "📂 <b>Выберите категорию:</b>",
         reply_markup=create_categories_keyboard(),
         parse_mode="HTML"
@@ -179,53 +254,66 @@ async def show_categories(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "catalog_all")
+@query_budget(1)
 async def show_all_products(
     callback: CallbackQuery,
     products_db: ProductsSQL,
     state: FSMContext
 ):
     """Показать все товары"""
-    products = await products_db.get_all()
+    version, products = await load_products(products_db, "all")
     
     if not products:
         await callback.answer("📭 Каталог пуст", show_alert=True)
         return
     
-    # Сохраняем список товаров в state для пагинации
-    await state.update_data(
-        current_products=products,
-        view_mode="all"
-    )
+    # В state только режим - сами товары берутся из кеша каталога
+    await state.update_data(view_mode="all")
     
-    await show_products_page(callback.message, products, 1, "Все товары")
+    layout = (await state.get_data()).get("layout", "full")
+    await show_products_page(callback.message, version, products, "all", 1, layout)
     await callback.answer()
 
 
 @router.callback_query(F.data == "catalog_in_stock")
+@query_budget(1)
 async def show_in_stock(
     callback: CallbackQuery,
     products_db: ProductsSQL,
     state: FSMContext
 ):
     """Показать товары в наличии"""
-    all_products = await products_db.get_all()
-    products = [p for p in all_products if p.quantity > 0]
+    version, products = await load_products(products_db, "in_stock")
     
     if not products:
         await callback.answer("📭 Нет товаров в наличии", show_alert=True)
         return
     
-    await state.update_data(
-        current_products=products,
-        view_mode="in_stock"
-    )
+    await state.update_data(view_mode="in_stock")
     
-    await show_products_page(callback.message, products, 1, "Товары в наличии")
+    layout = (await state.get_data()).get("layout", "full")
+    await show_products_page(callback.message, version, products, "in_stock", 1, layout)
     await callback.answer()
 
 from db.crud import BrandsSQL
 
+
+async def load_brands_keyboard(
+    brands_db: BrandsSQL,
+    category: str
+) -> InlineKeyboardMarkup | None:
+    """Клавиатура брендов категории (None - брендов нет)"""
+    async def load() -> InlineKeyboardMarkup | None:
+        brands = await brands_db.get_brands_by_category(category)
+        return create_brands_keyboard(brands) if brands else None
+
+    return await render_cache.get_or_load(
+        brands_db.db.catalog_version, ("catalog_brands", category), load
+    )
+
+
 @router.callback_query(F.data.startswith("catalog_cat:"))
+@query_budget(1)
 async def show_category_brands(
     callback: CallbackQuery,
     brands_db: BrandsSQL,
@@ -233,9 +321,9 @@ async def show_category_brands(
 ):
     category = callback.data.split(":")[1]
 
-    brands = await brands_db.get_brands_by_category(category)
+    keyboard = await load_brands_keyboard(brands_db, category)
 
-    if not brands:
+    if not keyboard:
         return await callback.answer(
             "📭 В этой категории нет брендов",
             show_alert=True
@@ -245,45 +333,145 @@ async def show_category_brands(
         selected_category=category
     )
 
-    await callback.message.edit_text(
+    await renderer.edit_text(
+        callback.message,
         f"🏷 <b>Бренды в категории:</b>",
-        reply_markup=create_brands_keyboard(brands),
+        reply_markup=keyboard,
         parse_mode="HTML"
     )
     await callback.answer()
 
 @router.callback_query(F.data.startswith("catalog_brand:"))
+@query_budget(2)
 async def show_brand_flavors(
     callback: CallbackQuery,
     products_db: ProductsSQL,
-    brands_db: BrandsSQL,
     state: FSMContext
 ):
     brand_id = int(callback.data.split(":")[1])
 
-    products = await products_db.get_products_by_brand(brand_id)
-    products = [p for p in products if p.quantity > 0]
+    async def load() -> tuple[str, InlineKeyboardMarkup] | None:
+        products = await products_db.get_products_by_brand(brand_id)
+        products = [p for p in products if p.quantity > 0]
+        if not products:
+            return None
+        photos = await photo_cache.load(products_db)
+        return (
+            f"🧾 <b>{products[0].brand_name}</b>\nВыберите вкус:",
+            create_flavors_keyboard(
+                products,
+                with_photos=any(photos.for_product(p) for p in products)
+            )
+        )
+
+    rendered = await render_cache.get_or_load(
+        products_db.db.catalog_version, ("catalog_flavors", brand_id), load
+    )
 
-    if not products:
+    if not rendered:
         return await callback.answer(
             "📭 У этого бренда нет товаров в наличии",
             show_alert=True
         )
 
-    brand = await brands_db.get_brand_by_id(brand_id)
-
     await state.update_data(
         selected_brand_id=brand_id
     )
 
-    await callback.message.edit_text(
-        f"🧾 <b>{brand.name}</b>\nВыберите вкус:",
-        reply_markup=create_flavors_keyboard(products),
+    text, keyboard = rendered
+    await renderer.edit_text(
+        callback.message,
+        text,
+        reply_markup=keyboard,
         parse_mode="HTML"
     )
     await callback.answer()
 
+@router.callback_query(F.data.startswith("catalog_product:"))
+@query_budget(2)
+async def show_product_card(callback: CallbackQuery, products_db: ProductsSQL):
+    """Карточка товара: фото с подписью, если фото загружено"""
+    product_id = int(callback.data.split(":")[1])
+    product = await products_db.get_product(product_id)
+    if not product:
+        return await callback.answer("⚠️ Товар не найден", show_alert=True)
+
+    photos = await photo_cache.load(products_db)
+    file_id = photos.for_product(product)
+    is_admin = callback.from_user.id in bot_config.admin_ids
+    keyboard = create_product_card_keyboard(product, is_admin, with_photo=file_id is not None)
+
+    if file_id:
+        # Фото уже в Telegram - отправляется по file_id, без загрузки байтов
+        await callback.message.answer_photo(
+            file_id,
+            caption=format_product_info(product),
+            reply_markup=keyboard,
+            parse_mode="HTML"
+        )
+    else:
+        await renderer.edit_text(
+            callback.message,
+            format_product_info(product),
+            reply_markup=keyboard,
+            parse_mode="HTML"
+        )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("catalog_photos:"))
+@query_budget(2)
+async def show_brand_photos(callback: CallbackQuery, products_db: ProductsSQL):
+    """Карточки вкусов бренда альбомами (send_media_group по 10 фото)"""
+    brand_id = int(callback.data.split(":")[1])
+    products = [p for p in await products_db.get_products_by_brand(brand_id) if p.quantity > 0]
+    photos = await photo_cache.load(products_db)
+
+    media = [
+        InputMediaPhoto(
+            media=photos.product(p.id),
+            caption=format_product_info(p, show_full=False),
+            parse_mode="HTML"
+        )
+        for p in products if photos.product(p.id)
+    ]
+    if not media and products and photos.brand(brand_id):
+        # Своих фото у вкусов нет - одно фото бренда со списком вкусов
+        caption = ""
+        for p in products:
+            line = format_product_info(p, show_full=False)
+            if len(caption) + len(line) + 1 > CAPTION_LIMIT:
+                break
+            caption = f"{caption}\n{line}" if caption else line
+        media = [InputMediaPhoto(media=photos.brand(brand_id), caption=caption, parse_mode="HTML")]
+    if not media:
+        return await callback.answer("📭 У этих товаров нет фото", show_alert=True)
+
+    await callback.answer()
+    for start in range(0, len(media), MEDIA_GROUP_SIZE):
+        chunk = media[start:start + MEDIA_GROUP_SIZE]
+        if len(chunk) == 1:
+            # Альбом - от 2 фото
+            await callback.message.answer_photo(
+                chunk[0].media, caption=chunk[0].caption, parse_mode="HTML"
+            )
+        else:
+            await callback.bot.send_media_group(callback.message.chat.id, media=chunk)
+
+
+@router.callback_query(F.data == "catalog_close")
+async def close_card(callback: CallbackQuery):
+    """Убрать карточку-фото из чата"""
+    renderer.forget(callback.message)
+    try:
+        await callback.message.delete()
+    except Exception as e:
+        logger.error(f"Error deleting card: {e}")
+    await callback.answer()
+
+
 @router.callback_query(F.data == "catalog_back_to_brands")
+@query_budget(1)
 async def back_to_brands(
     callback: CallbackQuery,
     brands_db: BrandsSQL,
@@ -295,82 +483,207 @@ async def back_to_brands(
     if not category:
         return await callback.answer()
 
-    brands = await brands_db.get_brands_by_category(category)
+    keyboard = await load_brands_keyboard(brands_db, category)
 
-    await callback.message.edit_text(
+    await renderer.edit_text(
+        callback.message,
         "🏷 <b>Бренды:</b>",
-        reply_markup=create_brands_keyboard(brands),
+        reply_markup=keyboard or create_brands_keyboard([]),
         parse_mode="HTML"
     )
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("catalog_page:"))
+@query_budget(1)
 async def handle_pagination(
     callback: CallbackQuery,
+    products_db: ProductsSQL,
     state: FSMContext
 ):
     """Обработка пагинации"""
     page = int(callback.data.split(":")[1])
     data = await state.get_data()
     
-    products = data.get("current_products", [])
-    view_mode = data.get("view_mode", "all")
+    view_mode = data.get("view_mode")
     
-    if not products:
+    if not view_mode:
         await callback.answer("Нет данных", show_alert=True)
         return
     
-    # Определяем заголовок
+    version, products = await load_products(products_db, view_mode)
+    await show_products_page(
+        callback.message, version, products, view_mode, page, data.get("layout", "full")
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("catalog_layout:"))
+@query_budget(1)
+async def switch_layout(
+    callback: CallbackQuery,
+    products_db: ProductsSQL,
+    state: FSMContext
+):
+    """Подробный / компактный вид: остаёмся на странице с тем же первым товаром"""
+    _, layout, page = callback.data.split(":")
+    layout = "compact" if layout == "compact" else "full"
+    data = await state.get_data()
+
+    view_mode = data.get("view_mode")
+    if not view_mode:
+        await callback.answer("Нет данных", show_alert=True)
+        return
+
+    # Обе раскладки - по одному и тому же списку, иначе индексы разойдутся
+    version, products = await load_products(products_db, view_mode)
+    _, old_starts = get_page_starts(version, products, view_mode, data.get("layout", "full"))
+    _, starts = get_page_starts(version, products, view_mode, layout)
+    first = old_starts[min(max(int(page), 1), len(old_starts)) - 1]
+    new_page = bisect_right(starts, first)
+
+    await state.update_data(layout=layout)
+    await show_products_page(callback.message, version, products, view_mode, new_page, layout)
+    await callback.answer()
+
+
+def view_title(view_mode: str) -> str:
+    """Заголовок страницы для режима просмотра"""
     if view_mode == "all":
-        title = "Все товары"
+        return "Все товары"
     elif view_mode == "in_stock":
-        title = "Товары в наличии"
+        return "Товары в наличии"
     elif view_mode.startswith("category:"):
         category = view_mode.split(":")[1]
-        title = f"Категория: {category.capitalize()}"
-    else:
-        title = "Каталог"
-    
-    await show_products_page(callback.message, products, page, title)
-    await callback.answer()
+        return f"Категория: {category.capitalize()}"
+    return "Каталог"
+
+
+async def load_products(products_db: ProductsSQL, view_mode: str) -> tuple[int, list]:
+    """
+    Товары режима просмотра (один запрос на версию каталога)
+
+    Версия возвращается вместе со списком: всё, что строится из него
+    дальше, кешируется под ней же - продажа посреди апдейта не вызовет
+    повторный запрос.
+    """
+    version = products_db.db.catalog_version
+
+    async def load() -> list:
+        if view_mode.startswith("category:"):
+            return await products_db.get_by_category(view_mode.split(":")[1])
+        if view_mode == "in_stock":
+            return await products_db.get_in_stock()
+        return await products_db.get_all()
+
+    products = await render_cache.get_or_load(version, ("products", view_mode), load)
+    return version, products
+
+
+def page_entries(products: list, layout: str) -> list[tuple[str | None, str]]:
+    """(заголовок группы, строка) для каждого товара"""
+    if layout == "compact":
+        return [(format_brand_header(p), format_compact_line(p)) for p in products]
+    return [
+        (None, f"{i}. {format_product_info(p, show_full=False)}")
+        for i, p in enumerate(products, start=1)
+    ]
+
+
+def page_starts(entries: list[tuple[str | None, str]], budget: int) -> list[int]:
+    """
+    Индексы первых строк страниц: на страницу - сколько строк влезает в `budget`
+
+    Заголовок группы считается там, где группа начинается, и в начале
+    каждой страницы (там он повторяется). Строка длиннее бюджета всё
+    равно получает свою страницу.
+    """
+    starts = [0]
+    used = 0
+    group = None
+    for i, (header, line) in enumerate(entries):
+        cost = len(line) + 1
+        if header is not None and (header != group or used == 0):
+            cost += len(header) + 2
+        if used and used + cost > budget:
+            starts.append(i)
+            used = len(line) + 1 + (len(header) + 2 if header is not None else 0)
+        else:
+            used += cost
+        group = header
+    return starts
+
+
+def page_header(title: str, total: int) -> str:
+    return f"🛍 <b>{title}</b>\nВсего товаров: {total}\n"
+
+
+def get_page_starts(
+    version: int,
+    products: list,
+    view_mode: str,
+    layout: str
+) -> tuple[list[tuple[str | None, str]], list[int]]:
+    """Строки товаров и границы страниц - один расчёт на (режим, вид, версию каталога)"""
+    def build():
+        entries = page_entries(products, layout)
+        budget = bot_config.page_char_budget - len(page_header(view_title(view_mode), len(products)))
+        return entries, page_starts(entries, budget)
+
+    return render_cache.get_or_build(version, ("page_starts", view_mode, layout), build)
+
+
+def render_products_page(
+    products: list,
+    entries: list[tuple[str | None, str]],
+    starts: list[int],
+    page: int,
+    title: str,
+    layout: str
+) -> tuple[str, InlineKeyboardMarkup]:
+    """Текст и клавиатура страницы товаров"""
+    total_pages = len(starts)
+    page = min(max(page, 1), total_pages)
+    start = starts[page - 1]
+    end = starts[page] if page < total_pages else len(entries)
+
+    text_parts = [page_header(title, len(products))]
+    group = None
+    for header, line in entries[start:end]:
+        if header is not None and header != group:
+            # Пустая строка между группами, но не сразу под шапкой
+            text_parts.append(f"\n{header}" if group is not None else header)
+            group = header
+        text_parts.append(line)
+
+    return "\n".join(text_parts), create_pagination_keyboard(page, total_pages, layout=layout)
 
 
 async def show_products_page(
     message: Message,
+    version: int,
     products: list,
+    view_mode: str,
     page: int,
-    title: str
+    layout: str = "full"
 ):
-    """Показать страницу товаров"""
-    ITEMS_PER_PAGE = 10
-    total_pages = (len(products) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
-    
-    # Проверка границ
-    if page < 1:
-        page = 1
-    elif page > total_pages:
-        page = total_pages
-    
-    # Получаем товары для текущей страницы
-    start_idx = (page - 1) * ITEMS_PER_PAGE
-    end_idx = start_idx + ITEMS_PER_PAGE
-    page_products = products[start_idx:end_idx]
-    
-    # Формируем текст
-    text_parts = [f"🛍 <b>{title}</b>"]
-    text_parts.append(f"Всего товаров: {len(products)}\n")
-    
-    for i, product in enumerate(page_products, start=start_idx + 1):
-        text_parts.append(f"{i}. {format_product_info(product, show_full=False)}")
-    
-    text = "\n".join(text_parts)
+    """Показать страницу товаров из списка, загруженного load_products под `version`"""
+    entries, starts = get_page_starts(version, products, view_mode, layout)
+
+    text, keyboard = render_cache.get_or_build(
+        version,
+        ("page", view_mode, layout, page),
+        lambda: render_products_page(
+            products, entries, starts, page, view_title(view_mode), layout
+        )
+    )
     
     # Показываем
     try:
-        await message.edit_text(
+        await renderer.edit_text(
+            message,
             text,
-            reply_markup=create_pagination_keyboard(page, total_pages),
+            reply_markup=keyboard,
             parse_mode="HTML"
         )
     except Exception as e:
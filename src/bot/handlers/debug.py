@@ -0,0 +1,221 @@
+"""
+Отладка на живом боте: /debug_mem и /debug_prof (только админы)
+
+Роутер подключается, только если DEBUG_COMMANDS включён. tracemalloc и
+профилировщик запускаются командой и работают только пока нужны, так что
+без вызова команд накладных расходов нет.
+"""
+import asyncio
+import cProfile
+import gc
+import html
+import io
+import pstats
+import resource
+import sys
+import time
+import tracemalloc
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import BufferedInputFile, Message
+
+from src.bot.config import bot_config
+from src.bot.utils.logger import setup_logger
+
+
+router = Router()
+logger = setup_logger("debug")
+
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 15
+MAX_PROFILE_SECONDS = 300
+PROFILE_LINES = 60
+# Длиннее - отчёт уходит файлом
+MAX_MESSAGE_LENGTH = 4000
+
+_snapshot: tracemalloc.Snapshot | None = None
+_profile_task: asyncio.Task | None = None
+
+# Служебные кадры tracemalloc и импорта в отчёте не нужны
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def current_rss() -> int | None:
+    """Текущий RSS процесса (только Linux, иначе None)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def deep_sizeof(obj: object, seen: set[int] | None = None) -> int:
+    """Примерный размер объекта вместе с вложенными dict/list/tuple/set"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+def fsm_storage_report(storage: BaseStorage) -> list[str]:
+    """Сколько записей и памяти держит хранилище FSM"""
+    if not isinstance(storage, MemoryStorage):
+        return [f"FSM: {type(storage).__name__} (размер не считается)"]
+
+    records = list(storage.storage.values())
+    with_state = sum(record.state is not None for record in records)
+    with_data = sum(bool(record.data) for record in records)
+    size = deep_sizeof(storage.storage)
+    return [
+        f"FSM: {len(records)} записей, {with_state} с состоянием, "
+        f"{with_data} с данными, ~{format_size(size)}"
+    ]
+
+
+def memory_report(header: list[str]) -> str:
+    """Снимок tracemalloc и разница с прошлым вызовом"""
+    global _snapshot
+
+    rss = current_rss()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    lines = [
+        f"RSS: {format_size(rss) if rss is not None else 'n/a'}, пик {format_size(peak)}",
+        f"GC: {len(gc.get_objects())} объектов, поколения {gc.get_count()}",
+        *header,
+        "",
+    ]
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    traced, traced_peak = tracemalloc.get_traced_memory()
+    lines.append(f"tracemalloc: {format_size(traced)}, пик {format_size(traced_peak)}")
+
+    if _snapshot is not None:
+        lines.append(f"\nРост с прошлого снимка (топ {TOP_ALLOCATIONS}):")
+        for stat in snapshot.compare_to(_snapshot, "lineno")[:TOP_ALLOCATIONS]:
+            lines.append(f"{format_size(stat.size_diff):>12} {stat.count_diff:+7} {stat.traceback}")
+
+    lines.append(f"\nБольше всего памяти (топ {TOP_ALLOCATIONS}):")
+    for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+        lines.append(f"{format_size(stat.size):>12} {stat.count:7} {stat.traceback}")
+
+    _snapshot = snapshot
+    return "\n".join(lines)
+
+
+async def send_report(message: Message, text: str, filename: str) -> None:
+    """Короткий отчёт - сообщением, длинный - файлом"""
+    if len(text) <= MAX_MESSAGE_LENGTH:
+        await message.answer(f"<pre>{html.escape(text)}</pre>", parse_mode="HTML")
+    else:
+        await message.answer_document(BufferedInputFile(text.encode(), filename=filename))
+
+
+@router.message(Command("debug_mem"))
+async def debug_mem(message: Message, command: CommandObject, fsm_storage: BaseStorage):
+    """
+    /debug_mem - снимок памяти (первый вызов включает tracemalloc)
+    /debug_mem stop - выключить tracemalloc
+    """
+    global _snapshot
+
+    if message.from_user.id not in bot_config.admin_ids:
+        return await message.answer("⛔ Нет доступа")
+
+    if (command.args or "").strip() == "stop":
+        tracemalloc.stop()
+        _snapshot = None
+        logger.info(f"🧠 tracemalloc stopped by {message.from_user.id}")
+        return await message.answer("🧠 tracemalloc выключен")
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        _snapshot = None
+        logger.info(f"🧠 tracemalloc started by {message.from_user.id}")
+
+    # FSM считаем в цикле событий (его меняют хендлеры), а снимок и
+    # сравнение - синхронная работа на сотни мс - в отдельном потоке
+    report = await asyncio.to_thread(memory_report, fsm_storage_report(fsm_storage))
+    await send_report(message, report, f"mem-{int(time.time())}.txt")
+
+
+def profile_report(profile: cProfile.Profile, seconds: int) -> str:
+    buffer = io.StringIO()
+    buffer.write(f"cProfile, {seconds} s живой обработки апдейтов\n\n")
+    for sort in ("cumulative", "tottime"):
+        buffer.write(f"===== sort by {sort} =====\n")
+        pstats.Stats(profile, stream=buffer).sort_stats(sort).print_stats(PROFILE_LINES)
+    return buffer.getvalue()
+
+
+async def run_profile(message: Message, seconds: int) -> None:
+    """Профилировать цикл событий `seconds` секунд и прислать статистику файлом"""
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError as e:
+        # В 3.12 одновременно может работать только один профилировщик
+        await message.answer(f"❌ Профилировщик занят: {e}")
+        return
+
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profile.disable()
+
+    report = await asyncio.to_thread(profile_report, profile, seconds)
+    await message.answer_document(
+        BufferedInputFile(report.encode(), filename=f"prof-{int(time.time())}.txt"),
+        caption=f"⏱ Профиль за {seconds} с"
+    )
+    logger.info(f"⏱ Profile for {seconds}s sent to {message.from_user.id}")
+
+
+def _profile_done(task: asyncio.Task) -> None:
+    global _profile_task
+    _profile_task = None
+    if not task.cancelled() and task.exception():
+        logger.error(f"❌ Profiling failed: {task.exception()}")
+
+
+@router.message(Command("debug_prof"))
+async def debug_prof(message: Message, command: CommandObject):
+    """/debug_prof <секунды> - cProfile обработки апдейтов"""
+    global _profile_task
+
+    if message.from_user.id not in bot_config.admin_ids:
+        return await message.answer("⛔ Нет доступа")
+
+    args = (command.args or "10").strip()
+    if not args.isdigit() or not 1 <= int(args) <= MAX_PROFILE_SECONDS:
+        return await message.answer(f"Формат: /debug_prof <секунды, 1-{MAX_PROFILE_SECONDS}>")
+    if _profile_task is not None:
+        return await message.answer("⏳ Профилирование уже идёт")
+
+    seconds = int(args)
+    # Отдельной задачей: очередь апдейтов этого чата не ждёт окончания замера
+    _profile_task = asyncio.create_task(run_profile(message, seconds))
+    _profile_task.add_done_callback(_profile_done)
+    logger.info(f"⏱ Profiling for {seconds}s started by {message.from_user.id}")
+    await message.answer(f"⏱ Профилирую {seconds} с, пришлю файл")
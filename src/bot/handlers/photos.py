@@ -0,0 +1,102 @@
+import io
+
+from aiogram import Bot, Router, F
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import BufferedInputFile, CallbackQuery, Message
+
+from src.bot.config import bot_config
+from src.bot.middleware import query_budget
+from src.bot.utils.logger import setup_logger
+from src.bot.utils.photos import photo_cache
+
+from db.crud import BrandsSQL, ProductsSQL
+
+
+router = Router()
+logger = setup_logger("photos")
+
+# Bot API: фото (не документ) - до 10 МБ
+MAX_PHOTO_SIZE = 10 * 1024 * 1024
+
+
+class PhotoStates(StatesGroup):
+    waiting_for_photo = State()
+
+
+@router.callback_query(F.data.startswith("photo_set:"))
+async def ask_photo(callback: CallbackQuery, state: FSMContext):
+    """Кнопка на карточке товара: ждём фото товара или бренда"""
+    if callback.from_user.id not in bot_config.admin_ids:
+        return await callback.answer("⛔ Нет доступа", show_alert=True)
+
+    _, kind, object_id = callback.data.split(":")
+    await state.set_state(PhotoStates.waiting_for_photo)
+    await state.update_data(photo_kind=kind, photo_object_id=int(object_id))
+
+    target = "товара" if kind == "product" else "бренда"
+    await callback.message.answer(
+        f"📷 Пришлите фото {target} (фото или файл-картинку)\n\n/cancel - отмена"
+    )
+    await callback.answer()
+
+
+async def upload_document_photo(message: Message, bot: Bot) -> str | None:
+    """
+    Картинку, присланную файлом, один раз загрузить в Telegram как фото
+
+    Returns:
+        file_id отправленного фото, None если файл не подходит
+    """
+    document = message.document
+    if document.file_size and document.file_size > MAX_PHOTO_SIZE:
+        await message.answer("❌ Файл больше 10 МБ")
+        return None
+
+    buffer = io.BytesIO()
+    await bot.download(document, destination=buffer)
+    sent = await message.answer_photo(
+        BufferedInputFile(buffer.getvalue(), filename=document.file_name or "photo.jpg"),
+        caption="🖼 Загружено"
+    )
+    return sent.photo[-1].file_id
+
+
+@router.message(PhotoStates.waiting_for_photo, F.photo | F.document.mime_type.startswith("image/"))
+@query_budget(1)
+async def save_photo(
+    message: Message,
+    state: FSMContext,
+    bot: Bot,
+    brands_db: BrandsSQL,
+    products_db: ProductsSQL
+):
+    """Сохранить file_id фото: в базу и в память"""
+    if message.photo:
+        # Фото уже лежит в Telegram - достаточно его file_id
+        file_id = message.photo[-1].file_id
+    else:
+        file_id = await upload_document_photo(message, bot)
+        if file_id is None:
+            return
+
+    data = await state.get_data()
+    kind, object_id = data.get("photo_kind"), data.get("photo_object_id")
+    if kind == "brand":
+        saved = await brands_db.set_photo(object_id, file_id)
+    else:
+        kind = "product"
+        saved = await products_db.set_photo(object_id, file_id)
+
+    if not saved:
+        return await message.answer("❌ Не удалось сохранить фото")
+
+    photo_cache.remember(kind, object_id, file_id)
+    await state.clear()
+    logger.info("Photo saved: %s %s by %s", kind, object_id, message.from_user.id)
+    await message.answer("✅ Фото сохранено")
+
+
+@router.message(PhotoStates.waiting_for_photo)
+async def wrong_photo(message: Message):
+    await message.answer("❌ Нужно фото или файл-картинка\n\n/cancel - отмена")
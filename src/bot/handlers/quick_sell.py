@@ -0,0 +1,261 @@
+import re
+
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+
+from src.bot.config import bot_config
+from src.bot.handlers.sell_products import format_cart
+from src.bot.middleware import ThrottlingMiddleware, query_budget
+from src.bot.session import Priority, send_priority
+from src.bot.utils.logger import setup_logger
+from src.bot.utils.product_index import ProductIndex, product_index
+from src.bot.utils.render import renderer
+
+from db.crud import ProductsSQL, ReservationsSQL
+
+
+router = Router()
+logger = setup_logger("quick_sell")
+router.callback_query.middleware(ThrottlingMiddleware())
+
+MAX_CHOICES = 8
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+
+QUICK_SELL_HELP = (
+    "⚡ <b>Быстрая продажа</b>\n\n"
+    "<code>/s бренд вкус количество [цена]</code>\n\n"
+    "Несколько товаров - по одному на строку:\n"
+    "<code>/s\n"
+    "Husky Mint Ice 2\n"
+    "Brusko Cola 1 450</code>\n\n"
+    "Без цены - по цене каталога. Всё продаётся одним чеком."
+)
+
+
+def parse_quick_line(line: str) -> list[tuple[str, int, float | None]]:
+    """
+    Варианты разбора «бренд вкус количество [цена]»
+
+    Вкус может оканчиваться числом, поэтому при двух числах в конце
+    возвращаются оба варианта: (количество, цена) и (вкус с числом, количество).
+
+    Raises:
+        ValueError: нет количества или названия
+    """
+    words = line.split()
+    numbers = []
+    while words and len(numbers) < 2 and _NUMBER.fullmatch(words[-1]):
+        numbers.insert(0, words.pop())
+
+    variants = []
+    if len(numbers) == 2 and numbers[0].isdigit():
+        variants.append((" ".join(words), int(numbers[0]), float(numbers[1].replace(",", "."))))
+    if numbers and numbers[-1].isdigit():
+        variants.append((" ".join(words + numbers[:-1]), int(numbers[-1]), None))
+
+    variants = [v for v in variants if v[0] and v[1] > 0]
+    if not variants:
+        raise ValueError("нужны название и количество больше 0")
+    return variants
+
+
+def resolve_line(
+    index: ProductIndex,
+    variants: list[tuple[str, int, float | None]]
+) -> list[dict]:
+    """
+    Варианты продажи для строки: {id, quantity, price}
+
+    Точные совпадения собираются по всем вариантам разбора («Cola 2» 1 шт
+    и «Cola» 2 шт - оба попадут в выбор), иначе - поиск по префиксам
+    для первого варианта, где что-то нашлось.
+    """
+    options = [
+        {"id": product.id, "quantity": quantity, "price": price}
+        for name, quantity, price in variants
+        for product in index.exact(name)
+    ]
+    if options:
+        return options
+    for name, quantity, price in variants:
+        found = index.search(name, limit=MAX_CHOICES)
+        if found:
+            return [{"id": product.id, "quantity": quantity, "price": price} for product in found]
+    return []
+
+
+def option_label(option: dict, product: dict) -> str:
+    price = (
+        f"за {option['price']}₽" if option["price"] is not None
+        else f"· {product['price']}₽/шт"
+    )
+    return (
+        f"{product['brand_name']} - {product['flavor']} ({product['category']}) "
+        f"× {option['quantity']} {price}"
+    )
+
+
+def next_choice(pending: dict) -> tuple[str, InlineKeyboardMarkup] | None:
+    """Вопрос по первой неоднозначной строке (None - всё определено)"""
+    for num, line in enumerate(pending["lines"]):
+        if line["choice"] is not None:
+            continue
+        buttons = [
+            [InlineKeyboardButton(
+                text=option_label(option, pending["products"][str(option["id"])]),
+                callback_data=f"qs_pick:{num}:{i}"
+            )]
+            for i, option in enumerate(line["options"])
+        ]
+        buttons.append([InlineKeyboardButton(text="❌ Отмена", callback_data="qs_cancel")])
+        return (
+            f"❓ Строка {num + 1} «{line['text']}»: что продать?",
+            InlineKeyboardMarkup(inline_keyboard=buttons)
+        )
+    return None
+
+
+async def sell_pending(
+    pending: dict,
+    admin_id: int,
+    reservations_db: ReservationsSQL
+) -> str:
+    """Провести продажу одним чеком и вернуть текст ответа"""
+    items = []
+    for line in pending["lines"]:
+        option = line["options"][line["choice"]]
+        product = pending["products"][str(option["id"])]
+        quantity = option["quantity"]
+        items.append({
+            "product_id": product["id"],
+            "brand_name": product["brand_name"],
+            "flavor": product["flavor"],
+            "quantity": quantity,
+            "price": option["price"] if option["price"] is not None else product["price"] * quantity,
+        })
+
+    group_id = await reservations_db.confirm_cart(items, admin_id)
+    if group_id is None:
+        return (
+            "❌ Продажа не проведена: свободного остатка хватает не на все позиции.\n\n"
+            + format_cart(items)
+        )
+
+    logger.info(
+        "Quick sale completed: group_id=%s, items=%s, admin_id=%s",
+        group_id, len(items), admin_id
+    )
+    return f"✅ <b>Продано! Чек №{group_id}</b>\n\n{format_cart(items)}"
+
+
+@router.message(Command("s"))
+@query_budget(4)
+async def quick_sell(
+    message: Message,
+    command: CommandObject,
+    state: FSMContext,
+    products_db: ProductsSQL,
+    reservations_db: ReservationsSQL
+):
+    """Продажа одним сообщением: /s бренд вкус количество [цена]"""
+    if message.from_user.id not in bot_config.admin_ids:
+        logger.warning(f"Access denied for user {message.from_user.id}")
+        return await message.answer("⛔ Нет доступа")
+
+    raw_lines = [line.strip() for line in (command.args or "").splitlines() if line.strip()]
+    if not raw_lines:
+        return await message.answer(QUICK_SELL_HELP, parse_mode="HTML")
+
+    index = await product_index.get(products_db)
+    lines, products, errors = [], {}, []
+    for num, text in enumerate(raw_lines, 1):
+        try:
+            options = resolve_line(index, parse_quick_line(text))
+        except ValueError as e:
+            errors.append(f"Строка {num}: {e}")
+            continue
+        if not options:
+            errors.append(f"Строка {num}: «{text}» - товар не найден")
+            continue
+        if len(options) > MAX_CHOICES:
+            errors.append(f"Строка {num}: «{text}» - слишком много совпадений, уточните")
+            continue
+
+        for option in options:
+            product = index.by_id[option["id"]]
+            products[str(product.id)] = {
+                "id": product.id,
+                "brand_name": product.brand_name,
+                "flavor": product.flavor,
+                "category": product.category,
+                "price": product.price,
+            }
+        lines.append({
+            "text": text,
+            "options": options,
+            "choice": 0 if len(options) == 1 else None,
+        })
+
+    if errors:
+        return await message.answer(
+            "⚠️ Продажа не проведена:\n" + "\n".join(errors)
+            + "\n\nФормат: /s бренд вкус количество [цена]"
+        )
+
+    pending = {"lines": lines, "products": products}
+    choice = next_choice(pending)
+    if choice is not None:
+        # Неоднозначные строки уточняем кнопками, потом продаём всё разом
+        await state.update_data(quick_sell=pending)
+        text, keyboard = choice
+        return await message.answer(text, reply_markup=keyboard)
+
+    text = await sell_pending(pending, message.from_user.id, reservations_db)
+    with send_priority(Priority.high):
+        await message.answer(text, parse_mode="HTML")
+
+
+@router.callback_query(F.data.startswith("qs_pick:"))
+@query_budget(3)
+async def pick_product(
+    callback: CallbackQuery,
+    state: FSMContext,
+    reservations_db: ReservationsSQL
+):
+    """Уточнение неоднозначной строки"""
+    _, line_num, choice = callback.data.split(":")
+    line_num, choice = int(line_num), int(choice)
+
+    data = await state.get_data()
+    pending = data.get("quick_sell")
+    if (
+        not pending
+        or line_num >= len(pending["lines"])
+        or choice >= len(pending["lines"][line_num]["options"])
+    ):
+        await callback.answer("⚠️ Продажа устарела, отправьте /s заново", show_alert=True)
+        return
+
+    pending["lines"][line_num]["choice"] = choice
+    choice = next_choice(pending)
+    if choice is not None:
+        await state.update_data(quick_sell=pending)
+        text, keyboard = choice
+        await renderer.edit_text(callback.message, text, reply_markup=keyboard)
+        await callback.answer()
+        return
+
+    await state.update_data(quick_sell=None)
+    text = await sell_pending(pending, callback.from_user.id, reservations_db)
+    with send_priority(Priority.high):
+        await renderer.edit_text(callback.message, text, parse_mode="HTML")
+    await callback.answer()
+
+
+@router.callback_query(F.data == "qs_cancel")
+async def cancel_quick_sell(callback: CallbackQuery, state: FSMContext):
+    await state.update_data(quick_sell=None)
+    await renderer.edit_text(callback.message, "❌ Продажа отменена")
+    await callback.answer()
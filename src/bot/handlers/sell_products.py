@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
@@ -6,14 +8,18 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from src.bot.config import bot_config
+from src.bot.middleware import ThrottlingMiddleware, query_budget
 from src.bot.models.base import ProductCategory
+from src.bot.session import Priority, send_priority
 from src.bot.utils.logger import setup_logger
+from src.bot.utils.render import render_cache, renderer
 
-from db.crud import BrandsSQL, ProductsSQL, SalesSQL
+from db.crud import BrandsSQL, ProductsSQL, ReservationsSQL
 
 
 router = Router()
 logger = setup_logger("sell_product")
+router.callback_query.middleware(ThrottlingMiddleware())
 
 
 class SellProductStates(StatesGroup):
@@ -41,8 +47,9 @@ def create_brands_keyboard(brands: list) -> InlineKeyboardMarkup:
     ])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+@lru_cache(maxsize=None)
 def create_categories_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура с категориями"""
+    """Клавиатура с категориями (статическая, строится один раз)"""
     buttons = []
     for category in ProductCategory:
         buttons.append([
@@ -61,7 +68,8 @@ def create_products_keyboard(products: list, category: str) -> InlineKeyboardMar
     """Клавиатура с товарами (вкусами)"""
     buttons = []
     for product in products:
-        stock_info = f"({product.quantity} шт)" if product.quantity > 0 else "(нет)"
+        # Свободный остаток: штуки в чужих незавершённых продажах не предлагаем
+        stock_info = f"({product.available} шт)" if product.available > 0 else "(нет)"
         buttons.append([
             InlineKeyboardButton(
                 text=f"{product.flavor} {stock_info}",
@@ -77,15 +85,92 @@ def create_products_keyboard(products: list, category: str) -> InlineKeyboardMar
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+@lru_cache(maxsize=None)
+def create_cancel_keyboard() -> InlineKeyboardMarkup:
+    """Кнопка отмены продажи (снимает резерв)"""
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="❌ Отмена", callback_data="sell_cancel")
+    ]])
+
+
+@lru_cache(maxsize=None)
+def create_price_keyboard() -> InlineKeyboardMarkup:
+    """Под запросом цены: положить товар в корзину по цене каталога"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🛒 В корзину", callback_data="sell_cart_add")],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="sell_cancel")],
+    ])
+
+
+@lru_cache(maxsize=None)
+def create_cart_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Продать всё", callback_data="sell_cart_commit")],
+        [InlineKeyboardButton(text="➕ Добавить ещё", callback_data="sell_back_to_brands")],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="sell_cancel")],
+    ])
+
+
+def cart_total(cart: list[dict]) -> float:
+    return sum(item["price"] for item in cart)
+
+
+def with_cart_button(keyboard: InlineKeyboardMarkup, cart: list[dict]) -> InlineKeyboardMarkup:
+    """Кешированная клавиатура + строка корзины сверху (если в ней что-то есть)"""
+    if not cart:
+        return keyboard
+    button = InlineKeyboardButton(
+        text=f"🧾 Корзина: {len(cart)} поз. на {cart_total(cart)}₽",
+        callback_data="sell_cart"
+    )
+    return InlineKeyboardMarkup(inline_keyboard=[[button], *keyboard.inline_keyboard])
+
+
+def format_cart(cart: list[dict]) -> str:
+    lines = [
+        f"{i}. {item['brand_name']} - {item['flavor']} × {item['quantity']} = {item['price']}₽"
+        for i, item in enumerate(cart, 1)
+    ]
+    return "\n".join(lines) + f"\n\n💰 <b>Итого: {cart_total(cart)}₽</b>"
+
+
+async def release_reservation(state: FSMContext, reservations_db: ReservationsSQL) -> None:
+    """Снять резервы незавершённой продажи: текущий товар и корзину"""
+    data = await state.get_data()
+    reservation_ids = [item["reservation_id"] for item in data.get("cart", [])]
+    if data.get("reservation_id") is not None:
+        reservation_ids.append(data["reservation_id"])
+    if reservation_ids:
+        await reservations_db.release(reservation_ids)
+        await state.update_data(reservation_id=None, cart=[])
+
+
+async def load_brands_keyboard(
+    brands_db: BrandsSQL,
+    category: str
+) -> InlineKeyboardMarkup | None:
+    """Клавиатура брендов категории (None - брендов нет)"""
+    async def load() -> InlineKeyboardMarkup | None:
+        brands = await brands_db.get_brands_by_category(category)
+        return create_brands_keyboard(brands) if brands else None
+
+    return await render_cache.get_or_load(
+        brands_db.db.catalog_version, ("sell_brands", category), load
+    )
+
+
 @router.message(Command("sell"))
-async def sell_start(message: Message, state: FSMContext):
+async def sell_start(message: Message, state: FSMContext, reservations_db: ReservationsSQL):
     """Начало процесса продажи"""
     if message.from_user.id not in bot_config.admin_ids:
         logger.warning(f"Access denied for user {message.from_user.id}")
         return await message.answer("⛔ Нет доступа")
 
-    logger.info(f"Admin {message.from_user.id} started selling process")
-    
+    logger.info("Admin %s started selling process", message.from_user.id)
+
+    # Новая продажа вместо брошенной - её резервы больше не нужны
+    await release_reservation(state, reservations_db)
+    await state.set_data({})
     await state.set_state(SellProductStates.selecting_category)
     await message.answer(
         "🛒 <b>Продажа товара</b>\n\n"
@@ -96,6 +181,7 @@ async def sell_start(message: Message, state: FSMContext):
 
 
 @router.callback_query(F.data.startswith("sell_cat:"))
+@query_budget(1)
 async def select_category(
     callback: CallbackQuery,
     state: FSMContext,
@@ -105,19 +191,21 @@ async def select_category(
     category = callback.data.split(":")[1]
     
     # Получаем бренды категории
-    brands = await brands_db.get_brands_by_category(category)
+    keyboard = await load_brands_keyboard(brands_db, category)
     
-    if not brands:
+    if not keyboard:
         await callback.answer("⚠️ В этой категории нет брендов", show_alert=True)
         return
 
     await state.update_data(category=category)
     await state.set_state(SellProductStates.selecting_brand)
+    data = await state.get_data()
     
-    await callback.message.edit_text(
+    await renderer.edit_text(
+        callback.message,
         f"📦 <b>Категория: {category.capitalize()}</b>\n\n"
         f"Выберите бренд:",
-        reply_markup=create_brands_keyboard(brands),
+        reply_markup=with_cart_button(keyboard, data.get("cart", [])),
         parse_mode="HTML"
     )
     await callback.answer()
@@ -127,7 +215,8 @@ async def select_category(
 async def back_to_categories(callback: CallbackQuery, state: FSMContext):
     """Возврат к выбору категорий"""
     await state.set_state(SellProductStates.selecting_category)
-    await callback.message.edit_text(
+    await renderer.edit_text(
+        callback.message,
         "🛒 <b>Продажа товара</b>\n\n"
         "Выберите категорию товара:",
         reply_markup=create_categories_keyboard(),
@@ -137,6 +226,7 @@ async def back_to_categories(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data == "sell_back_to_brands")
+@query_budget(1)
 async def back_to_brands(callback: CallbackQuery, state: FSMContext, brands_db: BrandsSQL):
     """Возврат к выбору брендов"""
     data = await state.get_data()
@@ -145,22 +235,24 @@ async def back_to_brands(callback: CallbackQuery, state: FSMContext, brands_db:
     if not category:
         return await back_to_categories(callback, state)
     
-    brands = await brands_db.get_brands_by_category(category)
+    keyboard = await load_brands_keyboard(brands_db, category)
     
-    if not brands:
+    if not keyboard:
         return await back_to_categories(callback, state)
     
     await state.set_state(SellProductStates.selecting_brand)
-    await callback.message.edit_text(
+    await renderer.edit_text(
+        callback.message,
         f"📦 <b>Категория: {category.capitalize()}</b>\n\n"
         f"Выберите бренд:",
-        reply_markup=create_brands_keyboard(brands),
+        reply_markup=with_cart_button(keyboard, data.get("cart", [])),
         parse_mode="HTML"
     )
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("sell_brand:"))
+@query_budget(1)
 async def select_brand(
     callback: CallbackQuery,
     state: FSMContext,
@@ -170,27 +262,38 @@ async def select_brand(
     brand_id = int(callback.data.split(":")[1])
     
     # Получаем товары бренда
-    products = await products_db.get_products_by_brand(brand_id)
+    async def load() -> tuple[str, InlineKeyboardMarkup] | None:
+        products = await products_db.get_products_by_brand(brand_id)
+        if not products:
+            return None
+        return products[0].brand_name, create_products_keyboard(products, "")
+
+    rendered = await render_cache.get_or_load(
+        products_db.db.catalog_version, ("sell_products", brand_id), load
+    )
     
-    if not products:
+    if not rendered:
         await callback.answer("⚠️ У этого бренда нет товаров", show_alert=True)
         return
     
-    brand_name = products[0].brand_name if products else "Неизвестно"
+    brand_name, keyboard = rendered
     
     await state.update_data(brand_id=brand_id, brand_name=brand_name)
     await state.set_state(SellProductStates.selecting_product)
+    data = await state.get_data()
     
-    await callback.message.edit_text(
+    await renderer.edit_text(
+        callback.message,
         f"🏷 <b>Бренд: {brand_name}</b>\n\n"
         f"Выберите вкус:",
-        reply_markup=create_products_keyboard(products, ""),
+        reply_markup=with_cart_button(keyboard, data.get("cart", [])),
         parse_mode="HTML"
     )
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("sell_prod:"))
+@query_budget(1)
 async def select_product(
     callback: CallbackQuery,
     state: FSMContext,
@@ -199,16 +302,19 @@ async def select_product(
     """Выбор товара (вкуса)"""
     product_id = int(callback.data.split(":")[1])
     
-    # Получаем данные о товаре
-    products = await products_db.get_all()
-    product = next((p for p in products if p.id == product_id), None)
+    # Получаем данные о товаре (со свободным остатком)
+    product = await products_db.get_product(product_id)
     
     if not product:
         await callback.answer("❌ Товар не найден", show_alert=True)
         return
 
-    if product.quantity <= 0:
-        await callback.answer("⚠️ Товар отсутствует на складе", show_alert=True)
+    if product.available <= 0:
+        text = (
+            "⚠️ Весь остаток зарезервирован другими продажами"
+            if product.quantity > 0 else "⚠️ Товар отсутствует на складе"
+        )
+        await callback.answer(text, show_alert=True)
         return
 
     await state.update_data(
@@ -216,44 +322,69 @@ async def select_product(
         product_flavor=product.flavor,
         brand_name=product.brand_name,
         product_price=product.price,
-        product_quantity=product.quantity
+        product_quantity=product.available
     )
     await state.set_state(SellProductStates.entering_quantity)
-    
-    await callback.message.edit_text(
+
+    reserved_info = f" (ещё {product.reserved} шт в резерве)" if product.reserved else ""
+    await renderer.edit_text(
+        callback.message,
         f"📦 <b>{product.brand_name} - {product.flavor}</b>\n\n"
         f"💰 Цена: {product.price}₽\n"
-        f"📊 Остаток: {product.quantity} шт\n\n"
-        f"Введите количество для продажи (1-{product.quantity}):",
+        f"📊 Свободно: {product.available} шт{reserved_info}\n\n"
+        f"Введите количество для продажи (1-{product.available}):",
+        reply_markup=create_cancel_keyboard(),
         parse_mode="HTML"
     )
     await callback.answer()
 
 
 @router.message(SellProductStates.entering_quantity)
-async def enter_quantity(message: Message, state: FSMContext):
-    """Ввод количества"""
+@query_budget(3)
+async def enter_quantity(message: Message, state: FSMContext, reservations_db: ReservationsSQL):
+    """Ввод количества - резервируем товар до конца продажи"""
     try:
         quantity = int(message.text)
         data = await state.get_data()
         
         if quantity <= 0:
             return await message.answer("⚠️ Количество должно быть больше 0")
-        
-        if quantity > data['product_quantity']:
+
+        # Остаток в состоянии - снимок: проверяет и держит его только резерв
+        reservation_id, available = await reservations_db.reserve(
+            data['product_id'],
+            message.from_user.id,
+            quantity,
+            ttl=bot_config.reservation_ttl,
+            replace_id=data.get('reservation_id')
+        )
+
+        if reservation_id is None:
+            await state.update_data(product_quantity=available, reservation_id=None)
+            if available <= 0:
+                await state.clear()
+                return await message.answer(
+                    "⚠️ Свободного остатка не осталось - товар продан "
+                    "или зарезервирован другими продажами.\n"
+                    "Начните заново с команды /sell"
+                )
             return await message.answer(
-                f"⚠️ На складе только {data['product_quantity']} шт.\n"
-                f"Введите количество от 1 до {data['product_quantity']}:"
+                f"⚠️ Свободно только {available} шт.\n"
+                f"Введите количество от 1 до {available}:",
+                reply_markup=create_cancel_keyboard()
             )
 
-        await state.update_data(sell_quantity=quantity)
+        await state.update_data(sell_quantity=quantity, reservation_id=reservation_id)
         await state.set_state(SellProductStates.entering_price)
         
         suggested_price = data['product_price'] * quantity
         await message.answer(
+            f"🔒 {quantity} шт зарезервировано на {bot_config.reservation_ttl // 60} мин\n\n"
             f"💰 Введите цену продажи (₽)\n\n"
             f"Рекомендованная: {suggested_price}₽\n"
-            f"({quantity} шт × {data['product_price']}₽)"
+            f"({quantity} шт × {data['product_price']}₽)\n\n"
+            f"🛒 «В корзину» - добавить по рекомендованной цене и выбрать ещё товар",
+            reply_markup=create_price_keyboard()
         )
 
     except ValueError:
@@ -261,11 +392,12 @@ async def enter_quantity(message: Message, state: FSMContext):
 
 
 @router.message(SellProductStates.entering_price)
+@query_budget(3)
 async def enter_price(
     message: Message,
     state: FSMContext,
     products_db: ProductsSQL,
-    sales_db: SalesSQL
+    reservations_db: ReservationsSQL
 ):
     """Ввод цены и завершение продажи"""
     try:
@@ -275,57 +407,45 @@ async def enter_price(
             return await message.answer("⚠️ Цена должна быть больше 0")
 
         data = await state.get_data()
+
+        # Корзина уже собирается - цена относится к очередной позиции
+        if data.get('cart'):
+            return await add_current_to_cart(message, state, products_db, price)
         
-        # Обновляем количество товара на складе
-        new_quantity = data['product_quantity'] - data['sell_quantity']
-        quantity_updated = await products_db.update_quantity(
+        # Резерв, списание остатка и продажа - одной транзакцией
+        new_quantity = await reservations_db.confirm(
+            data['reservation_id'],
             data['product_id'],
-            new_quantity
+            message.from_user.id,
+            data['sell_quantity'],
+            price
         )
         
-        if not quantity_updated:
-            logger.error(f"Failed to update quantity for product {data['product_id']}")
+        if new_quantity is None:
+            logger.error(f"Failed to confirm sale for product {data['product_id']}")
+            await state.clear()
             return await message.answer(
-                "❌ Ошибка при обновлении остатка товара.\n"
-                "Попробуйте ещё раз."
-            )
-
-        # Сохраняем продажу
-        sale_added = await sales_db.add_sale(
-            product_id=data['product_id'],
-            admin_id=message.from_user.id,
-            quantity=data['sell_quantity'],
-            price=price
-        )
-        
-        if not sale_added:
-            logger.error(f"Failed to add sale for product {data['product_id']}")
-            # Откатываем изменение количества
-            await products_db.update_quantity(
-                data['product_id'],
-                data['product_quantity']
-            )
-            return await message.answer(
-                "❌ Ошибка при сохранении продажи.\n"
-                "Попробуйте ещё раз."
+                "❌ Не удалось провести продажу: резерв истёк, "
+                "а свободного остатка уже не хватает.\n"
+                "Начните заново с команды /sell"
             )
 
         logger.info(
-            f"Sale completed: product_id={data['product_id']}, "
-            f"quantity={data['sell_quantity']}, price={price}, "
-            f"admin_id={message.from_user.id}"
+            "Sale completed: product_id=%s, quantity=%s, price=%s, admin_id=%s",
+            data['product_id'], data['sell_quantity'], price, message.from_user.id
         )
 
-        # Итоговое сообщение
-        await message.answer(
-            f"✅ <b>Продажа завершена!</b>\n\n"
-            f"🏷 Бренд: {data['brand_name']}\n"
-            f"📦 Вкус: {data['product_flavor']}\n"
-            f"📊 Количество: {data['sell_quantity']} шт\n"
-            f"💰 Сумма: {price}₽\n"
-            f"📉 Остаток на складе: {new_quantity} шт",
-            parse_mode="HTML"
-        )
+        # Итоговое сообщение (вне очереди правок каталога)
+        with send_priority(Priority.high):
+            await message.answer(
+                f"✅ <b>Продажа завершена!</b>\n\n"
+                f"🏷 Бренд: {data['brand_name']}\n"
+                f"📦 Вкус: {data['product_flavor']}\n"
+                f"📊 Количество: {data['sell_quantity']} шт\n"
+                f"💰 Сумма: {price}₽\n"
+                f"📉 Остаток на складе: {new_quantity} шт",
+                parse_mode="HTML"
+            )
         
         await state.clear()
 
@@ -337,12 +457,128 @@ async def enter_price(
             "❌ Произошла непредвиденная ошибка.\n"
             "Попробуйте начать сначала с команды /sell"
         )
+        await release_reservation(state, reservations_db)
         await state.clear()
 
 
+# ===== CART =====
+
+async def add_current_to_cart(
+    message: Message,
+    state: FSMContext,
+    products_db: ProductsSQL,
+    price: float | None = None
+) -> None:
+    """
+    Положить текущий товар (уже под резервом) в корзину и вернуться
+    к вкусам того же бренда - так следующая позиция в два нажатия
+    """
+    data = await state.get_data()
+    if data.get("reservation_id") is None:
+        await message.answer("⚠️ Товар не выбран. Начните заново с команды /sell")
+        return
+
+    quantity = data["sell_quantity"]
+    cart = [*data.get("cart", []), {
+        "reservation_id": data["reservation_id"],
+        "product_id": data["product_id"],
+        "brand_name": data["brand_name"],
+        "flavor": data["product_flavor"],
+        "quantity": quantity,
+        "price": price if price is not None else data["product_price"] * quantity,
+    }]
+    await state.update_data(cart=cart, reservation_id=None)
+    await state.set_state(SellProductStates.selecting_product)
+
+    brand_id = data.get("brand_id")
+
+    async def load() -> tuple[str, InlineKeyboardMarkup] | None:
+        products = await products_db.get_products_by_brand(brand_id)
+        if not products:
+            return None
+        return products[0].brand_name, create_products_keyboard(products, "")
+
+    rendered = await render_cache.get_or_load(
+        products_db.db.catalog_version, ("sell_products", brand_id), load
+    )
+    text = (
+        f"🛒 <b>Добавлено:</b> {data['brand_name']} - {data['product_flavor']} × {quantity}\n"
+        f"🧾 В корзине: {len(cart)} поз. на {cart_total(cart)}₽\n\n"
+        f"Выберите ещё вкус или откройте корзину:"
+    )
+    keyboard = with_cart_button(rendered[1] if rendered else create_cancel_keyboard(), cart)
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+
+
+@router.callback_query(SellProductStates.entering_price, F.data == "sell_cart_add")
+@query_budget(1)
+async def add_to_cart(callback: CallbackQuery, state: FSMContext, products_db: ProductsSQL):
+    """Товар в корзину по цене каталога"""
+    await add_current_to_cart(callback.message, state, products_db)
+    await callback.answer("🛒 Добавлено в корзину")
+
+
+@router.callback_query(F.data == "sell_cart")
+async def show_cart(callback: CallbackQuery, state: FSMContext):
+    """Корзина и итог перед продажей"""
+    data = await state.get_data()
+    cart = data.get("cart", [])
+    if not cart:
+        await callback.answer("🛒 Корзина пуста", show_alert=True)
+        return
+
+    await renderer.edit_text(
+        callback.message,
+        f"🧾 <b>Корзина</b>\n\n{format_cart(cart)}",
+        reply_markup=create_cart_keyboard(),
+        parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data == "sell_cart_commit")
+@query_budget(4)
+async def commit_cart(
+    callback: CallbackQuery,
+    state: FSMContext,
+    reservations_db: ReservationsSQL
+):
+    """Продажа всей корзины одной транзакцией"""
+    data = await state.get_data()
+    cart = data.get("cart", [])
+    if not cart:
+        await callback.answer("🛒 Корзина пуста", show_alert=True)
+        return
+
+    group_id = await reservations_db.confirm_cart(cart, callback.from_user.id)
+    if group_id is None:
+        await callback.answer(
+            "❌ Не удалось провести продажу: часть резервов истекла, "
+            "а свободного остатка уже не хватает",
+            show_alert=True
+        )
+        return
+
+    logger.info(
+        "Cart sale completed: group_id=%s, items=%s, total=%s, admin_id=%s",
+        group_id, len(cart), cart_total(cart), callback.from_user.id
+    )
+    await state.clear()
+
+    # Чек - вне очереди правок каталога
+    with send_priority(Priority.high):
+        await renderer.edit_text(
+            callback.message,
+            f"✅ <b>Продажа завершена! Чек №{group_id}</b>\n\n{format_cart(cart)}",
+            parse_mode="HTML"
+        )
+    await callback.answer()
+
+
 @router.callback_query(F.data == "sell_cancel")
-async def cancel_sell(callback: CallbackQuery, state: FSMContext):
-    """Отмена продажи"""
+async def cancel_sell(callback: CallbackQuery, state: FSMContext, reservations_db: ReservationsSQL):
+    """Отмена продажи (резерв возвращается в свободный остаток)"""
+    await release_reservation(state, reservations_db)
     await state.clear()
-    await callback.message.edit_text("❌ Продажа отменена")
+    await renderer.edit_text(callback.message, "❌ Продажа отменена")
     await callback.answer()
\ No newline at end of file
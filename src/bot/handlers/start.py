@@ -43,7 +43,7 @@ async def cmd_start(message: Message):
     username = message.from_user.first_name or "Пользователь"
     is_admin = user_id in bot_config.admin_ids
     
-    logger.info(f"User {user_id} ({username}) started bot. Admin: {is_admin}")
+    logger.info("User %s (%s) started bot. Admin: %s", user_id, username, is_admin)
     
     if is_admin:
         keyboard = create_admin_keyboard()
@@ -0,0 +1,271 @@
+import asyncio
+import csv
+import html
+import io
+import os
+import tempfile
+from pathlib import Path
+
+from aiogram import Bot, Router, F
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import (
+    BufferedInputFile,
+    CallbackQuery,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    Message,
+)
+
+from src.bot.config import bot_config
+from src.bot.middleware import query_budget
+from src.bot.session import Priority, send_priority
+from src.bot.utils.logger import setup_logger
+from src.bot.utils.message import STOCKTAKE_HELP
+from src.bot.utils.parse_product import ERRORS_TEXT_LIMIT, StockCountParser
+from src.bot.utils.render import renderer
+from src.bot.utils.spreadsheet import (
+    IMPORT_CHUNK_SIZE,
+    MAX_FILE_SIZE,
+    SUPPORTED_EXTENSIONS,
+    is_header_row,
+    iter_rows,
+    read_chunk,
+)
+
+from db.crud import StocktakeSQL
+
+
+router = Router()
+logger = setup_logger("stocktake")
+
+# Сколько расхождений показать в сообщении: полный список - файлом
+MAX_SHOWN = 15
+MAX_SHOWN_ERRORS = 5
+
+
+class StocktakeStates(StatesGroup):
+    waiting_for_counts = State()
+    confirming = State()
+
+
+def format_diff_line(row: dict) -> str:
+    name = html.escape(f"{row['brand']} - {row['flavor']}")
+    if row["product_id"] is None:
+        return f"❓ {name} ({row['category']}) - не найден"
+    delta = row["counted"] - row["current"]
+    return f"{'📈' if delta > 0 else '📉'} {name}: {row['current']} → {row['counted']} ({delta:+})"
+
+
+def diff_report(rows: list[dict]) -> bytes:
+    """Все расхождения CSV-файлом (; и BOM - чтобы Excel открыл как есть)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    writer.writerow(["категория", "бренд", "вкус", "в базе", "по факту", "разница"])
+    for row in rows:
+        if row["product_id"] is None:
+            writer.writerow([row["category"], row["brand"], row["flavor"], "", row["counted"], "не найден"])
+        else:
+            writer.writerow([
+                row["category"], row["brand"], row["flavor"],
+                row["current"], row["counted"], row["counted"] - row["current"]
+            ])
+    return buffer.getvalue().encode("utf-8-sig")
+
+
+def create_confirm_keyboard(changed: int, missing: int) -> InlineKeyboardMarkup:
+    buttons = []
+    if changed:
+        buttons.append([InlineKeyboardButton(
+            text=f"✅ Применить ({changed})", callback_data="stocktake_apply:0"
+        )])
+    if missing:
+        buttons.append([InlineKeyboardButton(
+            text=f"🧹 Применить и обнулить остальные ({missing})",
+            callback_data="stocktake_apply:1"
+        )])
+    buttons.append([InlineKeyboardButton(text="❌ Отмена", callback_data="stocktake_cancel")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+async def show_summary(
+    message: Message,
+    state: FSMContext,
+    stocktake_db: StocktakeSQL,
+    lines: int,
+    parser: StockCountParser
+):
+    """Расхождения пересчёта с базой и кнопки подтверждения"""
+    result = await stocktake_db.diff(message.from_user.id)
+    if result is None:
+        await state.clear()
+        return await message.answer("❌ Не удалось сравнить остатки. Обратитесь к разработчику.")
+
+    rows, missing = result
+    unmatched = sum(row["product_id"] is None for row in rows)
+    changed = len(rows) - unmatched
+    added = sum(max(row["counted"] - row["current"], 0) for row in rows if row["product_id"])
+    removed = sum(max(row["current"] - row["counted"], 0) for row in rows if row["product_id"])
+
+    text_parts = [
+        "📋 <b>Инвентаризация</b>\n",
+        f"Позиций в пересчёте: {lines}",
+        f"✅ Совпадает: {lines - len(rows)}",
+        f"✏️ Расхождений: {changed} (+{added} / −{removed} шт)",
+        f"❓ Не найдено в базе: {unmatched}",
+        f"📦 Не пересчитано товаров с остатком: {missing['missing']} ({missing['quantity']} шт)",
+    ]
+    if parser.error_count:
+        text_parts.append(f"⚠️ Строк с ошибками: {parser.error_count}")
+        text_parts.extend(html.escape(error) for error in parser.errors[:MAX_SHOWN_ERRORS])
+
+    if rows:
+        text_parts.append("")
+        text_parts.extend(format_diff_line(row) for row in rows[:MAX_SHOWN])
+        if len(rows) > MAX_SHOWN:
+            text_parts.append(f"… и ещё {len(rows) - MAX_SHOWN} - в файле")
+
+    if not changed and not missing["missing"]:
+        # Применять нечего
+        await stocktake_db.discard(message.from_user.id)
+        await state.clear()
+        text_parts.append("\n✅ Остатки в базе совпадают с пересчётом")
+        return await message.answer("\n".join(text_parts), parse_mode="HTML")
+
+    await state.set_state(StocktakeStates.confirming)
+    await state.update_data(stocktake_lines=lines)
+    await message.answer(
+        "\n".join(text_parts),
+        reply_markup=create_confirm_keyboard(changed, missing["missing"]),
+        parse_mode="HTML"
+    )
+    if len(rows) > MAX_SHOWN:
+        await message.answer_document(
+            BufferedInputFile(diff_report(rows), filename="stocktake_diff.csv"),
+            caption=f"📋 Расхождения: {len(rows)}"
+        )
+
+
+@router.message(Command("stocktake"))
+async def stocktake_start(message: Message, state: FSMContext):
+    if message.from_user.id not in bot_config.admin_ids:
+        return await message.answer("⛔ Нет доступа")
+
+    await state.set_state(StocktakeStates.waiting_for_counts)
+    await message.answer(STOCKTAKE_HELP, parse_mode="HTML")
+
+
+@router.message(StocktakeStates.waiting_for_counts, F.text)
+@query_budget(7)
+async def stocktake_text(message: Message, state: FSMContext, stocktake_db: StocktakeSQL):
+    """Пересчёт текстом: категория | бренд | вкус | количество"""
+    parser = StockCountParser()
+    parser.feed_lines(line for line in message.text.split("\n") if line.strip())
+    rows = parser.take_rows()
+
+    if not rows:
+        errors = parser.error_messages(ERRORS_TEXT_LIMIT) or ["❌ Не найдено ни одной строки"]
+        return await message.answer("❌ Ошибки:\n\n" + "\n".join(errors))
+
+    if not await stocktake_db.load(message.from_user.id, rows):
+        return await message.answer("❌ Не удалось загрузить пересчёт")
+    await show_summary(message, state, stocktake_db, len(rows), parser)
+
+
+def parse_count_file(path: str, filename: str) -> StockCountParser:
+    """Разбор всего файла пересчёта (вызывается в потоке)"""
+    parser = StockCountParser()
+    rows = enumerate(iter_rows(path, filename), start=1)
+    first_chunk = True
+    while chunk := read_chunk(rows, IMPORT_CHUNK_SIZE):
+        if first_chunk:
+            first_chunk = False
+            if is_header_row(chunk[0][1]):
+                chunk = chunk[1:]
+        for row_num, row in chunk:
+            parser.feed(row, row_num)
+    return parser
+
+
+@router.message(StocktakeStates.waiting_for_counts, F.document)
+async def stocktake_file(
+    message: Message,
+    state: FSMContext,
+    bot: Bot,
+    stocktake_db: StocktakeSQL
+):
+    """Пересчёт файлом CSV/XLSX"""
+    document = message.document
+    filename = document.file_name or "stocktake"
+
+    if Path(filename).suffix.lower() not in SUPPORTED_EXTENSIONS:
+        return await message.answer(
+            "❌ Поддерживаются файлы .csv и .xlsx\n"
+            "Колонки: категория, бренд, вкус, количество"
+        )
+    if document.file_size and document.file_size > MAX_FILE_SIZE:
+        return await message.answer("❌ Файл больше 20 МБ - разбейте его на части")
+
+    fd, tmp_path = tempfile.mkstemp(suffix=Path(filename).suffix.lower())
+    os.close(fd)
+    try:
+        await bot.download(document, destination=tmp_path)
+        parser = await asyncio.to_thread(parse_count_file, tmp_path, filename)
+    except ValueError as e:
+        logger.warning(f"Unsupported stocktake file {filename}: {e}")
+        return await message.answer(f"❌ Не удалось прочитать файл: {e}")
+    finally:
+        os.remove(tmp_path)
+
+    rows = parser.take_rows()
+    if not rows:
+        errors = parser.error_messages() or ["❌ Не найдено ни одной строки"]
+        return await message.answer("❌ Ошибки:\n\n" + "\n".join(errors[:MAX_SHOWN_ERRORS]))
+
+    if not await stocktake_db.load(message.from_user.id, rows):
+        return await message.answer("❌ Не удалось загрузить пересчёт")
+    logger.info(f"📋 Stocktake file {filename}: {len(rows)} items, {parser.error_count} invalid")
+    await show_summary(message, state, stocktake_db, len(rows), parser)
+
+
+@router.callback_query(StocktakeStates.confirming, F.data.startswith("stocktake_apply:"))
+@query_budget(6)
+async def stocktake_apply(callback: CallbackQuery, state: FSMContext, stocktake_db: StocktakeSQL):
+    """Все корректировки - одной транзакцией"""
+    zero_missing = callback.data.split(":")[1] == "1"
+    data = await state.get_data()
+    await state.clear()
+
+    result = await stocktake_db.apply(
+        callback.from_user.id, data.get("stocktake_lines", 0), zero_missing
+    )
+    if result is None:
+        await renderer.edit_text(
+            callback.message, "⚠️ Пересчёт устарел или не применился - отправьте /stocktake заново"
+        )
+        return await callback.answer()
+
+    stocktake_id, adjusted = result
+    with send_priority(Priority.high):
+        await renderer.edit_text(
+            callback.message,
+            f"✅ <b>Инвентаризация №{stocktake_id} проведена</b>\n\n"
+            f"Скорректировано товаров: {adjusted}",
+            parse_mode="HTML"
+        )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("stocktake_apply:"))
+async def stocktake_apply_stale(callback: CallbackQuery):
+    """Кнопка старого пересчёта (бот перезапускался или уже применено)"""
+    await callback.answer("⚠️ Пересчёт устарел - отправьте /stocktake заново", show_alert=True)
+
+
+@router.callback_query(F.data == "stocktake_cancel")
+async def stocktake_cancel(callback: CallbackQuery, state: FSMContext, stocktake_db: StocktakeSQL):
+    await stocktake_db.discard(callback.from_user.id)
+    await state.clear()
+    await renderer.edit_text(callback.message, "❌ Инвентаризация отменена")
+    await callback.answer()
@@ -1,30 +1,118 @@
 import asyncio
 import logging
 import os
-from aiogram import Bot, Dispatcher
-from aiogram.types import BotCommand
+import signal
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Awaitable, TypeVar
 
-from db.crud import BrandsSQL, ProductsSQL, SalesSQL
+from aiogram import Bot
+from aiogram.types import BotCommand, Update
+from aiohttp import web
+from pydantic import ValidationError
+
+from db.crud import BrandsSQL, ProductsSQL, ReservationsSQL, SalesSQL, StocktakeSQL
 from db.manager import AsyncDatabaseManager
+from db.profiling import record_query
+from db.schemas import SCHEMA_COLUMNS, create_schema_sql
 
-from src.bot.config import bot_config
+from src.bot.config import BotConfig, load_config
 from src.bot.handlers.add_products import router as add_products_router
 from src.bot.handlers.sell_products import router as sell_router
 from src.bot.handlers.cancel import router as cancel_router
 from src.bot.handlers.catalog import router as catalog_router
+from src.bot.handlers.quick_sell import router as quick_sell_router
+from src.bot.handlers.photos import router as photos_router
+from src.bot.handlers.debug import router as debug_router
+from src.bot.handlers.stocktake import router as stocktake_router
 from src.bot.handlers.start import router as start_router
-from src.bot.middleware import DatabaseMiddleware
+from src.bot.dispatcher import OrderedDispatcher
+from src.bot.middleware import DatabaseMiddleware, QueryBudgetMiddleware, RecordingMiddleware
+from src.bot.session import RateLimitMiddleware
+from src.bot.supervisor import WORKER_ROUTE, Supervisor, install_stop_signals
+from src.bot.utils.logger import configure_logging, shutdown_logging
+from src.bot.utils.photos import photo_cache
+from src.bot.utils.product_index import product_index
+from src.bot.utils.recorder import UpdateRecorder
+from src.bot.utils.render import render_cache, renderer
+
+T = TypeVar("T")
 
+# Сколько секунд воркер ждёт обработки апдейта перед ответом супервизору
+# (меньше его forward_timeout)
+WORKER_ACK_TIMEOUT = 10.0
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Обработчики логов ставит configure_logging() при запуске
 logger = logging.getLogger(__name__)
 
-bot = Bot(token=bot_config.BOT_TOKEN)
-dp = Dispatcher()
+
+@contextmanager
+def startup_phase(name: str):
+    """Логирует длительность фазы запуска"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        logger.info(f"⏱ Startup phase '{name}': {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+async def timed(name: str, awaitable: Awaitable[T]) -> T:
+    with startup_phase(name):
+        return await awaitable
+
+
+def create_bot(config: BotConfig, global_rate: float = 30.0) -> tuple[Bot, RateLimitMiddleware]:
+    """Бот с лимитами Bot API: глобальный и на каждый чат"""
+    bot = Bot(token=config.BOT_TOKEN)
+    rate_limiter = RateLimitMiddleware(global_rate=global_rate)
+    bot.session.middleware(rate_limiter)
+    return bot, rate_limiter
+
+
+def create_dispatcher(config: BotConfig) -> OrderedDispatcher:
+    """Dispatcher с middleware и роутерами (роутеры подключаются один раз)"""
+    # Апдейты разных чатов - параллельно, одного чата - строго по порядку
+    dp = OrderedDispatcher(concurrency=config.updates_concurrency)
+
+    # Подключаем middleware; несколько воркеров видят записи друг друга
+    # через PRAGMA data_version
+    database = DatabaseMiddleware(
+        sync_external_writes=config.webhook_url is not None and config.workers > 1
+    )
+    dp.message.middleware(database)
+    dp.callback_query.middleware(database)
+
+    # Бюджеты запросов к БД на апдейт (тесты и нагрузочные прогоны)
+    if config.query_budget_mode != "off":
+        query_budget = QueryBudgetMiddleware(strict=config.query_budget_mode == "strict")
+        dp.message.middleware(query_budget)
+        dp.callback_query.middleware(query_budget)
+        dp["query_budget"] = query_budget
+
+    # Запись трафика для воспроизведения (benchmarks/replay.py)
+    if config.record_updates_dir:
+        recorder = UpdateRecorder(
+            config.record_updates_dir,
+            config.admin_ids,
+            redact=config.record_redact_text
+        )
+        dp.update.outer_middleware(RecordingMiddleware(recorder))
+        dp["update_recorder"] = recorder
+        logger.info(f"📼 Recording updates to {config.record_updates_dir}")
+
+    # Подключаем роутеры (порядок важен!)
+    dp.include_router(start_router)      # Первым - start и menu
+    dp.include_router(cancel_router)     # Вторым - отмена
+    if config.debug_commands:
+        dp.include_router(debug_router)  # /debug_mem, /debug_prof
+    dp.include_router(catalog_router)    # Каталог
+    dp.include_router(quick_sell_router)  # /s - до роутеров с состояниями FSM
+    dp.include_router(photos_router)
+    dp.include_router(add_products_router)
+    dp.include_router(sell_router)
+    dp.include_router(stocktake_router)
+    return dp
 
 
 async def set_commands(bot: Bot):
@@ -34,6 +122,8 @@ async def set_commands(bot: Bot):
         BotCommand(command="catalog", description="🛍 Каталог товаров"),
         BotCommand(command="add_products", description="📦 Добавить товары"),
         BotCommand(command="sell", description="💰 Продать товар"),
+        BotCommand(command="s", description="⚡ Быстрая продажа"),
+        BotCommand(command="stocktake", description="📋 Инвентаризация"),
         BotCommand(command="cancel", description="❌ Отменить операцию"),
     ]
     await bot.set_my_commands(commands)
@@ -44,20 +134,19 @@ async def init_database() -> tuple[AsyncDatabaseManager, BrandsSQL, ProductsSQL,
     try:
         # Используем переменную окружения для пути к БД или дефолтное значение
         db_path = os.getenv('DATABASE_PATH', 'products.db')
-        manager = AsyncDatabaseManager(db_path)
+        # Запросы медленнее порога логируются вместе с планом
+        manager = AsyncDatabaseManager(db_path, slow_query_ms=load_config().slow_query_ms)
+        # Счётчики запросов на апдейт (count_queries / QueryBudgetMiddleware)
+        manager.add_query_hook(record_query)
         brands_db = BrandsSQL(manager)
         products_db = ProductsSQL(manager)
         sales_db = SalesSQL(manager)
         
-        # Создаём таблицы (порядок важен из-за FK!)
-        brands_created = await brands_db.create_tables()
-        products_created = await products_db.create_tables()
-        sales_created = await sales_db.create_tables()
-        
-        if brands_created and products_created and sales_created:
-            logger.info("✅ Database tables created successfully")
-        else:
-            logger.error("❌ Failed to create database tables")
+        # Одно соединение на всё время работы, схема - одним скриптом
+        await manager.connect()
+        await manager.executescript(create_schema_sql())
+        await manager.add_missing_columns(SCHEMA_COLUMNS)
+        logger.info("✅ Database tables created successfully")
             
         return manager, brands_db, products_db, sales_db
     except Exception as e:
@@ -65,54 +154,264 @@ async def init_database() -> tuple[AsyncDatabaseManager, BrandsSQL, ProductsSQL,
         raise
 
 
-async def on_startup():
+def attach_database(
+    dp: OrderedDispatcher,
+    manager: AsyncDatabaseManager,
+    brands_db: BrandsSQL,
+    products_db: ProductsSQL,
+    sales_db: SalesSQL
+) -> None:
+    """Передаём БД в хендлеры через middleware"""
+    dp["brands_db"] = brands_db
+    dp["products_db"] = products_db
+    dp["sales_db"] = sales_db
+    dp["reservations_db"] = ReservationsSQL(manager)
+    dp["stocktake_db"] = StocktakeSQL(manager)
+    dp["db_manager"] = manager
+
+
+async def sweep_reservations(reservations_db: ReservationsSQL, interval: float = 30.0):
+    """Фоновое снятие истёкших резервов (брошенные продажи)"""
+    while True:
+        await reservations_db.sweep_expired()
+        await asyncio.sleep(interval)
+
+
+def start_background_tasks(dp: OrderedDispatcher) -> None:
+    dp["reservation_sweeper"] = asyncio.create_task(
+        sweep_reservations(dp["reservations_db"])
+    )
+
+
+async def on_startup(bot: Bot):
     """Действия при запуске бота"""
-    logger.info("🚀 Bot is starting...")
     await set_commands(bot)
     logger.info("✅ Bot commands set")
 
 
-async def on_shutdown():
-    """Действия при остановке бота"""
+async def on_shutdown(
+    bot: Bot,
+    dp: OrderedDispatcher,
+    rate_limiter: RateLimitMiddleware,
+    manager: AsyncDatabaseManager | None,
+    timeout: float
+):
+    """
+    Действия при остановке бота
+
+    Порядок важен: перестаём принимать апдейты, дожидаемся начатых
+    хендлеров и записей в БД, и только потом закрываем соединения.
+    """
     logger.info("🛑 Bot is shutting down...")
+    deadline = time.monotonic() + timeout
+
+    # 1. Новые апдейты больше не принимаем
+    dp.lanes.close()
+    pending = dp.lanes.stats()
+    processed_before = pending["processed"]
+    logger.info(
+        f"📥 Draining updates: {pending['in_flight']} in flight, "
+        f"{pending['queued']} queued"
+    )
+
+    # 2. Ждём начатые хендлеры (в том числе их исходящие сообщения)
+    if await dp.lanes.join(timeout):
+        logger.info(f"✅ Drained {dp.lanes.processed - processed_before} updates")
+    else:
+        logger.warning(f"⚠️ Shutdown deadline exceeded, left: {dp.lanes.stats()}")
+    logger.info(f"📤 Outbound queue: {rate_limiter.stats()}")
+    logger.info(f"✏️ Message edits: {renderer.stats()}")
+
+    # 3. Фоновые задачи, кеши, хранилище состояний и запись апдейтов
+    sweeper: asyncio.Task | None = dp.get("reservation_sweeper")
+    if sweeper is not None:
+        sweeper.cancel()
+    recorder: UpdateRecorder | None = dp.get("update_recorder")
+    if recorder is not None:
+        await recorder.close()
+        logger.info(f"📼 Recorded {recorder.recorded} updates")
+    render_cache.clear()
+    renderer.clear()
+    product_index.clear()
+    photo_cache.clear()
+    await dp.storage.close()
+
+    # 4. Очередь записей, чекпоинт WAL и закрытие БД
+    if manager is not None:
+        for name, stats in manager.top_queries(5).items():
+            logger.info(f"🗄 Query {name}: {stats}")
+        await manager.close(timeout=max(deadline - time.monotonic(), 1.0))
+        logger.info("✅ Database closed")
+
     await bot.session.close()
     logger.info("✅ Bot stopped")
 
 
+# ===== WEBHOOK MODE =====
+
+async def serve_worker(index: int, socket_path: str):
+    """Воркер: принимает апдейты от супервизора и раскладывает по полосам"""
+    config = load_config()
+    log_listener = configure_logging(
+        level=config.log_level,
+        json_output=config.log_json,
+        sample_rate=config.log_sample_rate
+    )
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+
+    # Глобальный лимит Bot API общий на бота - делим между воркерами
+    bot, rate_limiter = create_bot(config, global_rate=30.0 / config.workers)
+    dp = create_dispatcher(config)
+    dp["rate_limiter"] = rate_limiter
+
+    async def handle_update(request: web.Request) -> web.Response:
+        body = await request.read()
+        try:
+            update = Update.model_validate_json(body, context={"bot": bot})
+        except ValidationError as e:
+            # Повтор от Telegram придёт таким же - подтверждаем и пропускаем
+            logger.error(f"❌ Dropping malformed update: {e}\n{body[:1000]!r}")
+            return web.Response()
+
+        done = await dp.submit_update(bot, update)
+        if done is None:
+            return web.Response(status=503)
+        # Отвечаем после обработки: если воркер упадёт раньше, супервизор
+        # вернёт 503 и Telegram пришлёт апдейт снова. Долгие хендлеры
+        # (импорт файла) подтверждаем по таймауту - повтор продублировал бы их
+        try:
+            await asyncio.wait_for(asyncio.shield(done), WORKER_ACK_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Update {update.update_id} still running, acknowledged early")
+        return web.Response()
+
+    manager = None
+    runner = None
+    try:
+        databases = await init_database()
+        manager = databases[0]
+        attach_database(dp, *databases)
+        start_background_tasks(dp)
+
+        app = web.Application()
+        app.router.add_post(WORKER_ROUTE, handle_update)
+        runner = web.AppRunner(app, handle_signals=False)
+        await runner.setup()
+        await web.UnixSite(runner, socket_path).start()
+        logger.info(f"✅ Worker {index} ready")
+        await stop.wait()
+    except Exception as e:
+        logger.error(f"❌ Worker {index} error: {e}", exc_info=True)
+        raise
+    finally:
+        try:
+            if runner is not None:
+                await runner.cleanup()
+            await on_shutdown(bot, dp, rate_limiter, manager, config.shutdown_timeout)
+        finally:
+            shutdown_logging(log_listener)
+
+
+def run_worker(index: int, socket_path: str):
+    """Точка входа процесса-воркера (останавливается SIGTERM от супервизора)"""
+    # Ctrl+C получает вся группа процессов - останавливает только супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve_worker(index, socket_path))
+
+
+async def run_webhook(config: BotConfig):
+    """Супервизор: схема БД, webhook и команды, затем воркеры до сигнала"""
+    # Схему создаём один раз до старта воркеров
+    manager, *_ = await init_database()
+    await manager.close()
+
+    bot = Bot(token=config.BOT_TOKEN)
+    try:
+        await on_startup(bot)
+        await bot.set_webhook(
+            url=config.webhook_url + config.webhook_path,
+            secret_token=config.webhook_secret,
+            allowed_updates=create_dispatcher(config).resolve_used_update_types()
+        )
+        logger.info(f"✅ Webhook set to {config.webhook_url}{config.webhook_path}")
+    finally:
+        await bot.session.close()
+
+    stop = asyncio.Event()
+    install_stop_signals(stop)
+    with tempfile.TemporaryDirectory(prefix="bot-workers-") as socket_dir:
+        await Supervisor(config, run_worker, socket_dir).run(stop)
+
+
 async def start_bot():
     """Запуск бота"""
+    started = time.perf_counter()
+
     try:
-        # Инициализируем БД
-        manager, brands_db, products_db, sales_db = await init_database()
-        
-        # Передаём БД в хендлеры через middleware
-        dp["brands_db"] = brands_db
-        dp["products_db"] = products_db
-        dp["sales_db"] = sales_db
-        dp["db_manager"] = manager
-        
-        # Подключаем middleware
-        dp.message.middleware(DatabaseMiddleware())
-        dp.callback_query.middleware(DatabaseMiddleware())
-        
-        # Подключаем роутеры (порядок важен!)
-        dp.include_router(start_router)      # Первым - start и menu
-        dp.include_router(cancel_router)     # Вторым - отмена
-        dp.include_router(catalog_router)    # Каталог
-        dp.include_router(add_products_router)
-        dp.include_router(sell_router)
+        config = load_config()
+    except ValueError as e:
+        print(f"❌ Configuration error: {e}")
+        print("💡 Please set BOT_TOKEN environment variable")
+        print("💡 Example: export BOT_TOKEN='your_token_here'")
+        print("💡 Example: export ADMIN_IDS='123456789,987654321'")
+        raise SystemExit(1)
+
+    # Уровень и формат логов - из конфигурации, поэтому после неё
+    log_listener = configure_logging(
+        level=config.log_level,
+        json_output=config.log_json,
+        sample_rate=config.log_sample_rate
+    )
+    logger.info("🚀 Bot is starting...")
+    logger.info(f"⏱ Startup phase 'config': {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    if config.webhook_url:
+        try:
+            await run_webhook(config)
+        finally:
+            shutdown_logging(log_listener)
+        return
+
+    if config.workers > 1:
+        logger.warning("⚠️ WORKERS > 1 requires WEBHOOK_URL, running a single polling process")
+
+    with startup_phase("dispatcher"):
+        bot, rate_limiter = create_bot(config)
+        dp = create_dispatcher(config)
+
+    manager = None
+    try:
+        # Команды бота и БД готовим параллельно
+        (manager, brands_db, products_db, sales_db), _ = await asyncio.gather(
+            timed("database", init_database()),
+            timed("commands", on_startup(bot)),
+        )
         
-        # Стартуем
-        await on_startup()
+        attach_database(dp, manager, brands_db, products_db, sales_db)
+        dp["rate_limiter"] = rate_limiter
+        start_background_tasks(dp)
         
-        logger.info("🎉 Bot started successfully! Polling...")
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        logger.info(
+            f"🎉 Bot started successfully in "
+            f"{(time.perf_counter() - started) * 1000:.0f} ms! Polling..."
+        )
+        await dp.start_polling(
+            bot,
+            allowed_updates=dp.resolve_used_update_types(),
+            handle_as_tasks=False,  # параллелизм обеспечивают полосы чатов
+            close_bot_session=False  # сессия нужна, пока дорабатывают хендлеры
+        )
         
     except Exception as e:
         logger.error(f"❌ Critical error during bot startup: {e}", exc_info=True)
         raise
     finally:
-        await on_shutdown()
+        try:
+            await on_shutdown(bot, dp, rate_limiter, manager, config.shutdown_timeout)
+        finally:
+            # Дописываем очередь логов до выхода из процесса
+            shutdown_logging(log_listener)
 
 
 if __name__ == '__main__':
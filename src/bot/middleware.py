@@ -1,10 +1,42 @@
-from typing import Callable, Dict, Any, Awaitable
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Awaitable, TypeVar
 from aiogram import BaseMiddleware
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, Update
+
+from db.profiling import QueryBudgetExceeded, count_queries
+from src.bot.utils.recorder import UpdateRecorder
+from src.bot.utils.token_bucket import TokenBucket
+
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def query_budget(limit: int) -> Callable[[F], F]:
+    """
+    Максимум запросов к БД на один вызов хендлера
+
+    Проверяется QueryBudgetMiddleware (включается QUERY_BUDGET_MODE).
+    """
+    def decorator(func: F) -> F:
+        func.__query_budget__ = limit
+        return func
+    return decorator
 
 
 class DatabaseMiddleware(BaseMiddleware):
-    """Middleware для передачи БД в хендлеры"""
+    """
+    Middleware для передачи БД в хендлеры
+
+    С `sync_external_writes=True` (несколько процессов на одной базе) перед
+    хендлером проверяет, не писал ли в базу другой воркер, - иначе кеши
+    каталога показывали бы устаревшие остатки.
+    """
+
+    def __init__(self, sync_external_writes: bool = False):
+        self.sync_external_writes = sync_external_writes
     
     async def __call__(
         self,
@@ -22,5 +54,144 @@ class DatabaseMiddleware(BaseMiddleware):
             data["products_db"] = products_db
         if sales_db:
             data["sales_db"] = sales_db
+
+        manager = data.get("db_manager")
+        if self.sync_external_writes and manager is not None:
+            await manager.sync_external_writes()
             
-        return await handler(event, data)
\ No newline at end of file
+        return await handler(event, data)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничение частоты колбэков на пользователя и действие
+
+    Действие - префикс callback_data до ':' (catalog_page, sell_brand, ...).
+    Лишние нажатия сразу получают callback.answer() и не доходят до БД.
+    """
+
+    def __init__(
+        self,
+        rate: float = 2.0,
+        burst: float = 3.0,
+        limits: Dict[str, tuple[float, float]] | None = None,
+        max_keys: int = 10_000
+    ):
+        """
+        Args:
+            rate: токенов в секунду по умолчанию
+            burst: размер пачки нажатий по умолчанию
+            limits: {префикс: (rate, burst)} для отдельных действий
+            max_keys: сколько бакетов (пользователь, действие) держать в памяти
+        """
+        self.rate = rate
+        self.burst = burst
+        self.limits = limits or {}
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[tuple[int, str], TokenBucket] = OrderedDict()
+        self.throttled = 0
+
+    def _bucket(self, user_id: int, action: str) -> TokenBucket:
+        key = (user_id, action)
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._buckets.move_to_end(key)
+            return bucket
+
+        rate, burst = self.limits.get(action, (self.rate, self.burst))
+        bucket = TokenBucket(rate, capacity=burst)
+        self._buckets[key] = bucket
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return bucket
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        action = (event.data or "").split(":", 1)[0]
+
+        if self._bucket(event.from_user.id, action).consume():
+            self.throttled += 1
+            return await event.answer("⏳ Слишком часто, подождите секунду")
+
+        return await handler(event, data)
+
+
+class RecordingMiddleware(BaseMiddleware):
+    """Outer-middleware апдейтов: пишет каждый апдейт в UpdateRecorder"""
+
+    def __init__(self, recorder: UpdateRecorder):
+        self.recorder = recorder
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        try:
+            self.recorder.record(event)
+        except Exception as e:
+            # Запись не должна мешать обработке апдейта
+            logger.error(f"Error recording update {event.update_id}: {e}")
+        return await handler(event, data)
+
+
+class QueryBudgetMiddleware(BaseMiddleware):
+    """
+    Подсчёт запросов к БД на каждый апдейт
+
+    Ловит N+1 (один и тот же statement `repeat_threshold`+ раз за апдейт)
+    и превышение бюджета из @query_budget. В режиме strict нарушение -
+    исключение QueryBudgetExceeded (для прогонов в CI), иначе - warning.
+    Счётчик работает через хук AsyncDatabaseManager.add_query_hook(record_query).
+    """
+
+    def __init__(self, strict: bool = False, repeat_threshold: int = 3):
+        self.strict = strict
+        self.repeat_threshold = repeat_threshold
+        # {хендлер: [вызовов, запросов всего, максимум за вызов]}
+        self.handlers: Dict[str, list[int]] = {}
+        self.violations: list[str] = []
+
+    async def __call__(
+        self,
+        handler: Callable[[Message | CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: Message | CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        with count_queries() as queries:
+            result = await handler(event, data)
+
+        callback = data["handler"].callback
+        name = callback.__name__
+        stats = self.handlers.setdefault(name, [0, 0, 0])
+        stats[0] += 1
+        stats[1] += queries.count
+        stats[2] = max(stats[2], queries.count)
+
+        problems = []
+        budget = getattr(callback, "__query_budget__", None)
+        if budget is not None and queries.count > budget:
+            problems.append(f"{queries.count} queries, budget {budget}")
+        repeated = queries.repeated(self.repeat_threshold)
+        if repeated:
+            problems.append(f"N+1 suspected: {repeated}")
+
+        if problems:
+            message = f"Query budget violated in {name}: {'; '.join(problems)} ({queries.describe()})"
+            self.violations.append(message)
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return result
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {"calls": calls, "avg": total / calls, "max": peak}
+            for name, (calls, total, peak) in sorted(self.handlers.items())
+        }
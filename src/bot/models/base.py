@@ -1,6 +1,7 @@
 from pydantic import BaseModel
 from enum import StrEnum
 from datetime import datetime
+from typing import NamedTuple
 
 
 class ProductCategory(StrEnum):
@@ -18,6 +19,23 @@ class BrandModel(BaseModel):
     category: ProductCategory
 
 
+class ProductRow(NamedTuple):
+    """Строка приёмки товара: без валидации pydantic, для пакетной записи"""
+    category: ProductCategory
+    brand: str
+    flavor: str
+    quantity: int
+    price: float
+
+
+class StockCountRow(NamedTuple):
+    """Строка инвентаризации: фактический остаток товара"""
+    category: ProductCategory
+    brand: str
+    flavor: str
+    quantity: int
+
+
 class ProductModel(BaseModel):
     """Модель товара (вкуса)"""
     id: int | None = None
@@ -27,6 +45,12 @@ class ProductModel(BaseModel):
     flavor: str  # Вкус
     quantity: int
     price: float
+    reserved: int = 0  # Держат незавершённые продажи
+
+    @property
+    def available(self) -> int:
+        """Свободный остаток: без действующих резервов"""
+        return self.quantity - self.reserved
 
 
 class SaleModel(BaseModel):
@@ -39,4 +63,5 @@ class SaleModel(BaseModel):
     admin_id: int
     quantity: int
     price: float
-    sale_date: datetime
\ No newline at end of file
+    sale_date: datetime
+    group_id: int | None = None  # Номер чека для продаж из корзины
\ No newline at end of file
@@ -0,0 +1,221 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Iterator
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    EditMessageCaption,
+    EditMessageMedia,
+    EditMessageReplyMarkup,
+    EditMessageText,
+)
+from aiogram.methods.base import Response, TelegramMethod, TelegramType
+
+from src.bot.utils.token_bucket import TokenBucket
+
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Приоритет исходящего запроса (меньше - раньше)"""
+    high = 0
+    normal = 1
+    low = 2
+
+
+# Правки сообщений (листание каталога) можно отложить
+LOW_PRIORITY_METHODS = (
+    EditMessageText,
+    EditMessageReplyMarkup,
+    EditMessageCaption,
+    EditMessageMedia,
+)
+
+_current_priority: ContextVar[Priority | None] = ContextVar(
+    "send_priority", default=None
+)
+
+
+@contextmanager
+def send_priority(priority: Priority) -> Iterator[None]:
+    """Задать приоритет для всех запросов внутри блока"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class PriorityGate:
+    """Очередь ожидания токенов бакета с приоритетными полосами"""
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump: asyncio.Task | None = None
+
+    async def acquire(self, priority: Priority) -> None:
+        if not self._waiters and self.bucket.consume() == 0:
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run())
+        await future
+
+    async def _run(self) -> None:
+        while self._waiters:
+            wait = self.bucket.consume()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # Ожидающий отменён - токен не потрачен
+                self.bucket.refund()
+                continue
+            future.set_result(None)
+
+    def depth(self) -> dict[str, int]:
+        counts = {p.name: 0 for p in Priority}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                counts[Priority(priority).name] += 1
+        return counts
+
+    @property
+    def idle(self) -> bool:
+        return not self._waiters and self.bucket.idle
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Ограничение исходящих запросов к Bot API
+
+    - глобальный бакет (~30 сообщений/с на бота)
+    - бакет на каждый чат (~1 сообщение/с, группы ~20 в минуту)
+    - приоритетные полосы: подтверждения продаж раньше правок каталога
+    - повтор после TelegramRetryAfter с паузой бакета
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        group_rate: float = 20 / 60,
+        max_retries: int = 3,
+        max_chats: int = 10_000,
+    ):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+
+        self._global = PriorityGate(TokenBucket(global_rate))
+        self._chats: OrderedDict[int | str, PriorityGate] = OrderedDict()
+
+        self.sent = 0
+        self.retries = 0
+        self.in_flight = 0
+
+    def _chat_gate(self, chat_id: int | str) -> PriorityGate:
+        gate = self._chats.get(chat_id)
+        if gate is not None:
+            self._chats.move_to_end(chat_id)
+            return gate
+
+        is_group = isinstance(chat_id, str) or chat_id < 0
+        rate = self.group_rate if is_group else self.chat_rate
+        gate = PriorityGate(TokenBucket(rate, capacity=1.0))
+        self._chats[chat_id] = gate
+
+        # Выбрасываем самые старые простаивающие чаты
+        while len(self._chats) > self.max_chats:
+            oldest_id, oldest = next(iter(self._chats.items()))
+            if not oldest.idle:
+                break
+            del self._chats[oldest_id]
+
+        return gate
+
+    @staticmethod
+    def _resolve_priority(method: TelegramMethod[Any]) -> Priority:
+        priority = _current_priority.get()
+        if priority is not None:
+            return priority
+        if isinstance(method, LOW_PRIORITY_METHODS):
+            return Priority.low
+        return Priority.normal
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        priority = self._resolve_priority(method)
+        attempt = 0
+
+        while True:
+            chat_gate = self._chat_gate(chat_id) if chat_id is not None else None
+            if chat_gate is not None:
+                await chat_gate.acquire(priority)
+            # Лимит на бота общий для всех запросов, в том числе без чата
+            await self._global.acquire(priority)
+
+            self.in_flight += 1
+            try:
+                response = await make_request(bot, method)
+                self.sent += 1
+                return response
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self.retries += 1
+                if attempt > self.max_retries:
+                    logger.error(
+                        f"Flood control: giving up {type(method).__name__} "
+                        f"after {self.max_retries} retries"
+                    )
+                    raise
+
+                logger.warning(
+                    f"Flood control: {type(method).__name__} chat={chat_id}, "
+                    f"retry in {e.retry_after}s (attempt {attempt})"
+                )
+                # Flood control действует на весь бот - держим и глобальный бакет
+                self._global.bucket.pause(e.retry_after)
+                if chat_gate is not None:
+                    chat_gate.bucket.pause(e.retry_after)
+            finally:
+                self.in_flight -= 1
+
+    def stats(self) -> dict[str, Any]:
+        """Метрики очередей"""
+        queued = self._global.depth()
+        for gate in self._chats.values():
+            for name, count in gate.depth().items():
+                queued[name] += count
+
+        return {
+            "queued": queued,
+            "in_flight": self.in_flight,
+            "chats": len(self._chats),
+            "sent": self.sent,
+            "retries": self.retries,
+        }
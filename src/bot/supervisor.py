@@ -0,0 +1,190 @@
+"""
+Режим webhook: супервизор и N процессов-воркеров на одной базе
+
+Супервизор принимает POST от Telegram, по id чата выбирает воркер и
+пересылает ему тело апдейта через unix-сокет. Апдейты одного чата всегда
+попадают в один процесс, поэтому порядок внутри чата, состояния FSM
+(MemoryStorage) и лимиты на чат работают так же, как в одном процессе.
+Воркер отвечает после обработки апдейта, поэтому апдейты упавшего
+воркера (и пришедшие, пока он перезапускается) получают 503 и Telegram
+присылает их повторно. Долгие апдейты воркер подтверждает по таймауту,
+не дожидаясь конца обработки.
+
+Воркеры пишут в один файл SQLite (WAL), а свои кеши каталога сбрасывают
+по PRAGMA data_version (DatabaseMiddleware, sync_external_writes).
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from multiprocessing.process import BaseProcess
+from typing import Callable
+
+import aiohttp
+from aiohttp import web
+
+from src.bot.config import BotConfig
+from src.bot.dispatcher import raw_update_chat_key
+
+
+logger = logging.getLogger(__name__)
+
+WORKER_ROUTE = "/update"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+WorkerTarget = Callable[[int, str], None]
+
+
+def worker_socket_path(directory: str, index: int) -> str:
+    return os.path.join(directory, f"worker-{index}.sock")
+
+
+class Supervisor:
+    """
+    Процессы-воркеры и приём webhook перед ними
+
+    `target(index, socket_path)` - точка входа воркера (функция уровня
+    модуля: процессы запускаются через spawn).
+    """
+
+    def __init__(
+        self,
+        config: BotConfig,
+        target: WorkerTarget,
+        socket_dir: str,
+        restart_delay: float = 1.0,
+        forward_timeout: float = 60.0
+    ):
+        self.config = config
+        self.target = target
+        self.socket_dir = socket_dir
+        self.restart_delay = restart_delay
+        self.forward_timeout = forward_timeout
+
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: list[BaseProcess | None] = [None] * config.workers
+        self._sessions: list[aiohttp.ClientSession] = []
+        self._stopping = False
+
+        self.forwarded = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    def _start_worker(self, index: int) -> None:
+        path = worker_socket_path(self.socket_dir, index)
+        if os.path.exists(path):
+            os.unlink(path)
+        process = self._context.Process(
+            target=self.target, args=(index, path), name=f"worker-{index}"
+        )
+        process.start()
+        self._processes[index] = process
+        logger.info(f"👷 Worker {index} started (pid {process.pid})")
+
+    async def _monitor(self) -> None:
+        """Перезапуск упавших воркеров"""
+        while not self._stopping:
+            await asyncio.sleep(self.restart_delay)
+            for index, process in enumerate(self._processes):
+                if self._stopping or process is None or process.is_alive():
+                    continue
+                logger.error(f"❌ Worker {index} exited with code {process.exitcode}, restarting")
+                self.restarts += 1
+                self._start_worker(index)
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        secret = self.config.webhook_secret
+        if secret and request.headers.get(SECRET_HEADER) != secret:
+            return web.Response(status=401)
+
+        body = await request.read()
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+
+        index = raw_update_chat_key(payload) % len(self._sessions)
+        try:
+            async with self._sessions[index].post(
+                f"http://worker{WORKER_ROUTE}",
+                data=body,
+                headers={"Content-Type": "application/json"}
+            ) as response:
+                accepted = response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"⚠️ Worker {index} unavailable: {e}")
+            accepted = False
+
+        if not accepted:
+            # Telegram повторит апдейт позже
+            self.rejected += 1
+            return web.Response(status=503)
+        self.forwarded += 1
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._processes),
+            "alive": sum(p is not None and p.is_alive() for p in self._processes),
+            "forwarded": self.forwarded,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+        }
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Запустить воркеры и приём webhook, работать до `stop`"""
+        timeout = aiohttp.ClientTimeout(total=self.forward_timeout)
+        for index in range(self.config.workers):
+            self._start_worker(index)
+            connector = aiohttp.UnixConnector(path=worker_socket_path(self.socket_dir, index))
+            self._sessions.append(aiohttp.ClientSession(connector=connector, timeout=timeout))
+
+        app = web.Application()
+        app.router.add_post(self.config.webhook_path, self.handle_update)
+        app.router.add_get("/", self.handle_health)
+        runner = web.AppRunner(app, handle_signals=False)
+        await runner.setup()
+        await web.TCPSite(runner, self.config.web_host, self.config.web_port).start()
+        logger.info(
+            f"🌐 Webhook on {self.config.web_host}:{self.config.web_port}"
+            f"{self.config.webhook_path}, {self.config.workers} workers"
+        )
+
+        monitor = asyncio.create_task(self._monitor())
+        try:
+            await stop.wait()
+        finally:
+            self._stopping = True
+            monitor.cancel()
+            # Сначала перестаём принимать апдейты, потом останавливаем воркеры
+            await runner.cleanup()
+            await self._stop_workers()
+            for session in self._sessions:
+                await session.close()
+            logger.info(f"🛑 Supervisor stopped: {self.stats()}")
+
+    async def _stop_workers(self) -> None:
+        """SIGTERM воркерам: каждый дорабатывает свои апдейты (on_shutdown)"""
+        processes = [p for p in self._processes if p is not None and p.is_alive()]
+        for process in processes:
+            process.terminate()
+
+        deadline = time.monotonic() + self.config.shutdown_timeout + 5
+        for process in processes:
+            await asyncio.to_thread(process.join, max(deadline - time.monotonic(), 0.1))
+            if process.is_alive():
+                logger.warning(f"⚠️ Worker {process.name} did not stop in time, killing")
+                process.kill()
+
+
+def install_stop_signals(stop: asyncio.Event) -> None:
+    """SIGTERM и SIGINT завершают процесс штатно"""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
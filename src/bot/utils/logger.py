@@ -1,16 +1,126 @@
+import json
 import logging
+import queue
+import sys
+from collections import Counter
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+
+TEXT_FORMAT = "[%(asctime)s] [%(levelname)s] %(name)s: %(message)s"
 
 
 def setup_logger(name: str) -> logging.Logger:
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-
-    if not logger.handlers:
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter(
-            "[%(asctime)s] [%(levelname)s] %(name)s: %(message)s"
-        )
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-
-    return logger
+    """
+    Логгер модуля
+
+    Своих обработчиков не вешает: записи уходят в корневой логгер,
+    а оттуда - в очередь configure_logging() (один вывод, без дублей).
+    """
+    return logging.getLogger(name)
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON (для сборщиков логов)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        if getattr(record, "sampled", 1) > 1:
+            payload["sampled"] = record.sampled
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает каждую N-ю INFO/DEBUG запись с одним и тем же шаблоном
+
+    Шаблон - это record.msg до подстановки аргументов, поэтому частые
+    сообщения нужно писать в %-стиле: logger.info("User %s opened catalog", id).
+    Первая запись шаблона проходит всегда, WARNING и выше - все.
+    """
+
+    def __init__(self, rate: float, max_templates: int = 10_000):
+        super().__init__()
+        self.every = max(round(1 / rate), 1) if rate > 0 else 0
+        self.max_templates = max_templates
+        self._seen: Counter[tuple[str, object]] = Counter()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every == 1 or record.levelno >= logging.WARNING:
+            return True
+        if self.every == 0:
+            return False
+
+        key = (record.name, record.msg)
+        count = self._seen[key]
+        if count == 0 and len(self._seen) >= self.max_templates:
+            # Уникальные f-строки не должны раздувать счётчик
+            self._seen.clear()
+        self._seen[key] = count + 1
+        if count % self.every:
+            return False
+        record.sampled = self.every if count else 1
+        return True
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке
+
+    Стандартный prepare() подставляет аргументы и форматирует traceback
+    прямо в цикле событий. Здесь запись уходит в очередь как есть, а всё
+    форматирование делает поток QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure_logging(
+    level: str = "INFO",
+    json_output: bool = False,
+    sample_rate: float = 1.0,
+) -> QueueListener:
+    """
+    Логирование через очередь и один фоновый поток записи
+
+    Вызывающий код только кладёт запись в очередь - медленный stdout
+    (например, забитый json-file драйвер Docker) не тормозит обработку
+    апдейтов. Возвращает запущенный listener: остановить его при выходе,
+    чтобы дописать хвост очереди.
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT))
+    listener = QueueListener(log_queue, stream, respect_handler_level=True)
+
+    handler = LazyQueueHandler(log_queue)
+    if sample_rate < 1.0:
+        handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    listener.start()
+    return listener
+
+
+def shutdown_logging(listener: QueueListener) -> None:
+    """Дописать очередь и вернуть прямой вывод для сообщений после остановки"""
+    listener.stop()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, QueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(*listener.handlers)
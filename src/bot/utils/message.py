@@ -26,4 +26,30 @@ ADD_PRODUCTS_HELP = """📦 <b>Добавление товаров</b>
 • Если товар (бренд + вкус) существует - количество суммируется
 • Можно добавить несколько товаров за раз
 
-Отменить: /cancel"""
\ No newline at end of file
+📎 <b>Много товаров?</b> Пришли файл .csv или .xlsx с теми же
+колонками (категория, бренд, вкус, количество, цена), строка
+заголовка допускается. Строки с ошибками придут отдельным файлом.
+
+Отменить: /cancel"""
+
+
+STOCKTAKE_HELP = """📋 <b>Инвентаризация</b>
+
+Отправь фактические остатки списком:
+
+<code>категория | бренд | вкус | количество</code>
+
+<b>Пример:</b>
+<code>снюс | BOSHKI | Ice Mint | 48
+снюс | BOSHKI | Grape | 30
+жидкости | Elf Bar | Banana Ice | 97</code>
+
+📎 Или файлом .csv / .xlsx с теми же колонками (строка заголовка
+допускается).
+
+⚠️ <b>Важно:</b>
+• Товар, посчитанный в нескольких строках, суммируется
+• Бот покажет расхождения - остатки меняются только после подтверждения
+• Товары не из списка не меняются (или обнуляются - на выбор при подтверждении)
+
+Отменить: /cancel"""
@@ -1,118 +1,250 @@
-from typing import List, Tuple
-from src.bot.models.base import ProductModel, ProductCategory, BrandModel
+import abc
+import math
+from typing import Iterable, List, NamedTuple, Tuple
+from src.bot.models.base import ProductModel, ProductCategory, ProductRow, BrandModel, StockCountRow
 
 
-def parse_batch_products(text: str) -> Tuple[List[Tuple[BrandModel, ProductModel]], List[str]]:
+# Справочники собираются один раз при импорте, а не на каждой строке
+CATEGORIES: dict[str, ProductCategory] = {cat.value: cat for cat in ProductCategory}
+CATEGORIES_HINT = ", ".join(CATEGORIES)
+FORMAT_HINT = "Формат: категория | бренд | вкус | количество | цена"
+COUNT_FORMAT_HINT = "Формат: категория | бренд | вкус | количество"
+
+# Сколько текстов ошибок хранить: дальше только считаем
+MAX_ERRORS = 50
+# Сколько символов ошибок в ответе сообщением (лимит Telegram - 4096)
+ERRORS_TEXT_LIMIT = 3500
+
+
+class RowParser(abc.ABC):
+    """
+    Общая часть разборщиков строк таблицы: накопление строк с объединением
+    дублей и учёт ошибок
+
+    Одинаковые (категория, бренд, вкус) складываются по количеству, так что
+    в базу уходит минимум строк. Хранится не больше `max_errors` текстов
+    ошибок, остальные считаются. Разбор строки - feed() в подклассе.
+    """
+
+    __slots__ = ("max_errors", "errors", "error_count", "lines", "_rows")
+
+    def __init__(self, max_errors: int = MAX_ERRORS):
+        self.max_errors = max_errors
+        self.errors: list[str] = []
+        self.error_count = 0
+        self.lines = 0
+        self._rows: dict[tuple[ProductCategory, str, str], NamedTuple] = {}
+
+    def _error(self, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(message)
+
+    def _check_fields(self, parts: List[str], line_num: int, expected: int, hint: str) -> bool:
+        if len(parts) != expected:
+            self._error(
+                f"⚠️ Строка {line_num}: неверное количество полей "
+                f"(ожидается {expected}, получено {len(parts)})\n{hint}"
+            )
+            return False
+        return True
+
+    def _parse_names(
+        self, category_str: str, brand_name: str, flavor: str, line_num: int
+    ) -> ProductCategory | None:
+        """Категория, бренд и вкус (уже без пробелов по краям). None - ошибка"""
+        category = CATEGORIES.get(category_str.lower())
+        if category is None:
+            self._error(
+                f"⚠️ Строка {line_num}: неизвестная категория '{category_str}'. "
+                f"Доступные: {CATEGORIES_HINT}"
+            )
+            return None
+        if len(brand_name) < 2:
+            self._error(f"⚠️ Строка {line_num}: название бренда слишком короткое")
+            return None
+        if len(flavor) < 2:
+            self._error(f"⚠️ Строка {line_num}: название вкуса слишком короткое")
+            return None
+        return category
+
+    def _parse_quantity(self, quantity_str: str, line_num: int) -> int | None:
+        try:
+            quantity = int(quantity_str)
+        except ValueError:
+            self._error(f"⚠️ Строка {line_num}: '{quantity_str.strip()}' не является числом")
+            return None
+        if quantity < 0:
+            self._error(f"⚠️ Строка {line_num}: количество не может быть отрицательным")
+            return None
+        return quantity
+
+    def _add(self, row: NamedTuple) -> None:
+        """Запомнить строку; дубль складывается с уже принятой по количеству"""
+        key = (row.category, row.brand, row.flavor)
+        existing = self._rows.get(key)
+        if existing is None:
+            self._rows[key] = row
+        else:
+            self._rows[key] = existing._replace(quantity=existing.quantity + row.quantity)
+
+    @abc.abstractmethod
+    def feed(self, parts: List[str], line_num: int) -> bool:
+        """Разобрать строку, уже разбитую на поля. False - строка с ошибкой"""
+
+    def feed_lines(self, lines: Iterable[str], start: int = 1) -> None:
+        for line_num, line in enumerate(lines, start=start):
+            # Разбиваем по разделителю |
+            self.feed(line.split('|'), line_num)
+
+    @property
+    def merged(self) -> int:
+        """Сколько строк-дублей слито с предыдущими"""
+        return self.lines - self.error_count - len(self._rows)
+
+    def take_rows(self) -> list:
+        """Забрать накопленные строки (для записи пачками)"""
+        rows = list(self._rows.values())
+        self._rows.clear()
+        return rows
+
+    def error_messages(self, max_chars: int | None = None) -> list[str]:
+        """
+        Тексты ошибок и строка о пропущенных сверх лимита
+
+        max_chars - не больше стольких символов в сумме (с переводами строк),
+        чтобы список поместился в одно сообщение
+        """
+        shown = self.errors
+        if max_chars is not None:
+            total = 0
+            for count, error in enumerate(self.errors):
+                total += len(error) + 1
+                if total > max_chars:
+                    shown = self.errors[:count]
+                    break
+        hidden = self.error_count - len(shown)
+        if hidden > 0:
+            return shown + [f"… и ещё ошибок: {hidden}"]
+        return list(shown)
+
+
+class BatchParser(RowParser):
     """
-    Парсит текст с товарами в новом формате
+    Разбор строк приёмки: категория | бренд | вкус | количество | цена
+
+    У дублей цена - из первой строки.
+    """
+
+    __slots__ = ()
+
+    def feed(self, parts: List[str], line_num: int) -> bool:
+        self.lines += 1
+        if not self._check_fields(parts, line_num, 5, FORMAT_HINT):
+            return False
+
+        category_str, brand_name, flavor, quantity_str, price_str = parts
+        brand_name = brand_name.strip()
+        flavor = flavor.strip()
+        category = self._parse_names(category_str.strip(), brand_name, flavor, line_num)
+        if category is None:
+            return False
+        quantity = self._parse_quantity(quantity_str, line_num)
+        if quantity is None:
+            return False
+
+        # Валидация цены
+        try:
+            price = float(price_str.replace(',', '.'))
+            # float() принимает и "inf" / "nan" - в цене им не место
+            if not math.isfinite(price):
+                raise ValueError(price_str)
+        except ValueError:
+            self._error(f"⚠️ Строка {line_num}: '{price_str.strip()}' не является числом")
+            return False
+        if price <= 0:
+            self._error(f"⚠️ Строка {line_num}: цена должна быть больше 0")
+            return False
+
+        self._add(ProductRow(category, brand_name, flavor, quantity, price))
+        return True
+
+
+class StockCountParser(RowParser):
+    """
+    Разбор строк инвентаризации: категория | бренд | вкус | количество
+
+    Один товар, посчитанный в нескольких местах (несколько строк),
+    складывается.
+    """
+
+    __slots__ = ()
+
+    def feed(self, parts: List[str], line_num: int) -> bool:
+        self.lines += 1
+        if not self._check_fields(parts, line_num, 4, COUNT_FORMAT_HINT):
+            return False
+
+        category_str, brand_name, flavor, quantity_str = (part.strip() for part in parts)
+        category = self._parse_names(category_str, brand_name, flavor, line_num)
+        if category is None:
+            return False
+        quantity = self._parse_quantity(quantity_str, line_num)
+        if quantity is None:
+            return False
+
+        self._add(StockCountRow(category, brand_name, flavor, quantity))
+        return True
+
+
+def parse_batch_rows(
+    text: str, max_errors: int = MAX_ERRORS, max_chars: int | None = None
+) -> Tuple[List[ProductRow], List[str]]:
+    """
+    Парсит текст с товарами в строки приёмки (дубли объединены)
     
     Формат: категория | бренд | вкус | количество | цена
     Пример: снюс | BOSHKI | Ice Mint | 50 | 450
     
     Returns:
-        Tuple[List[Tuple[BrandModel, ProductModel]], List[str]]: 
-        (список (бренд, товар), список ошибок)
+        (список ProductRow, список ошибок)
     """
     if not text or not text.strip():
         return [], ["❌ Пустое сообщение"]
-    
-    items = []  # [(brand, product), ...]
-    errors = []
-    
-    # Разбиваем на строки
-    lines = [line.strip() for line in text.strip().split('\n') if line.strip()]
-    
+
+    # Пустые строки не нумеруются - как и раньше
+    lines = [line for line in text.split('\n') if line.strip()]
     if not lines:
         return [], ["❌ Не найдено ни одной строки с товаром"]
+
+    parser = BatchParser(max_errors)
+    parser.feed_lines(lines)
+    return parser.take_rows(), parser.error_messages(max_chars)
+
+
+def parse_batch_products(text: str) -> Tuple[List[Tuple[BrandModel, ProductModel]], List[str]]:
+    """
+    Парсит текст с товарами в пары (бренд, товар)
     
-    for line_num, line in enumerate(lines, start=1):
-        try:
-            # Разбиваем по разделителю |
-            parts = [part.strip() for part in line.split('|')]
-            
-            if len(parts) != 5:
-                errors.append(
-                    f"⚠️ Строка {line_num}: неверное количество полей "
-                    f"(ожидается 5, получено {len(parts)})\n"
-                    f"Формат: категория | бренд | вкус | количество | цена"
-                )
-                continue
-            
-            category_str, brand_name, flavor, quantity_str, price_str = parts
-            
-            # Валидация категории
-            category_str_lower = category_str.lower()
-            valid_categories = [cat.value for cat in ProductCategory]
-            
-            if category_str_lower not in valid_categories:
-                errors.append(
-                    f"⚠️ Строка {line_num}: неизвестная категория '{category_str}'. "
-                    f"Доступные: {', '.join(valid_categories)}"
-                )
-                continue
-            
-            category = ProductCategory(category_str_lower)
-            
-            # Валидация бренда
-            if not brand_name or len(brand_name) < 2:
-                errors.append(
-                    f"⚠️ Строка {line_num}: название бренда слишком короткое"
-                )
-                continue
-            
-            # Валидация вкуса
-            if not flavor or len(flavor) < 2:
-                errors.append(
-                    f"⚠️ Строка {line_num}: название вкуса слишком короткое"
-                )
-                continue
-            
-            # Валидация количества
-            try:
-                quantity = int(quantity_str)
-                if quantity < 0:
-                    errors.append(
-                        f"⚠️ Строка {line_num}: количество не может быть отрицательным"
-                    )
-                    continue
-            except ValueError:
-                errors.append(
-                    f"⚠️ Строка {line_num}: '{quantity_str}' не является числом"
-                )
-                continue
-            
-            # Валидация цены
-            try:
-                price = float(price_str.replace(',', '.'))
-                if price <= 0:
-                    errors.append(
-                        f"⚠️ Строка {line_num}: цена должна быть больше 0"
-                    )
-                    continue
-            except ValueError:
-                errors.append(
-                    f"⚠️ Строка {line_num}: '{price_str}' не является числом"
-                )
-                continue
-            
-            # Создаём бренд и товар
-            brand = BrandModel(
-                name=brand_name,
-                category=category
-            )
-            
-            product = ProductModel(
+    Обёртка над parse_batch_rows для кода, которому нужны модели.
+    
+    Returns:
+        Tuple[List[Tuple[BrandModel, ProductModel]], List[str]]: 
+        (список (бренд, товар), список ошибок)
+    """
+    rows, errors = parse_batch_rows(text)
+    items = [
+        (
+            BrandModel(name=row.brand, category=row.category),
+            ProductModel(
                 brand_id=0,  # Будет установлен позже
-                flavor=flavor,
-                quantity=quantity,
-                price=price
+                flavor=row.flavor,
+                quantity=row.quantity,
+                price=row.price
             )
-            
-            items.append((brand, product))
-            
-        except Exception as e:
-            errors.append(f"⚠️ Строка {line_num}: неожиданная ошибка - {str(e)}")
-    
+        )
+        for row in rows
+    ]
     return items, errors
 
 
@@ -0,0 +1,50 @@
+"""Фото товаров и брендов: file_id Telegram в памяти процесса"""
+from db.crud import ProductsSQL
+
+
+# Bot API: не больше 10 фото в одном альбоме
+MEDIA_GROUP_SIZE = 10
+
+
+class PhotoCache:
+    """
+    file_id загруженных фото
+
+    Байты уходят в Telegram один раз - дальше фото отправляется по file_id.
+    Загружается одним запросом и перечитывается, только когда меняется
+    состав каталога (names_version, в том числе после записи другим
+    процессом); своё новое фото кладётся сразу через remember().
+    """
+
+    def __init__(self):
+        self._version: int | None = None
+        self._photos: dict[tuple[str, int], str] = {}
+
+    async def load(self, products_db: ProductsSQL) -> "PhotoCache":
+        version = products_db.db.names_version
+        if self._version != version:
+            rows = await products_db.get_photos()
+            self._photos = {(row["kind"], row["id"]): row["photo_file_id"] for row in rows}
+            self._version = version
+        return self
+
+    def remember(self, kind: str, object_id: int, file_id: str) -> None:
+        self._photos[(kind, object_id)] = file_id
+
+    def product(self, product_id: int) -> str | None:
+        """Собственное фото товара"""
+        return self._photos.get(("product", product_id))
+
+    def brand(self, brand_id: int) -> str | None:
+        return self._photos.get(("brand", brand_id))
+
+    def for_product(self, product) -> str | None:
+        """Фото для карточки: своё, иначе фото бренда"""
+        return self.product(product.id) or self.brand(product.brand_id)
+
+    def clear(self) -> None:
+        self._version = None
+        self._photos.clear()
+
+
+photo_cache = PhotoCache()
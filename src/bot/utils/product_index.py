@@ -0,0 +1,82 @@
+"""Поиск товара по названию бренда и вкуса (быстрая продажа /s)"""
+import re
+from dataclasses import dataclass
+
+from db.crud import ProductsSQL
+
+
+_SEPARATORS = re.compile(r"[^\w]+")
+
+
+def normalize_name(text: str) -> str:
+    """'Husky  Mint-Ice' -> 'husky mint ice' (регистр, ё, пунктуация)"""
+    return _SEPARATORS.sub(" ", text.lower().replace("ё", "е")).strip()
+
+
+@dataclass(frozen=True)
+class IndexedProduct:
+    id: int
+    brand_name: str
+    category: str
+    flavor: str
+    price: float
+
+    @property
+    def label(self) -> str:
+        return f"{self.brand_name} - {self.flavor}"
+
+
+class ProductIndex:
+    """
+    Точный поиск по нормализованному «бренд вкус» и запасной - по
+    префиксам слов («hus mint» находит «Husky Mint Ice»)
+    """
+
+    def __init__(self, rows: list[dict]):
+        self.products = [IndexedProduct(**row) for row in rows]
+        self.by_id = {product.id: product for product in self.products}
+        self._by_key: dict[str, list[IndexedProduct]] = {}
+        self._tokens: list[tuple[tuple[str, ...], IndexedProduct]] = []
+        for product in self.products:
+            key = normalize_name(f"{product.brand_name} {product.flavor}")
+            self._by_key.setdefault(key, []).append(product)
+            self._tokens.append((tuple(key.split()), product))
+
+    def exact(self, query: str) -> list[IndexedProduct]:
+        """Товары с точно таким «бренд вкус» (несколько - в разных категориях)"""
+        return self._by_key.get(normalize_name(query), [])
+
+    def search(self, query: str, limit: int = 8) -> list[IndexedProduct]:
+        """Товары, где каждое слово запроса - начало какого-то слова названия"""
+        words = normalize_name(query).split()
+        if not words:
+            return []
+        found = []
+        for tokens, product in self._tokens:
+            if all(any(token.startswith(word) for token in tokens) for word in words):
+                found.append(product)
+                if len(found) > limit:
+                    break
+        return found
+
+
+class ProductIndexCache:
+    """Индекс перестраивается, только когда меняется состав каталога (names_version)"""
+
+    def __init__(self):
+        self._version: int | None = None
+        self._index: ProductIndex | None = None
+
+    async def get(self, products_db: ProductsSQL) -> ProductIndex:
+        version = products_db.db.names_version
+        if self._index is None or self._version != version:
+            self._index = ProductIndex(await products_db.get_product_names())
+            self._version = version
+        return self._index
+
+    def clear(self) -> None:
+        self._version = None
+        self._index = None
+
+
+product_index = ProductIndexCache()
@@ -0,0 +1,150 @@
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from aiogram.types import Update
+
+
+logger = logging.getLogger(__name__)
+
+# Объекты, в которых лежат персональные данные пользователя или чата
+PERSON_KEYS = {"from", "chat", "user", "sender_chat", "forward_from", "via_bot"}
+CHAT_KEYS = {"chat", "sender_chat"}
+PERSON_FIELDS_TO_DROP = {"first_name", "last_name", "username", "title", "bio", "phone_number"}
+TEXT_KEYS = {"text", "caption"}
+
+_LETTERS = re.compile(r"[^\W\d_]", re.UNICODE)
+
+
+def redact_text(text: str) -> str:
+    """
+    Заменяет буквы на 'x', сохраняя команду, цифры и разделители
+
+    Так длина и структура сообщения (строки, '|', числа) остаются прежними.
+    """
+    command, sep, rest = text.partition(" ") if text.startswith("/") else ("", "", text)
+    return command + sep + _LETTERS.sub("x", rest)
+
+
+class Pseudonymizer:
+    """Стабильная замена id пользователей и чатов (HMAC с солью)"""
+
+    def __init__(self, salt: bytes):
+        self.salt = salt
+
+    def __call__(self, value: int) -> int:
+        digest = hmac.new(self.salt, str(value).encode(), hashlib.sha256).digest()
+        pseudo = int.from_bytes(digest[:6], "big") % 10 ** 12 + 1
+        # Сохраняем знак: отрицательные id - это группы
+        return -pseudo if value < 0 else pseudo
+
+    def scrub(self, data: Any, redact: bool, key: str | None = None) -> Any:
+        if isinstance(data, dict):
+            if key in PERSON_KEYS and isinstance(data.get("id"), int):
+                data = {k: v for k, v in data.items() if k not in PERSON_FIELDS_TO_DROP}
+                data["id"] = self(data["id"])
+                if key not in CHAT_KEYS:
+                    # У User имя обязательно - иначе апдейт не провалидируется
+                    data["first_name"] = "User"
+            return {k: self.scrub(v, redact, k) for k, v in data.items()}
+        if isinstance(data, list):
+            return [self.scrub(item, redact, key) for item in data]
+        if redact and key in TEXT_KEYS and isinstance(data, str):
+            return redact_text(data)
+        return data
+
+
+class UpdateRecorder:
+    """
+    Запись входящих апдейтов в сжатые JSONL-файлы с ротацией
+
+    Запись в файл идёт пачками в отдельном потоке, обработка апдейтов
+    не ждёт диска. Строка файла: {"t": время, "admin": bool, "update": {...}}.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        admin_ids: list[int],
+        redact: bool = False,
+        salt: bytes | None = None,
+        max_bytes: int = 50 * 1024 * 1024,
+        flush_interval: float = 2.0,
+        max_buffer: int = 500
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.admin_ids = set(admin_ids)
+        self.redact = redact
+        self.pseudonymize = Pseudonymizer(salt or os.urandom(16))
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+
+        self._buffer: list[str] = []
+        self._file: gzip.GzipFile | None = None
+        self._path: Path | None = None
+        self._flusher: asyncio.Task | None = None
+        self._write_lock = asyncio.Lock()
+        self.recorded = 0
+
+    def record(self, update: Update) -> None:
+        user = getattr(update.event, "from_user", None)
+        payload = update.model_dump(mode="json", exclude_none=True, by_alias=True)
+        line = json.dumps({
+            "t": time.time(),
+            "admin": bool(user and user.id in self.admin_ids),
+            "update": self.pseudonymize.scrub(payload, self.redact),
+        }, ensure_ascii=False)
+
+        self._buffer.append(line)
+        self.recorded += 1
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+        if len(self._buffer) >= self.max_buffer:
+            asyncio.create_task(self.flush())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        async with self._write_lock:
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                logger.error(f"Error writing update capture: {e}", exc_info=True)
+
+    def _write(self, lines: list[str]) -> None:
+        if self._file is None or (self._path and self._path.stat().st_size >= self.max_bytes):
+            self._rotate()
+        self._file.write(("\n".join(lines) + "\n").encode("utf-8"))
+        self._file.flush()
+
+    def _rotate(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        name = f"updates-{datetime.now():%Y%m%d-%H%M%S-%f}.jsonl.gz"
+        self._path = self.directory / name
+        self._file = gzip.open(self._path, "ab")
+        logger.info(f"Recording updates to {self._path}")
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+        await self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
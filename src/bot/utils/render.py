@@ -0,0 +1,187 @@
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, Message
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def fingerprint(
+    text: str,
+    reply_markup: InlineKeyboardMarkup | None = None,
+    parse_mode: str | None = None
+) -> int:
+    """Отпечаток отрисованного содержимого сообщения"""
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup else ""
+    return hash((text, markup, parse_mode))
+
+
+class MessageRenderer:
+    """
+    Правка сообщений без лишних вызовов API
+
+    Помнит отпечаток (текст, клавиатура) последней отрисовки для каждого
+    (chat_id, message_id) и не вызывает edit_text, если ничего не изменилось.
+    """
+
+    def __init__(self, max_size: int = 10_000):
+        self.max_size = max_size
+        self._rendered: OrderedDict[tuple[int, int], int] = OrderedDict()
+        self.edits = 0
+        self.skipped = 0
+
+    def _remember(self, key: tuple[int, int], value: int) -> None:
+        self._rendered[key] = value
+        self._rendered.move_to_end(key)
+        if len(self._rendered) > self.max_size:
+            self._rendered.popitem(last=False)
+
+    def remember(
+        self,
+        message: Message,
+        text: str,
+        reply_markup: InlineKeyboardMarkup | None = None,
+        parse_mode: str | None = None
+    ) -> None:
+        """Запомнить содержимое только что отправленного сообщения"""
+        self._remember(
+            (message.chat.id, message.message_id),
+            fingerprint(text, reply_markup, parse_mode)
+        )
+
+    def forget(self, message: Message) -> None:
+        self._rendered.pop((message.chat.id, message.message_id), None)
+
+    def clear(self) -> None:
+        self._rendered.clear()
+
+    async def edit_text(
+        self,
+        message: Message,
+        text: str,
+        reply_markup: InlineKeyboardMarkup | None = None,
+        parse_mode: str | None = None
+    ) -> bool:
+        """
+        Отредактировать сообщение, если содержимое изменилось
+
+        Returns:
+            True если был вызов API, False если правка пропущена
+        """
+        key = (message.chat.id, message.message_id)
+        value = fingerprint(text, reply_markup, parse_mode)
+
+        if self._rendered.get(key) == value:
+            self._rendered.move_to_end(key)
+            self.skipped += 1
+            return False
+
+        try:
+            await message.edit_text(
+                text,
+                reply_markup=reply_markup,
+                parse_mode=parse_mode
+            )
+        except TelegramBadRequest as e:
+            if "message is not modified" not in e.message:
+                raise
+            # Содержимое уже такое - запоминаем, чтобы не спрашивать снова
+            self.skipped += 1
+            self._remember(key, value)
+            return False
+
+        self.edits += 1
+        self._remember(key, value)
+        return True
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "edits": self.edits,
+            "skipped": self.skipped,
+            "cached": len(self._rendered),
+        }
+
+
+class RenderCache:
+    """
+    Готовые клавиатуры и тексты страниц для текущей версии каталога
+
+    Всё строится один раз на версию и переиспользуется всеми
+    пользователями; смена версии сбрасывает кеш целиком.
+    """
+
+    def __init__(self, max_size: int = 2048):
+        self.max_size = max_size
+        self.version: int | None = None
+        self._items: OrderedDict[Hashable, object] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, version: int, key: Hashable) -> tuple[bool, object]:
+        if self.version is not None and version < self.version:
+            # Запрос с устаревшей версией - строим без кеша
+            self.misses += 1
+            return False, None
+
+        if version != self.version:
+            self._items.clear()
+            self.version = version
+
+        if key in self._items:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return True, self._items[key]
+
+        self.misses += 1
+        return False, None
+
+    def _store(self, version: int, key: Hashable, value: object) -> None:
+        # Каталог успел измениться, пока строили значение - не кешируем
+        if version != self.version:
+            return
+        self._items[key] = value
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def get_or_build(self, version: int, key: Hashable, build: Callable[[], T]) -> T:
+        found, value = self._lookup(version, key)
+        if found:
+            return value
+        value = build()
+        self._store(version, key, value)
+        return value
+
+    async def get_or_load(
+        self,
+        version: int,
+        key: Hashable,
+        load: Callable[[], Awaitable[T]]
+    ) -> T:
+        """То же, что get_or_build, но для построения через запрос к БД"""
+        found, value = self._lookup(version, key)
+        if found:
+            return value
+        value = await load()
+        self._store(version, key, value)
+        return value
+
+    def clear(self) -> None:
+        self._items.clear()
+        self.version = None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "version": self.version or 0,
+            "items": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+renderer = MessageRenderer()
+render_cache = RenderCache()
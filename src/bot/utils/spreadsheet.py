@@ -0,0 +1,179 @@
+"""Потоковое чтение CSV и XLSX без сторонних библиотек"""
+import csv
+import itertools
+import re
+import zipfile
+from pathlib import Path
+from typing import Iterator
+from xml.etree.ElementTree import iterparse
+
+from src.bot.utils.parse_product import CATEGORIES
+
+
+SUPPORTED_EXTENSIONS = (".csv", ".xlsx")
+# Bot API отдаёт боту файлы до 20 МБ
+MAX_FILE_SIZE = 20 * 1024 * 1024
+# Строк на одну транзакцию
+IMPORT_CHUNK_SIZE = 500
+
+_SNIFF_BYTES = 64 * 1024
+_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_COLUMN = re.compile(r"[A-Z]+")
+
+
+def iter_rows(path: str | Path, filename: str) -> Iterator[list[str]]:
+    """
+    Строки таблицы по одной (значения ячеек - строки)
+
+    Raises:
+        ValueError: неподдерживаемый формат или повреждённый файл
+    """
+    extension = Path(filename).suffix.lower()
+    if extension == ".csv":
+        return iter_csv_rows(path)
+    if extension == ".xlsx":
+        return iter_xlsx_rows(path)
+    raise ValueError(f"Неподдерживаемый формат: {extension or filename}")
+
+
+def is_header_row(row: list[str]) -> bool:
+    """Первая строка таблицы - заголовок: не категория и не число в количестве"""
+    return (
+        row[0].strip().lower() not in CATEGORIES
+        and (len(row) < 4 or not row[3].strip().lstrip("-").isdigit())
+    )
+
+
+def trim_row(row: list[str]) -> list[str]:
+    """Убрать пустые ячейки в конце строки (частый хвост в таблицах)"""
+    end = len(row)
+    while end and not row[end - 1].strip():
+        end -= 1
+    return row[:end]
+
+
+def read_chunk(
+    rows: Iterator[tuple[int, list[str]]], size: int
+) -> list[tuple[int, list[str]]]:
+    """Следующие `size` непустых строк файла с их номерами"""
+    return list(itertools.islice(
+        ((num, trimmed) for num, row in rows if (trimmed := trim_row(row))),
+        size
+    ))
+
+
+# ===== CSV =====
+
+def _detect_encoding(sample: bytes) -> str:
+    # Excel в русской локали сохраняет CSV в cp1251
+    try:
+        sample.decode("utf-8")
+        return "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # Обрезанный на границе символ - всё равно UTF-8
+        if e.start >= len(sample) - 3:
+            return "utf-8-sig"
+        return "cp1251"
+
+
+def iter_csv_rows(path: str | Path) -> Iterator[list[str]]:
+    with open(path, "rb") as f:
+        sample = f.read(_SNIFF_BYTES)
+    encoding = _detect_encoding(sample)
+    text = sample.decode(encoding, errors="ignore")
+
+    try:
+        dialect = csv.Sniffer().sniff(text, delimiters=";,\t|")
+    except csv.Error:
+        dialect = csv.excel
+
+    with open(path, encoding=encoding, newline="") as f:
+        yield from csv.reader(f, dialect)
+
+
+# ===== XLSX =====
+
+def _first_sheet_path(archive: zipfile.ZipFile) -> str:
+    """Путь к первому листу книги (по workbook.xml и его связям)"""
+    try:
+        with archive.open("xl/workbook.xml") as f:
+            sheet = next(
+                el for _, el in iterparse(f) if el.tag == f"{_NS}sheet"
+            )
+        rel_id = sheet.get(f"{_REL_NS}id")
+        with archive.open("xl/_rels/workbook.xml.rels") as f:
+            for _, el in iterparse(f):
+                if el.get("Id") == rel_id:
+                    target = el.get("Target").lstrip("/")
+                    return target if target.startswith("xl/") else f"xl/{target}"
+    except (KeyError, StopIteration):
+        pass
+    return "xl/worksheets/sheet1.xml"
+
+
+def _shared_strings(archive: zipfile.ZipFile) -> list[str]:
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    with archive.open("xl/sharedStrings.xml") as f:
+        for _, el in iterparse(f):
+            if el.tag == f"{_NS}si":
+                # Текст с форматированием разбит на несколько <t>
+                strings.append("".join(t.text or "" for t in el.iter(f"{_NS}t")))
+                el.clear()
+    return strings
+
+
+def _column_index(ref: str | None, default: int) -> int:
+    """'C12' -> 2"""
+    match = _COLUMN.match(ref or "")
+    if not match:
+        return default
+    index = 0
+    for char in match.group():
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+
+def _format_number(value: str) -> str:
+    # Целые числа Excel может хранить как 50.0
+    if value.endswith(".0"):
+        return value[:-2]
+    return value
+
+
+def iter_xlsx_rows(path: str | Path) -> Iterator[list[str]]:
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile as e:
+        raise ValueError("Файл не является XLSX") from e
+
+    with archive:
+        strings = _shared_strings(archive)
+        with archive.open(_first_sheet_path(archive)) as f:
+            row: list[str] = []
+            for event, el in iterparse(f, events=("start", "end")):
+                if event == "start":
+                    if el.tag == f"{_NS}row":
+                        row = []
+                    continue
+
+                if el.tag == f"{_NS}c":
+                    index = _column_index(el.get("r"), len(row))
+                    cell_type = el.get("t")
+                    if cell_type == "inlineStr":
+                        value = "".join(t.text or "" for t in el.iter(f"{_NS}t"))
+                    else:
+                        value = el.findtext(f"{_NS}v") or ""
+                        if cell_type == "s" and value:
+                            value = strings[int(value)]
+                        elif cell_type in (None, "n"):
+                            value = _format_number(value)
+                    # Пустые ячейки в XLSX пропускаются - дополняем строку
+                    row.extend([""] * (index - len(row)))
+                    row.append(value)
+                elif el.tag == f"{_NS}row":
+                    yield row
+                    # Не держим уже прочитанные строки в памяти
+                    el.clear()
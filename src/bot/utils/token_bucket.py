@@ -0,0 +1,53 @@
+import time
+
+
+class TokenBucket:
+    """Token bucket: `rate` токенов в секунду, запас не больше `capacity`"""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def consume(self, tokens: float = 1.0) -> float:
+        """
+        Пытается списать токены.
+
+        Returns:
+            0.0 если токены списаны, иначе сколько секунд подождать
+        """
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+
+        self._refill(now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    def refund(self, tokens: float = 1.0) -> None:
+        """Вернуть списанные, но не использованные токены"""
+        self.tokens = min(self.capacity, self.tokens + tokens)
+
+    def pause(self, seconds: float) -> None:
+        """Заблокировать бакет (например, после 429 от Telegram)"""
+        now = time.monotonic()
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+        self.updated_at = self.blocked_until
+
+    @property
+    def idle(self) -> bool:
+        """Бакет полон и не заблокирован - его можно выбросить"""
+        now = time.monotonic()
+        self._refill(now)
+        return now >= self.blocked_until and self.tokens >= self.capacity
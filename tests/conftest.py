@@ -0,0 +1,104 @@
+"""
+Стенд для тестов: настоящий Dispatcher на локальной базе, без сети
+
+Роутеры - модульные синглтоны и подключаются к Dispatcher один раз,
+поэтому бот, Dispatcher и цикл событий общие на сессию, а база у
+каждого теста своя (копия засеянной).
+"""
+import asyncio
+import itertools
+import os
+import shutil
+from dataclasses import dataclass
+
+import pytest
+from aiogram import Bot
+from aiogram.types import Update
+
+from benchmarks.crud import SCALES, seed_database
+from benchmarks.fake_session import FakeSession
+from benchmarks.load import UpdateFactory
+
+
+ADMIN_ID = 10_000
+CUSTOMER_BASE_ID = 1_000_000
+
+# Конфигурация читается лениво - окружение задаём до первого обращения
+os.environ.update(
+    BOT_TOKEN="42:TEST",
+    ADMIN_IDS=str(ADMIN_ID),
+    QUERY_BUDGET_MODE="strict",
+)
+
+
+@dataclass
+class BotStack:
+    loop: asyncio.AbstractEventLoop
+    bot: Bot
+    dp: object
+    factory: UpdateFactory
+
+
+@pytest.fixture(scope="session")
+def seeded_db(tmp_path_factory) -> str:
+    path = tmp_path_factory.mktemp("seed") / "seed.db"
+    seed_database(str(path), SCALES["tiny"])
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def bot_stack():
+    from src.bot.config import load_config
+    from src.bot.main import create_dispatcher
+
+    config = load_config()
+    loop = asyncio.new_event_loop()
+    bot = Bot(token=config.BOT_TOKEN, session=FakeSession())
+    stack = BotStack(loop, bot, create_dispatcher(config), UpdateFactory(bot))
+    yield stack
+    loop.run_until_complete(bot.session.close())
+    loop.close()
+
+
+class Harness:
+    """Один тест: своя база, общий Dispatcher"""
+
+    _user_ids = itertools.count(CUSTOMER_BASE_ID)
+
+    def __init__(self, stack: BotStack, manager):
+        self.stack = stack
+        self.manager = manager
+        self.updates = stack.factory
+        self.budget = stack.dp["query_budget"]
+
+    def new_user(self) -> int:
+        """Свой пользователь на сценарий: троттлинг и FSM не пересекаются"""
+        return next(self._user_ids)
+
+    def run(self, coro):
+        return self.stack.loop.run_until_complete(coro)
+
+    async def feed(self, update: Update) -> None:
+        """Обработать апдейт; в strict-режиме превышение бюджета - исключение"""
+        await self.stack.dp.feed_update(self.stack.bot, update)
+
+
+@pytest.fixture
+def harness(bot_stack, seeded_db, tmp_path, monkeypatch):
+    from src.bot.main import attach_database, init_database
+    from src.bot.utils.photos import photo_cache
+    from src.bot.utils.render import render_cache
+
+    db_path = tmp_path / "bot.db"
+    shutil.copyfile(seeded_db, db_path)
+    monkeypatch.setenv("DATABASE_PATH", str(db_path))
+
+    render_cache.clear()
+    photo_cache.clear()
+    databases = bot_stack.loop.run_until_complete(init_database())
+    attach_database(bot_stack.dp, *databases)
+    bot_stack.dp["query_budget"].violations.clear()
+
+    yield Harness(bot_stack, databases[0])
+
+    bot_stack.loop.run_until_complete(databases[0].close())
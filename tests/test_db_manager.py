@@ -0,0 +1,45 @@
+"""
+Чтения через менеджер не видят незакоммиченную транзакцию на общем соединении
+"""
+import asyncio
+import shutil
+
+import pytest
+
+from db.crud import ProductsSQL
+from db.manager import AsyncDatabaseManager
+
+
+class Rollback(Exception):
+    pass
+
+
+async def quantities(products: ProductsSQL) -> dict[int, int]:
+    return {product.id: product.quantity for product in await products.get_all()}
+
+
+def test_reads_do_not_see_uncommitted_writes(seeded_db, tmp_path):
+    db_path = tmp_path / "bot.db"
+    shutil.copyfile(seeded_db, db_path)
+
+    async def scenario():
+        manager = AsyncDatabaseManager(str(db_path))
+        await manager.connect()
+        products = ProductsSQL(manager)
+        try:
+            before = await quantities(products)
+            with pytest.raises(Rollback):
+                async with manager.transaction() as db:
+                    await db.execute("UPDATE products SET quantity = quantity + 1000;")
+                    # Параллельный хендлер читает каталог посреди транзакции
+                    during = await quantities(products)
+                    raise Rollback
+            after = await quantities(products)
+        finally:
+            await manager.close()
+        return before, during, after
+
+    before, during, after = asyncio.run(scenario())
+
+    assert during == before
+    assert after == before
@@ -0,0 +1,99 @@
+"""
+Бюджеты запросов к БД на хендлер (@query_budget) под QUERY_BUDGET_MODE=strict
+
+Любое превышение бюджета или повтор одного statement 3+ раз за апдейт
+(N+1) - QueryBudgetExceeded из feed_update, то есть падение теста.
+"""
+import random
+
+from benchmarks.crud import make_batch_text
+from conftest import ADMIN_ID
+from db.profiling import count_queries
+
+
+def browse_updates(harness, user_id: int, category: str, brand_id: int):
+    updates = harness.updates
+    message_id = 777
+    yield updates.message(user_id, "/catalog")
+    for data in (
+        "catalog_all",
+        "catalog_page:2",
+        "catalog_page:3",
+        "catalog_layout:compact:3",
+        "catalog_layout:full:2",
+        "catalog_in_stock",
+        "catalog_page:2",
+        "catalog_categories",
+        f"catalog_cat:{category}",
+        f"catalog_brand:{brand_id}",
+        "catalog_back_to_brands",
+    ):
+        yield updates.callback(user_id, data, message_id)
+
+
+async def any_brand(manager) -> tuple[str, int]:
+    brand = await manager.fetchone(
+        "SELECT b.id, b.category FROM brands b JOIN products p ON p.brand_id = b.id "
+        "WHERE p.quantity > 0 LIMIT 1"
+    )
+    return brand["category"], brand["id"]
+
+
+def test_catalog_browsing_within_budgets(harness):
+    async def scenario():
+        category, brand_id = await any_brand(harness.manager)
+        for update in browse_updates(harness, harness.new_user(), category, brand_id):
+            await harness.feed(update)
+
+    harness.run(scenario())
+
+    handlers = harness.budget.handlers
+    assert harness.budget.violations == []
+    for name in ("show_all_products", "show_in_stock", "handle_pagination", "switch_layout"):
+        assert name in handlers, f"{name} не вызывался"
+
+
+def test_catalog_pages_survive_stock_change_mid_update(harness):
+    """
+    Продажа между выборкой товаров и отрисовкой страницы поднимает версию
+    каталога: страница должна строиться из уже загруженного списка, а не
+    повторять SELECT под новой версией
+    """
+    manager = harness.manager
+
+    def concurrent_sale(event):
+        if event.name.startswith("select_") and event.name.endswith("products_sql"):
+            manager.bump_catalog_version(stock_only=True)
+
+    manager.add_query_hook(concurrent_sale)
+
+    async def scenario():
+        category, brand_id = await any_brand(manager)
+        for update in browse_updates(harness, harness.new_user(), category, brand_id):
+            await harness.feed(update)
+
+    try:
+        harness.run(scenario())
+    finally:
+        manager.remove_query_hook(concurrent_sale)
+
+    assert harness.budget.violations == []
+
+
+def test_batch_intake_does_not_query_per_line(harness):
+    """Пакетная приёмка: число запросов не зависит от числа строк"""
+    text = make_batch_text(300, random.Random(1))
+
+    async def scenario():
+        before = await harness.manager.fetchone("SELECT SUM(quantity) AS total FROM products")
+        await harness.feed(harness.updates.message(ADMIN_ID, "/add_products"))
+        with count_queries() as queries:
+            await harness.feed(harness.updates.message(ADMIN_ID, text))
+        after = await harness.manager.fetchone("SELECT SUM(quantity) AS total FROM products")
+        return queries, after["total"] - before["total"]
+
+    queries, added = harness.run(scenario())
+
+    assert added > 0
+    assert queries.count <= 2, queries.describe()
+    assert harness.budget.violations == []
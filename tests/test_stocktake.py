@@ -0,0 +1,61 @@
+"""
+Инвентаризация целиком: load → diff → apply на менеджере с отдельным
+соединением для чтения (временная таблица пересчёта - на пишущем)
+"""
+import asyncio
+import shutil
+
+from db.crud import StocktakeSQL
+from db.manager import AsyncDatabaseManager
+from src.bot.models.base import ProductCategory, StockCountRow
+
+
+def test_stocktake_load_diff_apply(seeded_db, tmp_path):
+    db_path = tmp_path / "bot.db"
+    shutil.copyfile(seeded_db, db_path)
+    admin_id = 1
+
+    async def scenario():
+        manager = AsyncDatabaseManager(str(db_path))
+        await manager.connect()
+        stocktake = StocktakeSQL(manager)
+        try:
+            counted = await manager.fetchall(
+                "SELECT p.id, p.flavor, p.quantity, b.name AS brand, b.category "
+                "FROM products p JOIN brands b ON b.id = p.brand_id "
+                "ORDER BY p.id LIMIT 2"
+            )
+            rows = [
+                StockCountRow(
+                    ProductCategory(product["category"]),
+                    product["brand"],
+                    product["flavor"],
+                    product["quantity"] + 5
+                )
+                for product in counted
+            ]
+            rows.append(StockCountRow(ProductCategory.snus, "Нет такого", "Вкус", 3))
+
+            assert await stocktake.load(admin_id, rows)
+            diff = await stocktake.diff(admin_id)
+            applied = await stocktake.apply(admin_id, lines=len(rows))
+            after = await manager.fetchall(
+                "SELECT id, quantity FROM products WHERE id IN (:a, :b)",
+                {"a": counted[0]["id"], "b": counted[1]["id"]}
+            )
+        finally:
+            await manager.close()
+        return counted, diff, applied, after
+
+    counted, diff, applied, after = asyncio.run(scenario())
+
+    assert diff is not None
+    lines, missing = diff
+    assert len(lines) == 3
+    assert sum(line["product_id"] is None for line in lines) == 1
+    assert missing["missing"] >= 0
+
+    assert applied is not None
+    assert applied[1] == 2
+    expected = {product["id"]: product["quantity"] + 5 for product in counted}
+    assert {row["id"]: row["quantity"] for row in after} == expected